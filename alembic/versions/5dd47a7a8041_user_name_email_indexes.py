@@ -0,0 +1,50 @@
+"""User name and email unique indexes
+
+Revision ID: 5dd47a7a8041
+Revises: baac6b04cbf5
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5dd47a7a8041'
+down_revision: Union[str, None] = 'baac6b04cbf5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _check_duplicates() -> None:
+    """Уникальный индекс не построится при дублях, сообщаем заранее."""
+    conn = op.get_bind()
+    for column in ('name', 'lower(email)'):
+        duplicates = conn.execute(sa.text(
+            f'SELECT {column} FROM "user" '
+            f'GROUP BY {column} HAVING count(*) > 1 LIMIT 10')).all()
+        if duplicates:
+            raise RuntimeError(
+                f"Дубли в user.{column}, устраните их перед миграцией: "
+                f"{[row[0] for row in duplicates]}")
+
+
+def upgrade() -> None:
+    _check_duplicates()
+    # CREATE INDEX CONCURRENTLY не работает внутри транзакции.
+    with op.get_context().autocommit_block():
+        op.create_index('ix_user_name', 'user', ['name'], unique=True,
+                        postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_user_email_lower', 'user',
+                        [sa.text('lower(email)')], unique=True,
+                        postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_user_email_lower', table_name='user',
+                      postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_user_name', table_name='user',
+                      postgresql_concurrently=True, if_exists=True)
@@ -1,32 +1,56 @@
-from datetime import timedelta
-import json
+import asyncio
+from typing import Optional
+
 import jwt
-import redis
 
 from fastapi import APIRouter
-from fastapi.responses import JSONResponse
-from fastapi import Depends, HTTPException, status
+from fastapi.responses import ORJSONResponse, Response
+from fastapi import Cookie, Depends, HTTPException, Query, status
 from fastapi.security import OAuth2PasswordBearer
 
-import sentry_sdk
-from sentry_sdk.integrations.fastapi import FastApiIntegration
-
+from api import responses
+from api.responses import message_response, respond
+from backend.availability import known_users
 from backend.backend import (Authorization, PasswordRecovery,
                              Registration, is_valid_email)
-from config import (SECRET_KEY, SENTRY_DNS, SESSION_STATE_CODE,
-                    SESSION_STATE_MAIL)
+from config import (AVAILABILITY_RATE_LIMIT_IP,
+                    AVAILABILITY_RATE_LIMIT_ROUTE, COOKIE_SECURE,
+                    SECRET_KEY, SESSION_STATE_CODE, SESSION_STATE_MAIL,
+                    TOKEN_VERIFICATION_MODE)
 from database.FDataBase import select_by_email, select_by_user, update_is_active
 from jwt_tools.jwt import create_jwt_token, decode_jwt_token
+from metrics import metrics
+from metrics.tracing import sentry_messages
 from models.models import (CodeConfirm, PasswordChange,
                            Recover, UserAuth, UserReg)
+from redis_tools import codec
+from redis_tools.codes import codes
+from redis_tools.rate_limit import RateLimiter
+from redis_tools.redis_tools import session_store
+from redis_tools.remember import GrantReused, refresh_tokens, trusted_devices
+from redis_tools.revocation import revocations
+from redis_tools.token_cache import token_cache, token_key
 
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+# Cookie запомненного пользователя (memorize_user).
+REFRESH_COOKIE = "refresh_token"
+DEVICE_COOKIE = "trusted_device"
+
+_refresh_exchanges = metrics.Children(metrics.REFRESH_EXCHANGES)
+_availability_checks = metrics.Children(metrics.AVAILABILITY_CHECKS)
+
 
 async def get_current_user(token: str = Depends(oauth2_scheme)):
     """
     Проверка токена в Redis.
+
+    Проверенные токены кешируются в памяти воркера (token_cache),
+    повторные запросы с тем же токеном не обращаются к Redis.
+    В режиме TOKEN_VERIFICATION_MODE=stateless токен проверяется
+    по подписи и фильтру отозванных jti (revocations), Redis
+    запрашивается только при попадании в фильтр.
     """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -34,26 +58,93 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
         headers={"WWW-Authenticate": "Bearer"},
     )
 
-    if not redis_client.exists(token):
-        raise credentials_exception
+    payload = token_cache.get(token)
+    if payload is not None:
+        return {"login": payload["login"]}
 
     try:
         payload = decode_jwt_token(token, SECRET_KEY)
         login = payload.get("login")
         if login is None:
             raise credentials_exception
-    except jwt.JWTError:
+    except jwt.PyJWTError:
         raise credentials_exception
+    if TOKEN_VERIFICATION_MODE == "stateless":
+        if ("jti" not in payload
+                or await revocations.is_revoked(session_store.client,
+                                                payload["jti"])):
+            raise credentials_exception
+    elif not await session_store.has_session(login, token):
+        raise credentials_exception
+    token_cache.put(token, payload)
     return {"login": login}
 
 
-sentry_sdk.init(
-    dsn=SENTRY_DNS,
-    integrations=[
-        FastApiIntegration(),
-    ],
-    traces_sample_rate=1.0,
-)
+async def revoke_sessions(login: str) -> int:
+    """
+    Отзыв всех сессий пользователя.
+
+    Сессии удаляются из Redis, записи кеша токенов сбрасываются
+    во всех воркерах, а jti попадают в поток отозванных, чтобы токены
+    перестали приниматься и в режиме stateless. Refresh токены
+    пользователя удаляются, чтобы сессии нельзя было продлить.
+
+    Returns:
+
+        int: Число отозванных сессий.
+    """
+    await refresh_tokens.revoke_user(login)
+    revoked = await session_store.revoke_all(login)
+    if revoked:
+        client = session_store.client
+        await token_cache.revoke_keys(
+            client, [session_id for session_id, _, _ in revoked])
+        await revocations.revoke_many(
+            client, [(jti, exp) for _, jti, exp in revoked])
+    return len(revoked)
+
+
+async def open_access(login: str) -> str:
+    """Новый JWT токен и его сессия в индексе сессий пользователя."""
+    token = create_jwt_token(login=login,
+                             token_lifetime_hours=1,
+                             secret_key=SECRET_KEY)
+    claims = decode_jwt_token(token, SECRET_KEY)
+    await session_store.open_session(login, token, claims["jti"],
+                                     claims["exp"])
+    return token
+
+
+def set_cookie(response: Response, name: str, value: str,
+               store, path: str = "/") -> None:
+    """Cookie допуска, недоступная JavaScript, на время жизни store."""
+    response.set_cookie(name, value, max_age=store.ttl, path=path,
+                        secure=COOKIE_SECURE, httponly=True,
+                        samesite="strict")
+
+
+async def authorized(login: str, remember: bool,
+                     trust_device: bool) -> Response:
+    """
+    Ответ об успешном входе с токеном в заголовке Authorization.
+
+    Args:
+
+        login: Имя пользователя в базе.
+        remember: Выдать refresh токен (memorize_user).
+        trust_device: Сделать устройство доверенным (вместе с remember).
+    """
+    token = await open_access(login)
+    response = respond(responses.AUTHORIZED,
+                       headers={"Authorization": f"Bearer {token}"})
+    if remember:
+        set_cookie(response, REFRESH_COOKIE,
+                   await refresh_tokens.issue(login), refresh_tokens)
+        if trust_device:
+            set_cookie(response, DEVICE_COOKIE,
+                       await trusted_devices.issue(login), trusted_devices,
+                       path="/authorization")
+    return response
 
 
 # Роутеры, для формы регистрации
@@ -62,14 +153,15 @@ app_reg = APIRouter(prefix="/registration")
 app_auth = APIRouter(prefix="/authorization")
 # Роутеры для логаута
 app_logout = APIRouter(prefix="/logout")
+# Роутеры активных сессий пользователя
+app_sessions = APIRouter(prefix="/sessions")
+# Роутер метрик Prometheus
+app_metrics = APIRouter(include_in_schema=False)
 
 
-# ПОдключение Redis
-redis_client = redis.Redis(host='localhost', port=6379, db=0)
-
-
-@app_reg.post("/")
-async def registration(data: UserReg) -> JSONResponse:
+@app_reg.post("/", dependencies=[
+    Depends(RateLimiter("registration", ("login", "email")))])
+async def registration(data: UserReg) -> Response:
     """
     Регистрация пользователя.
 
@@ -82,10 +174,11 @@ async def registration(data: UserReg) -> JSONResponse:
 
     Returns:
 
-        JSONResponse: Результат регистрации.
+        Response: Результат регистрации.
 
         - 200: Успешное подтверждение, возвращает сообщение об успехе.
         - 422: Ошибка валидации, возвращает сообщение об ошибке.
+        - 429: Превышен лимит запросов, заголовок Retry-After.
         - Другие коды: Соответствующие сообщения об ошибках и коды статусов.
 
     Notes:
@@ -104,18 +197,16 @@ async def registration(data: UserReg) -> JSONResponse:
             "login": data.login,
             "password": data.password,
         }
-        redis_client.set(result['code'], json.dumps(data_redis))
-        response = JSONResponse(content={"message": "Введите код с почты!"},
-                                status_code=200)
+        await codes.issue("reg", result['code'], codec.dumps(data_redis))
+        response = respond(responses.CODE_SENT)
     else:
-        sentry_sdk.capture_message(result["message"])
-        response = JSONResponse(content={"message": result["message"]},
-                                status_code=result["status_code"])
+        sentry_messages.capture(result["message"])
+        response = message_response(result["message"], result["status_code"])
     return response
 
 
 @app_reg.post("/confirm")
-async def confirm(data: CodeConfirm) -> JSONResponse:
+async def confirm(data: CodeConfirm) -> Response:
     """
     Обработка формы ввода кода подтверждения регистрации.
 
@@ -125,7 +216,7 @@ async def confirm(data: CodeConfirm) -> JSONResponse:
 
     Returns:
 
-        JSONResponse: Результат подтверждения кода.
+        Response: Результат подтверждения кода.
 
         - 200: Успешное подтверждение, возвращает сообщение об успехе.
         - 422: Ошибка валидации, возвращает сообщение об ошибке.
@@ -138,15 +229,13 @@ async def confirm(data: CodeConfirm) -> JSONResponse:
         3. сохраняет пользователя в базу данных.
         * Пароль сохраняется в виде хэша.
         4. Очищает Redis от временных данных.
+
+        * Код действует CODE_TTL_REGISTRATION секунд и только один раз.
     """
-    if not redis_client.exists(data.code):
-        return JSONResponse(
-            content={"message": "Введённый код не верный!"},
-            status_code=400)
-    user_data = redis_client.get(data.code)
-    user_data = json.loads(user_data.decode('utf-8'))
-    if isinstance(user_data, JSONResponse):
-        return user_data
+    user_data = await codes.consume("reg", data.code)
+    if user_data is None:
+        return respond(responses.BAD_CODE, 400)
+    user_data = codec.loads(user_data)
     email = user_data.get('email')
     login = user_data.get('login')
     password = user_data.get('password')
@@ -155,16 +244,66 @@ async def confirm(data: CodeConfirm) -> JSONResponse:
         email, login, password)
 
     if result['status_code'] == 200:
-        redis_client.delete(f"login:{data.code}")
-        return JSONResponse(content={"message": result["message"]},
-                            status_code=200)
+        return message_response(result["message"], 200)
     else:
-        return JSONResponse(content={"message": result["message"]},
-                            status_code=400)
+        return message_response(result["message"], 400)
 
 
-@app_auth.post("/")
-async def authorization(data: UserAuth) -> JSONResponse:
+@app_reg.get("/availability", dependencies=[
+    Depends(RateLimiter("availability",
+                        ip_limit=AVAILABILITY_RATE_LIMIT_IP,
+                        route_limit=AVAILABILITY_RATE_LIMIT_ROUTE))])
+async def availability(login: Optional[str] = None,
+                       email: Optional[str] = None) -> Response:
+    """
+    Проверка, свободны ли логин и почта, до регистрации.
+
+    Args:
+
+        login: Логин.
+        email: Почта.
+
+    Returns:
+
+        Response: {"login": bool, "email": bool} по переданным
+        полям, true - значение свободно.
+        - 200: Результат проверки.
+        - 400: Не передан ни логин, ни почта.
+        - 429: Превышен лимит запросов, заголовок Retry-After.
+
+    Notes:
+
+        * Ответ "свободно" даёт фильтр Блума known_users без
+        обращения к базе, "возможно занято" проверяется индексным
+        запросом (select_by_user, select_by_email).
+        * Проверка не резервирует значение: его могут занять
+        до подтверждения регистрации.
+    """
+    checks = {}
+    if login:
+        checks["login"] = (known_users.may_have_login(login),
+                           select_by_user, login)
+    if email:
+        checks["email"] = (known_users.may_have_email(email),
+                           select_by_email, email)
+    if not checks:
+        return respond(responses.NO_LOGIN_OR_EMAIL, 400)
+    lookups = {field: lookup(value)
+               for field, (maybe, lookup, value) in checks.items() if maybe}
+    found = dict(zip(lookups, await asyncio.gather(*lookups.values())))
+    body = {}
+    for field in checks:
+        source = "database" if field in found else "filter"
+        _availability_checks[field, source].inc()
+        body[field] = found.get(field) is None
+    return ORJSONResponse(body)
+
+
+@app_auth.post("/", dependencies=[
+    Depends(RateLimiter("authorization", ("login",)))])
+async def authorization(data: UserAuth,
+                        trusted_device: Optional[str] = Cookie(None)
+                        ) -> Response:
     """
     Обработчик логики авторизации.
 
@@ -173,12 +312,16 @@ async def authorization(data: UserAuth) -> JSONResponse:
         login: Логин пользователя,
         password: Пароль пользователя,
         memorize_user: Булево значение(запомнить пользователя).
+        trusted_device: Cookie доверенного устройства.
 
     Returns:
 
-        JSONResponse: Результат авторизации.
+        Response: Результат авторизации.
         - 200: Успешная авторизация, возвращает ключ 'key' (login).
+        С доверенного устройства пользователя - сразу токен
+        в заголовке Authorization, как /verification.
         - 422: Ошибка валидации, возвращает сообщение об ошибке.
+        - 429: Превышен лимит запросов, заголовок Retry-After.
         - Другие коды: Соответствующие сообщения об ошибках и коды статусов.
 
     Notes:
@@ -187,26 +330,39 @@ async def authorization(data: UserAuth) -> JSONResponse:
         2. На бэкенде проверяет наличие пользователя в бд,
         отправляет код на почту.
         3. Сохраняет временные данные в Redis.
+
+        * С доверенного устройства код не отправляется: пароль
+        проверяется, и вход завершается сразу.
     """
+    trusted_user = None
+    if trusted_device:
+        trusted_user = await trusted_devices.check(trusted_device)
     result = await Authorization.authorization(data.login,
-                                               data.password)
-    if result['status_code'] == 200:
+                                               data.password,
+                                               trusted_user)
+    if result['status_code'] == 200 and 'code' not in result:
+        metrics.TRUSTED_LOGINS.inc()
+        await update_is_active(result["user"], True)
+        response = await authorized(result["user"], data.memorize_user,
+                                    trust_device=False)
+    elif result['status_code'] == 200:
         data_redis = {
             "code": result['code'],
             "login": data.login,
+            "user": result["user"],
             "remember_user": data.memorize_user
         }
-        redis_client.set(result['code'], json.dumps(data_redis))
-        response = JSONResponse(content={"key": result["login"]},
-                                status_code=200)
+        await codes.issue("auth", result['code'], codec.dumps(data_redis))
+        response = ORJSONResponse(content={"key": result["login"]},
+                                  status_code=200)
     else:
-        response = JSONResponse(content={"message": result["message"]},
-                                status_code=result['status_code'])
+        response = message_response(result["message"],
+                                    result['status_code'])
     return response
 
 
 @app_auth.post("/verification")
-async def verification(data: CodeConfirm) -> JSONResponse:
+async def verification(data: CodeConfirm) -> Response:
     """
     Обработка формы ввода кода подтверждения авторизации.
 
@@ -216,7 +372,7 @@ async def verification(data: CodeConfirm) -> JSONResponse:
 
     Returns:
 
-        JSONResponse: Результат подтверждения кода.
+        Response: Результат подтверждения кода.
         - 200: Успешное подтверждение, возвращает сообщение об успехе.
         - 422: Ошибка валидации, возвращает сообщение об ошибке.
         - Другие коды: Соответствующие сообщения об ошибках и коды статусов.
@@ -226,36 +382,74 @@ async def verification(data: CodeConfirm) -> JSONResponse:
         1. Валидирует данные.
         2. Проверяет код через Redis.
         3. Генерирует JWT токен, добавляет его в заголовок ответа.
-        4. Очищает временные данные в Redis.
-    """
+        4. Открывает сессию токена в индексе сессий пользователя.
+        5. С memorize_user выдаёт cookie refresh_token и trusted_device.
+        6. Очищает временные данные в Redis.
 
-    if not redis_client.exists(data.code):
-        response = JSONResponse(
-            content={"message": "Введённый код не верный!"},
-            status_code=400)
-    user_data = redis_client.get(data.code)
-    user_data = json.loads(user_data.decode('utf-8'))
-    if isinstance(user_data, JSONResponse):
-        return user_data
-    login = user_data.get('login')
-    auth_code = user_data.get('code')
-    token = create_jwt_token(login=login,
-                             token_lifetime_hours=1,
-                             secret_key=SECRET_KEY)
+        * Код действует CODE_TTL_AUTHORIZATION секунд и только один раз.
+    """
+    user_data = await codes.consume("auth", data.code)
+    if user_data is None:
+        return respond(responses.BAD_CODE, 400)
+    user_data = codec.loads(user_data)
+    # Имя из базы, а не введённый логин или почта: по нему
+    # ищутся все сессии пользователя.
+    login = user_data.get('user') or user_data.get('login')
 
     await update_is_active(login, True)
 
-    redis_client.setex(token, timedelta(hours=12), login)
-    headers = {"Authorization": f"Bearer {token}"}
-    response = JSONResponse(content={"message": "Вы авторизированны!"},
-                            headers=headers,
-                            status_code=200)
-    redis_client.delete(f"login:{auth_code}")
+    return await authorized(login, bool(user_data.get('remember_user')),
+                            trust_device=True)
+
+
+@app_auth.post("/refresh")
+async def refresh(refresh_token: Optional[str] = Cookie(None)) -> Response:
+    """
+    Новый JWT токен по refresh токену без пароля и кода с почты.
+
+    Args:
+
+        refresh_token: Cookie, выданная при входе с memorize_user.
+
+    Returns:
+
+        Response: Результат обмена.
+        - 200: Токен в заголовке Authorization и новая cookie
+        refresh_token.
+        - 401: Токен недействителен или уже был использован.
+
+    Notes:
+
+        1. Refresh токен одноразовый: при обмене он заменяется новым.
+        2. Предъявление уже заменённого токена значит, что его копия
+        у кого-то ещё: все сессии и refresh токены пользователя
+        отзываются, и войти можно только заново.
+    """
+    try:
+        rotated = await refresh_tokens.rotate(refresh_token or "")
+    except GrantReused as reused:
+        _refresh_exchanges["reused"].inc()
+        await revoke_sessions(reused.login)
+        response = respond(responses.REFRESH_REUSED, 401)
+        response.delete_cookie(REFRESH_COOKIE)
+        return response
+    if rotated is None:
+        _refresh_exchanges["invalid"].inc()
+        response = respond(responses.REFRESH_INVALID, 401)
+        response.delete_cookie(REFRESH_COOKIE)
+        return response
+    _refresh_exchanges["rotated"].inc()
+    login, new_refresh_token = rotated
+    token = await open_access(login)
+    response = respond(responses.AUTHORIZED,
+                       headers={"Authorization": f"Bearer {token}"})
+    set_cookie(response, REFRESH_COOKIE, new_refresh_token, refresh_tokens)
     return response
 
 
-@app_auth.post("/recover")
-async def recover(data: Recover) -> JSONResponse:
+@app_auth.post("/recover", dependencies=[
+    Depends(RateLimiter("recover", ("user",)))])
+async def recover(data: Recover) -> Response:
     """
     Обработчик логики восстановления (изменения) пароля.
 
@@ -265,10 +459,11 @@ async def recover(data: Recover) -> JSONResponse:
 
     Returns:
 
-        JSONResponse: Результат восстановления пароля.
+        Response: Результат восстановления пароля.
 
         - 200: Успешное подтверждение, возвращает сообщение об успехе.
         - 422: Ошибка валидации, возвращает сообщение об ошибке.
+        - 429: Превышен лимит запросов, заголовок Retry-After.
         - Другие коды: Соответствующие сообщения об ошибках и коды статусов.
 
     Notes:
@@ -276,27 +471,32 @@ async def recover(data: Recover) -> JSONResponse:
         1. Валидирует данные
         2. По введённыи данным находит пользователя и отправляет на почту
         сгенерированный код.
-        3. Сохраняет в Redis временные данные (состояние, код и юзера).
+        3. Сохраняет в Redis временные данные (состояние, код, юзера
+        и его логин).
     """
     result = await PasswordRecovery.recover_pass(data.user)
-    data_redis = {
-        'state': SESSION_STATE_MAIL,
-        'user': data.user
-        }
     if result['status_code'] == 200:
-        redis_client.set(result['code'], json.dumps(data_redis))
-        response = JSONResponse(
+        # user - введённый логин или почта (ключ следующих шагов),
+        # login - имя пользователя в базе для отзыва его сессий.
+        data_redis = {
+            'state': SESSION_STATE_MAIL,
+            'user': data.user,
+            'login': result['user']
+            }
+        await codes.issue("recover", result['code'],
+                          codec.dumps(data_redis))
+        response = ORJSONResponse(
             content={"message": "Теперь введите код с почты...",
                      "user": str(data.user)},
             status_code=200)
     else:
-        response = JSONResponse(content={"message": result["message"]},
-                                status_code=result['status_code'])
+        response = message_response(result["message"],
+                                    result['status_code'])
     return response
 
 
 @app_auth.post("/recover/reset_code")
-async def reset_code(data: CodeConfirm) -> JSONResponse:
+async def reset_code(data: CodeConfirm) -> Response:
     """
     Подтверждение восстановления пароля кодом с почты.
 
@@ -306,7 +506,7 @@ async def reset_code(data: CodeConfirm) -> JSONResponse:
 
     Returns:
 
-        JSONResponse: Результат подтверждения кода.
+        Response: Результат подтверждения кода.
 
         - 200: Успешное подтверждение, возвращает сообщение об успехе.
         - 422: Ошибка валидации, возвращает сообщение об ошибке.
@@ -322,37 +522,29 @@ async def reset_code(data: CodeConfirm) -> JSONResponse:
         этот параметр передаются в теле успешного(код 200) ответа от /recover.
         6. Очищает старые временные данные в Redis.
 
-        * Сессия очищается через 6 минут, если код неверный. Время изменяется
-        в переменных окружения.
+        * Код действует CODE_TTL_RECOVERY секунд и только один раз.
     """
-    if not redis_client.exists(data.code):
-        response = JSONResponse(
-            content={"message": "Введённый код не верный!"},
-            status_code=400)
-    user_data = redis_client.get(data.code)
-    user_data = json.loads(user_data.decode('utf-8'))
-    if isinstance(user_data, JSONResponse):
-        return user_data
+    user_data = await codes.consume("recover", data.code)
+    if user_data is None:
+        return respond(responses.BAD_CODE, 400)
+    user_data = codec.loads(user_data)
     state = user_data.get('state')
     user = user_data.get('user')
 
     if state == SESSION_STATE_MAIL:
         data_redis = {
             "state": SESSION_STATE_CODE,
-            'user': user
+            'user': user,
+            'login': user_data.get('login')
             }
-        redis_client.set(user, json.dumps(data_redis))
-        response = JSONResponse(
-            content={"message": "Можете менять пароль!"}, status_code=200)
-        redis_client.delete(f"login:{data.code}")
-        return response
+        await codes.issue("reset", user, codec.dumps(data_redis))
+        return respond(responses.CHANGE_ALLOWED)
     else:
-        return JSONResponse(content={"message": "Вы не указали почту!"},
-                            status_code=400)
+        return respond(responses.NO_EMAIL, 400)
 
 
 @app_auth.post("/recover/reset_code/change_password")
-async def change_password(data: PasswordChange) -> JSONResponse:
+async def change_password(data: PasswordChange) -> Response:
     """
     Изменение пароля после восстановления.
 
@@ -364,7 +556,7 @@ async def change_password(data: PasswordChange) -> JSONResponse:
 
     Returns:
 
-        JSONResponse: Результат изменения пароля.
+        Response: Результат изменения пароля.
         - 200: Успешное подтверждение, возвращает сообщение об успехе.
         - 422: Ошибка валидации, возвращает сообщение об ошибке.
         - 400: Ошибка состояния сессии, код не введен.
@@ -376,36 +568,39 @@ async def change_password(data: PasswordChange) -> JSONResponse:
         достаёт данные из Redis.
         3. Сверяет идентификатор сессии, с идентификатором из Redis.
         4. Меняет пароль в базе данных(сохраняя его в виде хэша).
-        5. Удаляет временные данные из Redis.
+        5. Отзывает все сессии пользователя, его refresh токены
+        и доверенные устройства.
+        6. Удаляет временные данные из Redis.
 
-        * Сессия очищается через 6 минут, если код неверный. Время изменяется
-        в переменных окружения.
+        * Сессия очищается через CODE_TTL_RESET секунд (6 минут по
+        умолчанию). Время изменяется в переменных окружения.
     """
-    user_data = redis_client.get(data.user)
-    user_data = json.loads(user_data.decode('utf-8'))
-    if isinstance(user_data, JSONResponse):
-        return user_data
+    if data.password != data.password_two:
+        return respond(responses.PASSWORDS_MISMATCH, 400)
+    user_data = await codes.consume("reset", data.user)
+    if user_data is None:
+        return respond(responses.NO_CODE, 400)
+    user_data = codec.loads(user_data)
     state = user_data.get('state')
     user = user_data.get('user')
+    # Сессии и допуски хранятся по имени пользователя, а user может
+    # быть почтой.
+    login = user_data.get('login') or user
 
     if state == SESSION_STATE_CODE:
         result = await PasswordRecovery.new_password(user, data.password,
                                                      data.password_two)
         if result['status_code'] == 200:
-            response = JSONResponse(content={"message": result["message"]},
-                                    status_code=result['status_code'])
-            redis_client.delete(f"login:{user}")
-        else:
-            response = JSONResponse(content={"message": result["message"]},
-                                    status_code=result['status_code'])
-        return response
+            await revoke_sessions(login)
+            await trusted_devices.revoke_user(login)
+        return message_response(result["message"], result['status_code'])
     else:
-        return JSONResponse(content={"message": "Вы не ввели код!"},
-                            status_code=400)
+        return respond(responses.NO_CODE, 400)
 
 
 @app_logout.post("/")
-async def logout(token: str = Depends(oauth2_scheme)) -> JSONResponse:
+async def logout(token: str = Depends(oauth2_scheme),
+                 refresh_token: Optional[str] = Cookie(None)) -> Response:
     """
     Обработчик выхода пользователя.
 
@@ -413,10 +608,11 @@ async def logout(token: str = Depends(oauth2_scheme)) -> JSONResponse:
 
         request (Request): HTTP запрос.
         data (Token): Токен пользователя для выхода.
+        refresh_token: Cookie refresh токена этого устройства.
 
     Returns:
 
-        JSONResponse: Результат выхода пользователя.
+        Response: Результат выхода пользователя.
         - 200: Успешное подтверждение, возвращает сообщение об успехе.
         - 422: Ошибка валидации, возвращает сообщение об ошибке.
         - 400: Ошибка состояния сессии, код не введен.
@@ -424,15 +620,79 @@ async def logout(token: str = Depends(oauth2_scheme)) -> JSONResponse:
     Notes:
 
         1. Получает токен из заголовка Authorization.
-        2. Проверяет его наличие в Redis.
-        3. Удаляет токен из Redis, тем самым отменяя авторизацию пользователя.
+        2. Удаляет сессию токена из Redis (ключ по логину из токена),
+        тем самым отменяя авторизацию пользователя.
+        3. Сообщает всем воркерам об отзыве токена (сброс token_cache)
+        и добавляет jti токена в поток отозванных (revocations).
+        4. Удаляет refresh токен устройства и его cookie.
     """
-    if redis_client.exists(token):
-        redis_client.delete(token)
-        login = decode_jwt_token(token, SECRET_KEY)
+    login = decode_jwt_token(token, SECRET_KEY)
+    if ("login" in login
+            and await session_store.close_session(login["login"], token)):
+        await token_cache.revoke(session_store.client, token)
+        if "jti" in login:
+            await revocations.revoke(session_store.client, login["jti"],
+                                     login["exp"])
         await update_is_active(login['login'], True)
-        return JSONResponse(content={"message": "Успешный выход!"},
-                            status_code=200)
+        response = respond(responses.LOGGED_OUT)
+        if refresh_token:
+            await refresh_tokens.revoke(refresh_token)
+            response.delete_cookie(REFRESH_COOKIE)
+        return response
     else:
-        return JSONResponse(content={"message": "Токен не найден"},
-                            status_code=400)
+        return respond(responses.TOKEN_NOT_FOUND, 400)
+
+
+@app_sessions.get("/")
+async def sessions(cursor: Optional[str] = None,
+                   limit: int = Query(20, ge=1, le=100),
+                   token: str = Depends(oauth2_scheme),
+                   user: dict = Depends(get_current_user)) -> Response:
+    """
+    Список активных сессий пользователя.
+
+    Args:
+
+        cursor: next_cursor из предыдущей страницы.
+        limit: Сессий на странице (до 100).
+
+    Returns:
+
+        Response: {"sessions": [...], "next_cursor": ...}.
+        - 200: Страница сессий: id, время истечения (unix time)
+        и признак текущей сессии; next_cursor равен null
+        на последней странице.
+        - 401: Токен недействителен.
+    """
+    page, next_cursor = await session_store.list_sessions(
+        user["login"], cursor, limit)
+    current = token_key(token)
+    return ORJSONResponse({
+        "sessions": [{"id": session_id, "expires_at": expires_at,
+                      "current": session_id == current}
+                     for session_id, expires_at in page],
+        "next_cursor": next_cursor,
+    })
+
+
+@app_sessions.post("/revoke_all")
+async def revoke_all(user: dict = Depends(get_current_user)) -> Response:
+    """
+    Выход на всех устройствах.
+
+    Сессии и refresh токены отзываются, доверенные устройства
+    остаются: вход с них по-прежнему требует пароль.
+
+    Returns:
+
+        Response: {"revoked": число отозванных сессий}, включая текущую.
+        - 401: Токен недействителен.
+    """
+    return ORJSONResponse({"revoked": await revoke_sessions(user["login"])})
+
+
+@app_metrics.get("/metrics")
+async def prometheus_metrics() -> Response:
+    """Метрики приложения в текстовом формате Prometheus."""
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
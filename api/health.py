@@ -0,0 +1,146 @@
+"""
+Прогрев пулов при старте и проверки живости и готовности.
+
+/health/live  - процесс жив и event loop отвечает.
+/health/ready - прогрев завершён, база и Redis отвечают. В ответе
+                время проверки каждой зависимости; SMTP (только при
+                EMAIL_DELIVERY=inline) и реплики базы проверяются
+                и показываются, но на готовность не влияют.
+"""
+
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict, Tuple
+
+from fastapi import APIRouter, FastAPI
+from fastapi.responses import ORJSONResponse
+from sqlalchemy import text
+
+from backend.smtp_pool import smtp_pool
+from config import (DB_WARMUP_CONNECTIONS, EMAIL_DELIVERY,
+                    HEALTH_CACHE_SECONDS, HEALTH_TIMEOUT,
+                    REDIS_WARMUP_CONNECTIONS, SMTP_PREWARM)
+from database.FDataBase import engine, replicas
+from redis_tools.redis_tools import session_store
+
+
+async def ping_database() -> None:
+    async with engine.connect() as conn:
+        await conn.execute(text("SELECT 1"))
+
+
+async def ping_redis() -> None:
+    await session_store.client.ping()
+
+
+# Имя зависимости -> (проверка, влияет ли на готовность).
+CHECKS: Dict[str, Tuple[Callable[[], Awaitable[None]], bool]] = {
+    "database": (ping_database, True),
+    "redis": (ping_redis, True),
+}
+# С очередью писем SMTP нужен только backend.email_worker.
+if EMAIL_DELIVERY == "inline":
+    CHECKS["smtp"] = (smtp_pool.ping, False)
+# Реплики на готовность не влияют: без них чтение идёт с основной базы.
+CHECKS.update({f"replica_{number}": (replica.ping, False)
+               for number, replica in enumerate(replicas.replicas)})
+
+
+class Readiness:
+    """
+    Готовность воркера принимать запросы.
+
+    Результат проверки зависимостей кешируется на cache_seconds,
+    частые запросы балансировщика не нагружают базу и Redis.
+    """
+
+    def __init__(self, timeout: float, cache_seconds: float) -> None:
+        self.timeout = timeout
+        self.cache_seconds = cache_seconds
+        self.warmed = False
+        self._result: Dict = {}
+        self._checked_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def _probe(self, check: Callable[[], Awaitable[None]]) -> dict:
+        result = {"ok": True}
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(check(), self.timeout)
+        except Exception as ex:
+            result = {"ok": False, "error": f"{type(ex).__name__}: {ex}"}
+        result["latency_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        return result
+
+    async def check(self) -> dict:
+        """Состояние зависимостей: {"ready": ..., "checks": {...}}."""
+        async with self._lock:
+            if (not self._result or time.monotonic() - self._checked_at
+                    >= self.cache_seconds):
+                results = await asyncio.gather(
+                    *(self._probe(check) for check, _ in CHECKS.values()))
+                checks = dict(zip(CHECKS, results))
+                ready = self.warmed and all(
+                    checks[name]["ok"]
+                    for name, (_, required) in CHECKS.items() if required)
+                self._result = {"ready": ready, "warmed": self.warmed,
+                                "checks": checks}
+                self._checked_at = time.monotonic()
+            return self._result
+
+
+readiness = Readiness(HEALTH_TIMEOUT, cache_seconds=HEALTH_CACHE_SECONDS)
+
+
+async def _open(check: Callable[[], Awaitable[None]], count: int) -> None:
+    """count одновременных проверок - столько соединений в пуле."""
+    await asyncio.gather(*(check() for _ in range(count)))
+
+
+async def warm_up(app: FastAPI) -> None:
+    """
+    Прогрев воркера перед приёмом запросов.
+
+    Открывает DB_WARMUP_CONNECTIONS соединений с базой
+    и REDIS_WARMUP_CONNECTIONS с Redis (по SELECT 1 / PING на каждом),
+    SMTP_PREWARM SMTP соединений (при EMAIL_DELIVERY=inline)
+    и строит схему OpenAPI. Ошибки
+    не прерывают старт: воркер поднимается, а /health/ready покажет,
+    какая зависимость недоступна.
+    """
+    steps = {
+        "database": _open(ping_database, DB_WARMUP_CONNECTIONS),
+        "redis": _open(ping_redis, REDIS_WARMUP_CONNECTIONS),
+    }
+    if EMAIL_DELIVERY == "inline":
+        steps["smtp"] = smtp_pool.start(SMTP_PREWARM)
+
+    async def timed_step(name: str, step: Awaitable[None]) -> str:
+        started = time.perf_counter()
+        try:
+            await step
+        except Exception as ex:
+            return f"{name} error ({type(ex).__name__}: {ex})"
+        return f"{name} {(time.perf_counter() - started) * 1000:.1f} ms"
+
+    report = await asyncio.gather(
+        *(timed_step(name, step) for name, step in steps.items()))
+    app.openapi()
+    readiness.warmed = True
+    print(f"Warm-up: {', '.join(report)}")
+
+
+app_health = APIRouter(prefix="/health", include_in_schema=False)
+
+
+@app_health.get("/live")
+async def live() -> ORJSONResponse:
+    """Процесс жив."""
+    return ORJSONResponse({"status": "alive"})
+
+
+@app_health.get("/ready")
+async def ready() -> ORJSONResponse:
+    """Готовность принимать запросы, 503 если не готов."""
+    result = await readiness.check()
+    return ORJSONResponse(result, status_code=200 if result["ready"] else 503)
@@ -0,0 +1,39 @@
+"""Ответы API с телом, сериализованным один раз при импорте."""
+
+from typing import Optional
+
+import orjson
+from fastapi.responses import ORJSONResponse, Response
+
+
+def prepared(message: str) -> bytes:
+    """Тело {"message": ...} в виде готовых байт."""
+    return orjson.dumps({"message": message})
+
+
+CODE_SENT = prepared("Введите код с почты!")
+BAD_CODE = prepared("Введённый код не верный!")
+AUTHORIZED = prepared("Вы авторизированны!")
+CHANGE_ALLOWED = prepared("Можете менять пароль!")
+NO_EMAIL = prepared("Вы не указали почту!")
+NO_CODE = prepared("Вы не ввели код!")
+PASSWORDS_MISMATCH = prepared("Пароли не сопадают!")
+LOGGED_OUT = prepared("Успешный выход!")
+TOKEN_NOT_FOUND = prepared("Токен не найден")
+REFRESH_INVALID = prepared("Refresh токен недействителен")
+NO_LOGIN_OR_EMAIL = prepared("Укажите логин или почту!")
+REFRESH_REUSED = prepared("Refresh токен уже использован, "
+                          "все сессии завершены")
+
+
+def respond(body: bytes, status_code: int = 200,
+            headers: Optional[dict] = None) -> Response:
+    """Ответ с заранее сериализованным телом."""
+    return Response(content=body, status_code=status_code, headers=headers,
+                    media_type="application/json")
+
+
+def message_response(message: str, status_code: int) -> ORJSONResponse:
+    """Ответ {"message": ...} с текстом, известным только во время запроса."""
+    return ORJSONResponse(content={"message": message},
+                          status_code=status_code)
@@ -0,0 +1,152 @@
+"""Фильтр Блума занятых логинов и почт для /registration/availability."""
+
+import asyncio
+import time
+from typing import Optional
+
+from sqlalchemy import select
+
+from config import (AVAILABILITY_CHANNEL, AVAILABILITY_FILTER_CAPACITY,
+                    AVAILABILITY_FILTER_ERROR_RATE,
+                    AVAILABILITY_REBUILD_INTERVAL)
+from database.FDataBase import User, engine
+from redis_tools import codec
+from redis_tools.bloom import BloomFilter
+from redis_tools.redis_tools import SessionStore, session_store
+
+
+class AvailabilityFilter:
+    """
+    Логины и почты существующих пользователей в фильтре Блума.
+
+    Фильтр строится потоковым чтением таблицы user (порциями по batch
+    строк, таблица в памяти не собирается) в фоновой задаче воркера
+    и пересобирается каждые rebuild_interval секунд и при
+    переполнении. Новый пользователь добавляется сразу: воркер,
+    который его создал, публикует логин и почту в канал Redis,
+    остальные добавляют их в свои фильтры. Подписка открывается
+    до сборки, поэтому пользователи, созданные во время чтения
+    таблицы, не теряются.
+
+    "Нет в фильтре" - логин или почта точно свободны, "есть" -
+    проверяется запросом к базе. До первой сборки в базу идёт
+    каждая проверка.
+    """
+
+    def __init__(self, store: SessionStore, capacity: int, error_rate: float,
+                 rebuild_interval: float, channel: str,
+                 batch: int = 5000) -> None:
+        self.store = store
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.rebuild_interval = rebuild_interval
+        self.channel = channel
+        self.batch = batch
+        self.filter = BloomFilter(capacity, error_rate)
+        self.ready = False
+        self._task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def _login_item(login: str) -> str:
+        return f"name:{login}"
+
+    @staticmethod
+    def _email_item(email: str) -> str:
+        return f"email:{email.lower()}"
+
+    def _add(self, bloom: BloomFilter, login: str, email: str) -> None:
+        bloom.add(self._login_item(login))
+        bloom.add(self._email_item(email))
+
+    def may_have_login(self, login: str) -> bool:
+        """False - логин точно свободен."""
+        return not self.ready or self._login_item(login) in self.filter
+
+    def may_have_email(self, email: str) -> bool:
+        """False - почта точно свободна."""
+        return not self.ready or self._email_item(email) in self.filter
+
+    async def added(self, login: str, email: str) -> None:
+        """
+        Учёт нового пользователя во всех воркерах.
+
+        Ошибка публикации не мешает регистрации: остальные воркеры
+        увидят пользователя после пересборки фильтра.
+        """
+        self._add(self.filter, login, email)
+        try:
+            await self.store.client.publish(self.channel,
+                                            codec.dumps([login, email]))
+        except Exception as ex:
+            print(f"Availability publish error: {ex}")
+
+    async def rebuild(self) -> None:
+        """Сборка нового фильтра по таблице пользователей."""
+        bloom = BloomFilter(self.capacity, self.error_rate)
+        async with engine.connect() as conn:
+            result = await conn.stream(
+                select(User.name, User.email)
+                .execution_options(yield_per=self.batch))
+            async for rows in result.partitions():
+                for login, email in rows:
+                    self._add(bloom, login, email)
+        if bloom.saturated:
+            # Следующая пересборка - сразу и с запасом по размеру.
+            self.capacity = bloom.count * 2
+        self.filter = bloom
+        self.ready = True
+
+    async def _follow(self) -> None:
+        pubsub = None
+        rebuilt_at = None
+        try:
+            while True:
+                try:
+                    if pubsub is None:
+                        pubsub = self.store.client.pubsub(
+                            ignore_subscribe_messages=True)
+                        await pubsub.subscribe(self.channel)
+                        # Без подписки могли пропасть новые пользователи.
+                        rebuilt_at = None
+                    if (rebuilt_at is None or self.filter.saturated
+                            or time.monotonic() - rebuilt_at
+                            > self.rebuild_interval):
+                        await self.rebuild()
+                        rebuilt_at = time.monotonic()
+                    message = await pubsub.get_message(timeout=1.0)
+                    if message is not None:
+                        self._add(self.filter,
+                                  *codec.loads(message["data"]))
+                except asyncio.CancelledError:
+                    raise
+                except Exception as ex:
+                    print(f"Availability filter error: {ex}")
+                    if pubsub is not None:
+                        await pubsub.close()
+                        pubsub = None
+                    await asyncio.sleep(1)
+        finally:
+            if pubsub is not None:
+                await pubsub.close()
+
+    def start(self) -> None:
+        """Подписка и сборка фильтра в фоне, старт воркера не ждёт."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._follow())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self) -> dict:
+        return {"ready": self.ready, "filter_items": self.filter.count,
+                "filter_bits": self.filter.size}
+
+
+known_users = AvailabilityFilter(
+    session_store, capacity=AVAILABILITY_FILTER_CAPACITY,
+    error_rate=AVAILABILITY_FILTER_ERROR_RATE,
+    rebuild_interval=AVAILABILITY_REBUILD_INTERVAL,
+    channel=AVAILABILITY_CHANNEL)
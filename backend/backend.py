@@ -1,18 +1,21 @@
 """Моудль backand проекта."""
 
-import ssl
 import re
-import smtplib
 import random
 import string
-from string import Template
-from werkzeug.security import generate_password_hash, check_password_hash
+from typing import Optional
 
+from backend.availability import known_users
+from backend.hasher import HasherBusy, hasher
+from backend.mailer import dispatch_email
+from backend.templates import templates
 from database.FDataBase import (
-    add_user, select_by_email, select_by_user, update_password)
-from config import (
-    WOKR_EMAIL, WOKR_EMAIL_PASS,
-    WOKR_PORT, WORK_HOSTNAME, GENERATION_STRING_LENGTH)
+    add_user, select_by_identifier, update_password)
+from config import GENERATION_STRING_LENGTH
+
+
+# Ответ при переполненной очереди хеширования.
+BUSY = {"message": "Сервис перегружен, попробуйте позже", "status_code": 503}
 
 
 async def generate_random_string(length):
@@ -46,48 +49,24 @@ async def is_valid_email(email) -> bool:
         return False
 
 
-async def send_email(email: str, message: str, context: str):
+async def rehash_password(email: str, password: str) -> None:
     """
-    Функция отправляет пользователю сообщение на почту.
+    Пересчёт устаревшего хеша пароля текущим методом.
 
     Args:
 
-        email (str): Адрес электронной почты получателя.
-        message (str): Текст сообщения для отправки.
-        context (str): Контекст для подстановки в шаблон сообщения.
-
-    Raises:
-
-        smtplib.SMTPRecipientsRefused: Если сервер почты отклонил получателей.
-        smtplib.SMTPServerDisconnected: Если сервер почты отключил соединение.
-        smtplib.SMTPException: Для общих ошибок SMTP.
-        Exception: Возможны другие неуказанные ошибки.
+        email (str): Адрес электронной почты пользователя.
+        password (str): Пароль, только что прошедший проверку.
 
     Notes:
 
-        Функция использует SMTP_SSL для отправки сообщения.
-        Использует предоставленный контекст для SSL.
-        Шаблонизирует сообщение с использованием контекста перед отправкой.
+        Вызывается после успешного входа. Ошибки не мешают авторизации,
+        хеш будет пересчитан при следующем входе.
     """
-    context_ssl = ssl.create_default_context()
     try:
-        with smtplib.SMTP_SSL(WORK_HOSTNAME, WOKR_PORT,
-                              context=context_ssl, timeout=2) as server:
-            server.login(WOKR_EMAIL, WOKR_EMAIL_PASS)
-            message = Template(message).substitute(context)
-            server.sendmail(WOKR_EMAIL, email, message.encode('utf-8'))
-    except smtplib.SMTPRecipientsRefused as ex:
-        print(f"SMTPRecipientsRefused error: {ex}")
-        raise
-    except smtplib.SMTPServerDisconnected as ex:
-        print(f"SMTPServerDisconnected error: {ex}")
-        raise
-    except smtplib.SMTPException as ex:
-        print(f"SMTP error: {ex}")
-        raise
+        await update_password(email, await hasher.hash(password))
     except Exception as ex:
-        print(f"General error: {ex}")
-        raise
+        print(f"Rehash error: {ex}")
 
 
 class Registration:
@@ -126,17 +105,13 @@ class Registration:
             return {"message": "Введённые пароли не совпадают!",
                     "status_code": 400}
         else:
-            user_log = await select_by_user(login)
-            user_mail = await select_by_email(email)
-            if user_log or user_mail:
+            if await select_by_identifier(login, email):
                 return {"message": ("Пользователь с таким логином"
                                     "или почтой, уже существует!"),
                         "status_code": 400}
             code = await generate_random_string(int(GENERATION_STRING_LENGTH))
-            with open('template_message/t_code.txt',
-                      'r', encoding='utf-8') as file:
-                content = file.read()
-            await send_email(email, content, {'code': code})
+            await dispatch_email(email, templates.render(
+                't_code', email, {'code': code}))
             return {"email": email, "login": login,
                     "password": password, "code": code, "status_code": 200}
 
@@ -161,20 +136,25 @@ class Registration:
         Notes:
 
             - Добавляет пользователя в базу данных с захешированным паролем.
+            - Отмечает логин и почту занятыми в фильтре known_users.
         """
         try:
-            await add_user(email, login, generate_password_hash(password))
-            return {"message": "Введенный код верный!", "status_code": 200}
+            await add_user(email, login, await hasher.hash(password))
+        except HasherBusy:
+            return BUSY
         except Exception as ex:
             return {"message": "Ошибка регистрации", "status_code": 400,
                     "error": str(ex)}
+        await known_users.added(login, email)
+        return {"message": "Введенный код верный!", "status_code": 200}
 
 
 class Authorization:
     """Работа с авторизацией на маршрутах POST."""
 
     @staticmethod
-    async def authorization(login: str, password: str) -> dict:
+    async def authorization(login: str, password: str,
+                            trusted_user: Optional[str] = None) -> dict:
         """
         Обработка логики авторизации.
 
@@ -182,12 +162,16 @@ class Authorization:
 
             login (str): Логин или адрес электронной почты пользователя.
             password (str): Пароль пользователя.
+            trusted_user (str): Пользователь доверенного устройства,
+            с которого пришёл запрос.
 
         Returns:
 
             dict: Результат авторизации.
             - "login" (str): Логин пользователя.
-            - "code" (int): Одноразовый четырехзначный код для подтверждения.
+            - "user" (str): Имя пользователя в базе (ключ его сессий).
+            - "code" (int): Одноразовый четырехзначный код для подтверждения,
+            отсутствует при входе с доверенного устройства.
             - "status_code" (int): Код статуса операции.
 
         Notes:
@@ -195,23 +179,31 @@ class Authorization:
             - Проверяет тип введенных данных (логин или email).
             - Проверяет наличие пользователя в базе данных.
             - Проводит аутентификацию по логину и паролю.
-            - Генерирует и отправляет код подтверждения на указанный email.
+            - Пересчитывает устаревший хеш пароля текущим методом.
+            - Генерирует и отправляет код подтверждения на указанный email,
+            если устройство не доверенное для этого пользователя.
         """
-        if await is_valid_email(login):
-            user = await select_by_email(login)
-        else:
-            user = await select_by_user(login)
-        if not user or not check_password_hash(user.password, password):
+        user = await select_by_identifier(login)
+        try:
+            verified = bool(user) and await hasher.verify(user.password,
+                                                          password)
+        except HasherBusy:
+            return BUSY
+        if not verified:
             return {"message": "Неверный логин или пароль!",
                     "status_code": 400}
         else:
+            if hasher.needs_rehash(user.password):
+                await rehash_password(user.email, password)
+            if user.name == trusted_user:
+                return {"login": login, "user": user.name,
+                        "status_code": 200}
             code = await generate_random_string(int(GENERATION_STRING_LENGTH))
             try:
-                with open('template_message/t_pass.txt',
-                          'r', encoding='utf-8') as file:
-                    content = file.read()
-                await send_email(user.email, content, {'code': code})
-                return {"login": login, "code": code, "status_code": 200}
+                await dispatch_email(user.email, templates.render(
+                    't_pass', user.email, {'code': code}))
+                return {"login": login, "user": user.name, "code": code,
+                        "status_code": 200}
             except Exception as ex:
                 return {"message": str(ex), "status_code": 400}
 
@@ -240,10 +232,7 @@ class PasswordRecovery:
             - Проверяет существование пользователя в базе данных.
             - Генерирует и отправляет код подтверждения на указанный email.
         """
-        if await is_valid_email(user):
-            result = await select_by_email(user)
-        else:
-            result = await select_by_user(user)
+        result = await select_by_identifier(user)
         if not result:
             return {"message": "Пользователь не существует!",
                     "status_code": 400}
@@ -251,10 +240,8 @@ class PasswordRecovery:
             try:
                 code = await generate_random_string(
                     int(GENERATION_STRING_LENGTH))
-                with open('template_message/t_recover.txt',
-                          'r', encoding='utf-8') as file:
-                    content = file.read()
-                await send_email(result.email, content, {'code': code})
+                await dispatch_email(result.email, templates.render(
+                    't_recover', result.email, {'code': code}))
                 return {"code": code, "user": result.name, "status_code": 200}
             except Exception as ex:
                 return {"message": str(ex), "status_code": 400}
@@ -287,7 +274,9 @@ class PasswordRecovery:
                     "status_code": 400}
         else:
             try:
-                await update_password(email, generate_password_hash(password))
+                await update_password(email, await hasher.hash(password))
                 return {"message": "Пароль обновлён!", "status_code": 200}
+            except HasherBusy:
+                return BUSY
             except Exception as ex:
                 return {"message": ex, "status_code": 400}
@@ -0,0 +1,169 @@
+"""
+Отправка писем из очереди redis_tools.outbox.
+
+Отдельный процесс, таких процессов может быть несколько:
+
+    python -m backend.email_worker
+    python -m backend.email_worker --consumer mail-1 --batch 32
+
+Воркер читает поток через группу потребителей, отправляет письма
+через пул SMTP соединений и удаляет запись после отправки. Письмо
+с постоянной ошибкой (адрес отклонён, ответ 5xx) сразу уходит
+в поток недоставленных, с временной - повторяется с растущей
+паузой. Метрики Prometheus отдаются на EMAIL_WORKER_METRICS_PORT.
+SIGTERM и SIGINT останавливают воркер после текущей пачки.
+"""
+
+import argparse
+import asyncio
+import os
+import signal
+import socket
+import time
+from typing import List, Optional, Tuple
+
+import aiosmtplib
+
+from backend.mailer import send_email
+from backend.smtp_pool import smtp_pool
+from config import (EMAIL_OUTBOX_MAX_ATTEMPTS, EMAIL_WORKER_BATCH,
+                    EMAIL_WORKER_METRICS_PORT, SMTP_PREWARM)
+from metrics import metrics
+from redis_tools.outbox import EmailOutbox, Entry, entry_age, outbox
+from redis_tools.redis_tools import session_store
+
+
+_results = metrics.Children(metrics.EMAIL_OUTBOX_RESULTS)
+_depth = metrics.Children(metrics.EMAIL_OUTBOX_DEPTH)
+
+
+def is_permanent(ex: Exception) -> bool:
+    """Ошибка, которую повтор не исправит."""
+    if isinstance(ex, aiosmtplib.SMTPRecipientsRefused):
+        return all(refused.code >= 500 for refused in ex.recipients)
+    # Ошибка входа - настройка сервера, а не письма.
+    if isinstance(ex, aiosmtplib.SMTPAuthenticationError):
+        return False
+    if isinstance(ex, aiosmtplib.SMTPResponseException):
+        return ex.code >= 500
+    return isinstance(ex, (KeyError, UnicodeDecodeError))
+
+
+class EmailWorker:
+    """
+    Потребитель очереди писем.
+
+    За один проход забирает записи, пауза повтора которых истекла,
+    и новые записи (чтение ждёт до block_ms, если повторов нет),
+    и отправляет их параллельно: одновременно уходит не больше
+    писем, чем соединений в пуле SMTP.
+    """
+
+    def __init__(self, queue: EmailOutbox, consumer: str, batch: int,
+                 max_attempts: int, block_ms: int = 1000,
+                 report_interval: float = 5) -> None:
+        self.queue = queue
+        self.consumer = consumer
+        self.batch = batch
+        self.max_attempts = max_attempts
+        self.block_ms = block_ms
+        self.report_interval = report_interval
+        self._reported_at = 0.0
+
+    async def deliver(self, entry: Entry, attempt: int) -> Optional[str]:
+        """Отправка одной записи, возвращает sent, retry или dead."""
+        entry_id, fields = entry
+        if not fields:
+            # Запись удалена из потока, пока ждала повтора.
+            await self.queue.ack(entry_id)
+            return None
+        if attempt > self.max_attempts:
+            await self.queue.bury(entry, attempt - 1, "attempts exhausted")
+            return "dead"
+        try:
+            await send_email(fields[b"to"].decode(), fields[b"message"])
+        except Exception as ex:
+            if is_permanent(ex) or attempt >= self.max_attempts:
+                await self.queue.bury(entry, attempt,
+                                      f"{type(ex).__name__}: {ex}")
+                return "dead"
+            return "retry"
+        await self.queue.ack(entry_id)
+        metrics.EMAIL_DELIVERY_LAG.observe(entry_age(entry_id))
+        return "sent"
+
+    async def run_once(self) -> int:
+        """Один проход, возвращает число обработанных записей."""
+        work: List[Tuple[Entry, int]] = await self.queue.claim_due(
+            self.consumer, self.batch)
+        fresh = await self.queue.read(
+            self.consumer, self.batch,
+            None if work else self.block_ms)
+        work += [(entry, 1) for entry in fresh]
+        results = await asyncio.gather(
+            *(self.deliver(entry, attempt) for entry, attempt in work))
+        for result in results:
+            if result is not None:
+                _results[result].inc()
+        return len(work)
+
+    async def report(self) -> None:
+        """Глубина очереди в метрики не чаще report_interval."""
+        if time.monotonic() - self._reported_at < self.report_interval:
+            return
+        self._reported_at = time.monotonic()
+        depth = await self.queue.depth()
+        for queue in ("queued", "pending", "dead"):
+            _depth[queue].set(depth[queue])
+        metrics.EMAIL_OUTBOX_OLDEST_AGE.set(depth["oldest_age"])
+
+    async def run(self, stop: Optional[asyncio.Event] = None) -> None:
+        """Обработка очереди до установки stop."""
+        stop = stop or asyncio.Event()
+        await self.queue.ensure_group()
+        while not stop.is_set():
+            try:
+                await self.run_once()
+                await self.report()
+            except Exception as ex:
+                print(f"Email worker error: {type(ex).__name__}: {ex}")
+                await asyncio.sleep(1)
+
+
+async def serve(args: argparse.Namespace) -> None:
+    await session_store.connect()
+    try:
+        await smtp_pool.start(SMTP_PREWARM)
+    except Exception as ex:
+        print(f"SMTP prewarm error: {ex}")
+    if args.metrics_port:
+        metrics.serve(args.metrics_port)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+    worker = EmailWorker(outbox, args.consumer, args.batch,
+                         EMAIL_OUTBOX_MAX_ATTEMPTS)
+    print(f"Email worker {args.consumer}: {outbox.stream}, "
+          f"group {outbox.group}")
+    try:
+        await worker.run(stop)
+    finally:
+        await smtp_pool.close()
+        await session_store.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--consumer",
+                        default=f"{socket.gethostname()}-{os.getpid()}",
+                        help="имя в группе потребителей")
+    parser.add_argument("--batch", type=int, default=EMAIL_WORKER_BATCH)
+    parser.add_argument("--metrics-port", type=int,
+                        default=EMAIL_WORKER_METRICS_PORT,
+                        help="0 - без сервера метрик")
+    asyncio.run(serve(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
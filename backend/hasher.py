@@ -0,0 +1,141 @@
+"""Хеширование паролей в пуле процессов."""
+
+import asyncio
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Tuple
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from config import HASH_MAX_QUEUE, HASH_TARGET_MS, HASH_WORKERS
+from metrics.metrics import HASH_LATENCY, timed
+from metrics.tracing import traced
+
+
+# Границы подбора параметра N для scrypt (r=8, p=1).
+SCRYPT_MIN_LOG_N = 14
+SCRYPT_MAX_LOG_N = 20
+
+
+class HasherBusy(Exception):
+    """Очередь на хеширование переполнена."""
+
+
+def _hash(password: str, method: str) -> str:
+    return generate_password_hash(password, method=method)
+
+
+def _verify(pwhash: str, password: str) -> bool:
+    return check_password_hash(pwhash, password)
+
+
+def _scrypt_cost(method: str) -> Optional[Tuple[int, int, int]]:
+    """Параметры (N, r, p) метода werkzeug scrypt:N:r:p или None."""
+    name, _, params = method.partition(":")
+    if name != "scrypt":
+        return None
+    try:
+        n, r, p = (int(value) for value in params.split(":"))
+    except ValueError:
+        return None
+    return n, r, p
+
+
+def _calibrate(target_ms: float) -> str:
+    """
+    Подбор стоимости scrypt под целевое время хеширования.
+
+    Возвращает метод с наибольшим N, хеш которым укладывается
+    в target_ms на текущем железе (но не меньше 2**SCRYPT_MIN_LOG_N).
+    """
+    method = f"scrypt:{2 ** SCRYPT_MIN_LOG_N}:8:1"
+    for log_n in range(SCRYPT_MIN_LOG_N, SCRYPT_MAX_LOG_N + 1):
+        candidate = f"scrypt:{2 ** log_n}:8:1"
+        started = time.perf_counter()
+        generate_password_hash("calibration", method=candidate)
+        if (time.perf_counter() - started) * 1000 > target_ms:
+            break
+        method = candidate
+    return method
+
+
+class PasswordHasher:
+    """
+    Хеширование и проверка паролей вне event loop.
+
+    Вычисления выполняются в пуле из workers процессов. Одновременно
+    в работе и в очереди может быть не больше max_queue операций,
+    сверх этого сразу поднимается HasherBusy. Стоимость scrypt
+    подбирается при старте под target_ms. Хеши werkzeug других
+    методов (pbkdf2 и scrypt с меньшей стоимостью) проверяются как
+    раньше, needs_rehash() сообщает, что их пора пересчитать.
+    """
+
+    def __init__(self, workers: int, max_queue: int,
+                 target_ms: float) -> None:
+        self.workers = workers
+        self.max_queue = max_queue
+        self.target_ms = target_ms
+        self.method: Optional[str] = None
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pending = 0
+
+    async def start(self) -> None:
+        """Запуск пула процессов и калибровка стоимости."""
+        if self._executor is not None:
+            return
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"))
+        loop = asyncio.get_running_loop()
+        self.method = await loop.run_in_executor(
+            self._executor, _calibrate, self.target_ms)
+
+    async def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+        self._executor = None
+
+    async def _submit(self, func, *args):
+        if self._executor is None:
+            raise RuntimeError("PasswordHasher не запущен, "
+                               "вызовите start() в lifespan")
+        if self._pending >= self.max_queue:
+            raise HasherBusy("Очередь хеширования переполнена")
+        self._pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, func, *args)
+        finally:
+            self._pending -= 1
+
+    @timed(HASH_LATENCY, "hash")
+    @traced("password.hash")
+    async def hash(self, password: str) -> str:
+        """Хеш пароля текущим (откалиброванным) методом."""
+        return await self._submit(_hash, password, self.method)
+
+    @timed(HASH_LATENCY, "verify")
+    @traced("password.verify")
+    async def verify(self, pwhash: str, password: str) -> bool:
+        """Проверка пароля по хешу любого метода werkzeug."""
+        return await self._submit(_verify, pwhash, password)
+
+    def needs_rehash(self, pwhash: str) -> bool:
+        """
+        True, если хеш получен не scrypt или scrypt слабее текущего.
+
+        Воркеры калибруются каждый на своём железе и могут получить
+        разный N. Хеш с большей стоимостью не пересчитывается, иначе
+        воркеры пересчитывали бы хеши друг друга при каждом входе.
+        """
+        stored = _scrypt_cost(pwhash.split("$", 1)[0])
+        if stored is None:
+            return True
+        current = _scrypt_cost(self.method)
+        return any(have < want for have, want in zip(stored, current))
+
+
+hasher = PasswordHasher(HASH_WORKERS, max_queue=HASH_MAX_QUEUE,
+                        target_ms=HASH_TARGET_MS)
@@ -0,0 +1,82 @@
+"""
+Отправка писем: через пул SMTP или через очередь Redis.
+
+Модуль не импортирует слой базы данных: его использует отдельный
+процесс backend.email_worker, которому Postgres не нужен.
+"""
+
+import time
+
+import aiosmtplib
+
+from backend.smtp_pool import smtp_pool
+from config import EMAIL_DELIVERY, WOKR_EMAIL
+from metrics.metrics import EMAIL_LATENCY, Children
+from metrics.tracing import traced
+from redis_tools.outbox import outbox
+
+
+_email_latency = Children(EMAIL_LATENCY)
+
+
+@traced("smtp.send")
+async def send_email(email: str, message: bytes):
+    """
+    Функция отправляет пользователю сообщение на почту.
+
+    Args:
+
+        email (str): Адрес электронной почты получателя.
+        message (bytes): Готовое письмо (см. backend.templates).
+
+    Raises:
+
+        aiosmtplib.SMTPRecipientsRefused: Если сервер почты отклонил
+        получателей.
+        aiosmtplib.SMTPServerDisconnected: Если сервер почты отключил
+        соединение и переподключиться не удалось.
+        aiosmtplib.SMTPException: Для общих ошибок SMTP.
+        Exception: Возможны другие неуказанные ошибки.
+
+    Notes:
+
+        Письмо отправляется через пул постоянных SMTP соединений
+        (backend.smtp_pool), без нового рукопожатия на каждое письмо.
+        Время отправки пишется в метрику email_send_duration_seconds
+        с результатом: sent, refused, disconnected или error.
+    """
+    result = "error"
+    started = time.perf_counter()
+    try:
+        await smtp_pool.send(WOKR_EMAIL, email, message)
+        result = "sent"
+    except aiosmtplib.SMTPRecipientsRefused as ex:
+        result = "refused"
+        print(f"SMTPRecipientsRefused error: {ex}")
+        raise
+    except aiosmtplib.SMTPServerDisconnected as ex:
+        result = "disconnected"
+        print(f"SMTPServerDisconnected error: {ex}")
+        raise
+    except aiosmtplib.SMTPException as ex:
+        print(f"SMTP error: {ex}")
+        raise
+    except Exception as ex:
+        print(f"General error: {ex}")
+        raise
+    finally:
+        _email_latency[result].observe(time.perf_counter() - started)
+
+
+async def dispatch_email(email: str, message: bytes) -> None:
+    """
+    Отправка письма способом EMAIL_DELIVERY.
+
+    outbox - письмо ставится в очередь Redis и отправляется
+    процессом backend.email_worker, запрос не ждёт SMTP; inline -
+    send_email в рамках запроса.
+    """
+    if EMAIL_DELIVERY == "outbox":
+        await outbox.enqueue(email, message)
+    else:
+        await send_email(email, message)
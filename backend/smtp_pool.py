@@ -0,0 +1,142 @@
+"""Пул постоянных SMTP соединений на aiosmtplib."""
+
+import asyncio
+import ssl
+from typing import List, Optional, Union
+
+import aiosmtplib
+
+from config import (SMTP_POOL_SIZE, SMTP_TIMEOUT, SMTP_USE_TLS,
+                    WOKR_EMAIL, WOKR_EMAIL_PASS, WOKR_PORT, WORK_HOSTNAME)
+
+
+class SMTPPool:
+    """
+    Пул авторизованных SMTP соединений.
+
+    Держит до size открытых соединений (TLS рукопожатие и LOGIN
+    выполняются один раз на соединение) и переиспользует их между
+    письмами. Соединение, разорванное сервером, переоткрывается,
+    отправка повторяется один раз.
+    """
+
+    def __init__(self, hostname: str, port: int,
+                 username: Optional[str], password: Optional[str],
+                 size: int, use_tls: bool, timeout: float) -> None:
+        self.hostname = hostname
+        self.port = port
+        self.username = username
+        self.password = password
+        self.size = size
+        self.use_tls = use_tls
+        self.timeout = timeout
+        self._idle: asyncio.LifoQueue = asyncio.LifoQueue()
+        self._slots = asyncio.Semaphore(size)
+        self._tls_context = ssl.create_default_context() if use_tls else None
+        self._stats = {"connects": 0, "reconnects": 0, "reused": 0,
+                       "sent": 0, "failed": 0, "in_use": 0}
+
+    async def _connect(self) -> aiosmtplib.SMTP:
+        """Открытие нового соединения с авторизацией."""
+        conn = aiosmtplib.SMTP(hostname=self.hostname, port=self.port,
+                               use_tls=self.use_tls,
+                               tls_context=self._tls_context,
+                               timeout=self.timeout)
+        await conn.connect()
+        if self.username:
+            await conn.login(self.username, self.password)
+        self._stats["connects"] += 1
+        return conn
+
+    async def _acquire(self) -> aiosmtplib.SMTP:
+        while not self._idle.empty():
+            conn = self._idle.get_nowait()
+            if conn.is_connected:
+                self._stats["reused"] += 1
+                return conn
+        return await self._connect()
+
+    @staticmethod
+    def _discard(conn: aiosmtplib.SMTP) -> None:
+        if conn.is_connected:
+            conn.close()
+
+    async def start(self, prewarm: int = 0) -> None:
+        """Заблаговременное открытие prewarm соединений параллельно."""
+        results = await asyncio.gather(
+            *(self._connect() for _ in range(min(prewarm, self.size))),
+            return_exceptions=True)
+        errors = [r for r in results if isinstance(r, BaseException)]
+        for conn in results:
+            if not isinstance(conn, BaseException):
+                self._idle.put_nowait(conn)
+        if errors:
+            raise errors[0]
+
+    async def ping(self) -> None:
+        """Проверка сервера командой NOOP через соединение из пула."""
+        async with self._slots:
+            conn = await self._acquire()
+            try:
+                await conn.noop()
+            except Exception:
+                self._discard(conn)
+                raise
+            self._idle.put_nowait(conn)
+
+    async def close(self) -> None:
+        """Корректное закрытие всех простаивающих соединений."""
+        while not self._idle.empty():
+            conn = self._idle.get_nowait()
+            try:
+                await conn.quit()
+            except aiosmtplib.SMTPException:
+                self._discard(conn)
+
+    async def send(self, sender: str, recipients: Union[str, List[str]],
+                   message: bytes) -> None:
+        """
+        Отправка уже сформированного письма через соединение из пула.
+
+        Args:
+
+            sender (str): Адрес отправителя.
+            recipients (str | list): Адрес(а) получателей.
+            message (bytes): Письмо целиком.
+
+        Raises:
+
+            aiosmtplib.SMTPException: Если отправить письмо не удалось.
+        """
+        async with self._slots:
+            self._stats["in_use"] += 1
+            conn = None
+            try:
+                conn = await self._acquire()
+                try:
+                    await conn.sendmail(sender, recipients, message)
+                except aiosmtplib.SMTPServerDisconnected:
+                    self._discard(conn)
+                    self._stats["reconnects"] += 1
+                    conn = await self._connect()
+                    await conn.sendmail(sender, recipients, message)
+            except Exception:
+                self._stats["failed"] += 1
+                if conn is not None:
+                    self._discard(conn)
+                raise
+            else:
+                self._stats["sent"] += 1
+                self._idle.put_nowait(conn)
+            finally:
+                self._stats["in_use"] -= 1
+
+    def stats(self) -> dict:
+        """Счётчики пула: соединения, повторные использования, ошибки."""
+        return {**self._stats, "idle": self._idle.qsize(), "size": self.size}
+
+
+smtp_pool = SMTPPool(WORK_HOSTNAME, int(WOKR_PORT or 465),
+                     username=WOKR_EMAIL, password=WOKR_EMAIL_PASS,
+                     size=SMTP_POOL_SIZE, use_tls=SMTP_USE_TLS,
+                     timeout=SMTP_TIMEOUT)
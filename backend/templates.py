@@ -0,0 +1,157 @@
+"""Реестр заранее скомпилированных шаблонов писем."""
+
+import html
+import os
+import uuid
+from email.header import Header
+from string import Template
+from typing import Dict, List, Optional, Tuple
+
+from config import (TEMPLATES_AUTO_RELOAD, TEMPLATES_DIR,
+                    TEMPLATES_LOCALE, WOKR_EMAIL)
+
+
+# Темы писем по умолчанию. Шаблон может переопределить тему
+# первой строкой вида "Subject: ...".
+SUBJECTS = {
+    "t_code": "Подтверждение регистрации",
+    "t_pass": "Код для входа",
+    "t_recover": "Восстановление пароля",
+    "t_reg": "Регистрация завершена",
+}
+
+
+def _to_crlf(text: str) -> str:
+    return text.replace("\r\n", "\n").replace("\n", "\r\n")
+
+
+def _literal(text: str) -> str:
+    """Экранирование текста, который не должен подставляться."""
+    return text.replace("$", "$$")
+
+
+class CompiledTemplate:
+    """
+    Письмо целиком в виде одного string.Template.
+
+    Заголовки, границы multipart и тела частей собираются один раз,
+    при рендеринге остаётся подстановка значений и кодирование в utf-8.
+    """
+
+    def __init__(self, sender: str, subject: str, text: str,
+                 html_body: Optional[str], sources: List[str]) -> None:
+        self.sources = sources
+        self.mtimes = [os.stat(path).st_mtime for path in sources]
+        subject = _literal(Header(subject, "utf-8").encode(linesep="\r\n"))
+        headers = (f"From: {_literal(sender)}\r\n"
+                   "To: ${__to}\r\n"
+                   f"Subject: {subject}\r\n"
+                   "MIME-Version: 1.0\r\n")
+        part = ("Content-Type: text/{kind}; charset=utf-8\r\n"
+                "Content-Transfer-Encoding: 8bit\r\n\r\n")
+        self.text = Template(headers + part.format(kind="plain")
+                             + _to_crlf(text))
+        self.html = None
+        if html_body is not None:
+            boundary = uuid.uuid4().hex
+            self.text = Template(
+                headers
+                + "Content-Type: multipart/alternative; "
+                f'boundary="{boundary}"\r\n\r\n'
+                f"--{boundary}\r\n" + part.format(kind="plain")
+                + _to_crlf(text) + f"\r\n--{boundary}\r\n"
+                + part.format(kind="html"))
+            self.html = Template(_to_crlf(html_body)
+                                 + f"\r\n--{boundary}--\r\n")
+
+    def is_stale(self) -> bool:
+        return any(os.stat(path).st_mtime != mtime
+                   for path, mtime in zip(self.sources, self.mtimes))
+
+    def render(self, to: str, context: dict) -> bytes:
+        message = self.text.substitute(context, __to=to)
+        if self.html is not None:
+            escaped = {key: html.escape(str(value))
+                       for key, value in context.items()}
+            message += self.html.substitute(escaped)
+        return message.encode("utf-8")
+
+
+class TemplateRegistry:
+    """
+    Загрузка и хранение шаблонов писем из каталога.
+
+    Файлы каталога: <имя>.txt и необязательный <имя>.html для
+    multipart письма, локализованные варианты <имя>.<локаль>.txt /
+    <имя>.<локаль>.html. Файлы без локали относятся к default_locale.
+    С auto_reload шаблон перекомпилируется, если файл изменился.
+    """
+
+    def __init__(self, directory: str, sender: str,
+                 default_locale: str, auto_reload: bool = False) -> None:
+        self.directory = directory
+        self.sender = sender
+        self.default_locale = default_locale
+        self.auto_reload = auto_reload
+        self._compiled: Dict[Tuple[str, str], CompiledTemplate] = {}
+
+    def _read(self, path: str) -> str:
+        with open(path, "r", encoding="utf-8") as file:
+            return file.read()
+
+    def _compile(self, name: str, files: dict) -> CompiledTemplate:
+        text = self._read(files["txt"])
+        subject = SUBJECTS.get(name, "")
+        if text.startswith("Subject:"):
+            first, _, text = text.partition("\n")
+            subject = first[len("Subject:"):].strip()
+        html_body = self._read(files["html"]) if "html" in files else None
+        return CompiledTemplate(self.sender or "", subject, text,
+                                html_body, sources=list(files.values()))
+
+    def load(self) -> None:
+        """Чтение и компиляция всех шаблонов каталога."""
+        found: Dict[Tuple[str, str], dict] = {}
+        for filename in sorted(os.listdir(self.directory)):
+            stem, ext = os.path.splitext(filename)
+            if ext not in (".txt", ".html"):
+                continue
+            name, _, locale = stem.partition(".")
+            key = (name, locale or self.default_locale)
+            found.setdefault(key, {})[ext[1:]] = os.path.join(
+                self.directory, filename)
+        self._compiled = {key: self._compile(key[0], files)
+                          for key, files in found.items() if "txt" in files}
+
+    def render(self, name: str, to: str, context: dict,
+               locale: Optional[str] = None) -> bytes:
+        """
+        Готовое к отправке письмо.
+
+        Args:
+
+            name (str): Имя шаблона (имя файла без расширения).
+            to (str): Адрес получателя.
+            context (dict): Значения для подстановки в шаблон.
+            locale (str): Локаль, при отсутствии варианта - по умолчанию.
+
+        Returns:
+
+            bytes: Письмо с заголовками в utf-8.
+        """
+        if not self._compiled:
+            self.load()
+        key = (name, locale or self.default_locale)
+        if key not in self._compiled:
+            key = (name, self.default_locale)
+        template = self._compiled[key]
+        if self.auto_reload and template.is_stale():
+            files = {os.path.splitext(path)[1][1:]: path
+                     for path in template.sources}
+            template = self._compiled[key] = self._compile(name, files)
+        return template.render(to, context)
+
+
+templates = TemplateRegistry(TEMPLATES_DIR, sender=WOKR_EMAIL,
+                             default_locale=TEMPLATES_LOCALE,
+                             auto_reload=TEMPLATES_AUTO_RELOAD)
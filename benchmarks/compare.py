@@ -0,0 +1,62 @@
+"""
+Сравнение результата benchmarks.e2e с базовой линией.
+
+Регрессией считается падение rps или рост p95/p99 больше порога
+(по умолчанию 10%), а также ошибки, которых не было в базовой линии.
+Код возврата 1, если найдена хотя бы одна регрессия.
+
+    python -m benchmarks.compare baseline.json current.json --threshold 0.1
+"""
+
+import argparse
+import json
+import sys
+
+
+# Метрика -> True, если больше значит лучше.
+METRICS = {"rps": True, "p95_ms": False, "p99_ms": False}
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> list:
+    """Список строк с регрессиями."""
+    regressions = []
+    for flow, levels in baseline["flows"].items():
+        for level, before in levels.items():
+            after = current["flows"].get(flow, {}).get(level)
+            if after is None:
+                continue
+            if after.get("errors", 0) > before.get("errors", 0):
+                regressions.append(
+                    f"{flow}@{level}: errors {before.get('errors', 0)} "
+                    f"-> {after['errors']}")
+            for metric, higher_is_better in METRICS.items():
+                if not before.get(metric) or metric not in after:
+                    continue
+                change = (after[metric] - before[metric]) / before[metric]
+                worse = -change if higher_is_better else change
+                line = (f"{flow}@{level} {metric}: {before[metric]} -> "
+                        f"{after[metric]} ({change:+.1%})")
+                print(("REGRESSION " if worse > threshold else "ok         ")
+                      + line)
+                if worse > threshold:
+                    regressions.append(line)
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=0.10)
+    args = parser.parse_args()
+    with open(args.baseline, encoding="utf-8") as file:
+        baseline = json.load(file)
+    with open(args.current, encoding="utf-8") as file:
+        current = json.load(file)
+    regressions = compare(baseline, current, args.threshold)
+    print(f"\nрегрессий: {len(regressions)}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
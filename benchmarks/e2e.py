@@ -0,0 +1,352 @@
+"""
+Сквозной бенчмарк сценариев API на локальных заглушках.
+
+Поднимает main:app в процессе (httpx ASGITransport) поверх:
+
+    Redis:    fakeredis (по умолчанию) или локальный redis-server
+              (--redis-url redis://localhost:6379/15);
+    база:     SQLite файл (по умолчанию) или локальный Postgres
+              (--database-url postgresql+asyncpg://...);
+    SMTP:     aiosmtpd заглушка из benchmarks.smtp_sink.
+
+Прогоняет сценарии при фиксированных уровнях конкурентности
+и сохраняет результат в JSON:
+
+    registration: /registration/ -> /registration/confirm
+    authorization: /authorization/ -> /authorization/verification
+    recovery: /authorization/recover -> /recover/reset_code
+              -> /recover/reset_code/change_password
+    logout: /logout/
+    remember: /authorization/ (memorize_user) -> /authorization/verification
+    refresh: /authorization/refresh
+    trusted_login: /authorization/ с cookie доверенного устройства
+    availability: /registration/availability (свободный логин
+                  и занятая почта)
+    recovery_by_email: recovery по почте; старые refresh токен
+                  и доверенное устройство должны перестать работать
+
+С --email-delivery outbox письма идут через очередь Redis, в процессе
+бенчмарка работает backend.email_worker; время сценария включает
+доставку письма с кодом.
+
+remember, refresh и trusted_login идут через отдельного клиента
+на пользователя (его "устройство"), чтобы cookie одного пользователя
+не уходили в запросах другого.
+
+Запуск и сравнение с базовой линией:
+
+    python -m benchmarks.e2e --iterations 200 --concurrency 1 10 50 \\
+        --output benchmarks/baselines/current.json
+    python -m benchmarks.compare benchmarks/baselines/main.json \\
+        benchmarks/baselines/current.json
+"""
+
+import argparse
+import asyncio
+import email
+import json
+import os
+import platform
+import re
+import tempfile
+import time
+from datetime import datetime, timezone
+
+
+SMTP_PORT = 8025
+CODE_REGEX = re.compile(r": (\w+)")
+FLOWS = ("registration", "authorization", "recovery", "logout",
+         "remember", "refresh", "trusted_login", "availability",
+         "recovery_by_email")
+
+
+def configure(database_url: str, redis_url: str,
+              email_delivery: str = "inline") -> None:
+    """Окружение приложения до импорта config."""
+    defaults = {
+        "EMAIL_DELIVERY": email_delivery,
+        "DATABASE_URL": database_url,
+        "REDIS_URL": redis_url,
+        "WORK_HOSTNAME": "127.0.0.1",
+        "WOKR_PORT": str(SMTP_PORT),
+        "WOKR_EMAIL": "bench@example.com",
+        "WOKR_EMAIL_PASS": "bench",
+        "SMTP_USE_TLS": "false",
+        "SECRET_KEY": "bench-secret",
+        "SESSION_STATE_MAIL": "bench-state-mail",
+        "SESSION_STATE_CODE": "bench-state-code",
+        "GENERATION_STRING_LENGTH": "15",
+        "RATE_LIMIT_ENABLED": "false",
+        "COOKIE_SECURE": "false",
+        "HASH_TARGET_MS": "5",
+        "SENTRY_DNS": "",
+    }
+    for key, value in defaults.items():
+        os.environ.setdefault(key, value)
+
+
+def percentile(values: list, share: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * share))]
+
+
+class Scenario:
+    """Сценарии API для одного пользователя бенчмарка."""
+
+    def __init__(self, client, sink, transport=None) -> None:
+        self.client = client
+        self.sink = sink
+        self.transport = transport
+        self.devices = []
+
+    async def code_for(self, address: str, timeout: float = 10) -> str:
+        """Код из нового письма address (ожидание доставки из очереди)."""
+        deadline = time.monotonic() + timeout
+        while address not in self.sink.last_by_recipient:
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"no email for {address}")
+            await asyncio.sleep(0.002)
+        message = email.message_from_bytes(
+            self.sink.last_by_recipient.pop(address))
+        part = message.get_payload()[0] if message.is_multipart() else message
+        body = part.get_payload(decode=True).decode("utf-8")
+        return CODE_REGEX.search(body).group(1)
+
+    async def post(self, url: str, body: dict = None,
+                   headers: dict = None, client=None):
+        client = client or self.client
+        response = await client.post(url, json=body, headers=headers)
+        if response.status_code != 200:
+            raise RuntimeError(f"{url}: {response.status_code} "
+                               f"{response.text}")
+        return response
+
+    async def registration(self, user: dict) -> None:
+        await self.post("/registration/", {
+            "email": user["email"], "login": user["login"],
+            "password": user["password"], "password_two": user["password"]})
+        await self.post("/registration/confirm",
+                        {"code": await self.code_for(user["email"])})
+
+    async def authorization(self, user: dict) -> None:
+        await self.post("/authorization/", {
+            "login": user["login"], "password": user["password"]})
+        response = await self.post(
+            "/authorization/verification",
+            {"code": await self.code_for(user["email"])})
+        user["token"] = response.headers["Authorization"]
+
+    async def recovery(self, user: dict,
+                       identifier: str = None) -> None:
+        identifier = identifier or user["login"]
+        await self.post("/authorization/recover", {"user": identifier})
+        await self.post("/authorization/recover/reset_code",
+                        {"code": await self.code_for(user["email"])})
+        await self.post("/authorization/recover/reset_code/change_password",
+                        {"user": identifier, "password": user["password"],
+                         "password_two": user["password"]})
+        # Смена пароля отзывает все сессии пользователя.
+        user.pop("token", None)
+
+    async def logout(self, user: dict) -> None:
+        if "token" not in user:
+            await self.authorization(user)
+        await self.post("/logout/", headers={
+            "Authorization": user.pop("token")})
+
+    def device(self, user: dict):
+        """Клиент со своими cookie для пользователя."""
+        if "device" not in user:
+            user["device"] = type(self.client)(
+                transport=self.transport,
+                base_url=self.client.base_url)
+            self.devices.append(user["device"])
+        return user["device"]
+
+    async def remember(self, user: dict) -> None:
+        device = self.device(user)
+        await self.post("/authorization/", {
+            "login": user["login"], "password": user["password"],
+            "memorize_user": True}, client=device)
+        await self.post("/authorization/verification",
+                        {"code": await self.code_for(user["email"])},
+                        client=device)
+
+    async def refresh(self, user: dict) -> None:
+        await self.post("/authorization/refresh", client=self.device(user))
+
+    async def trusted_login(self, user: dict) -> None:
+        response = await self.post("/authorization/", {
+            "login": user["login"], "password": user["password"]},
+            client=self.device(user))
+        if "Authorization" not in response.headers:
+            raise RuntimeError("trusted device ignored")
+
+    async def availability(self, user: dict) -> None:
+        response = await self.client.get(
+            "/registration/availability",
+            params={"login": user["login"] + "Free",
+                    "email": user["email"]})
+        if response.json() != {"login": True, "email": False}:
+            raise RuntimeError(f"availability: {response.status_code} "
+                               f"{response.text}")
+
+    async def recovery_by_email(self, user: dict) -> None:
+        device = self.device(user)
+        if "refresh_token" not in device.cookies:
+            raise RuntimeError("no refresh token before recovery")
+        await self.recovery(user, user["email"])
+        response = await device.post("/authorization/refresh")
+        if response.status_code != 401:
+            raise RuntimeError(f"refresh after recovery: "
+                               f"{response.status_code}")
+        response = await device.post("/authorization/", json={
+            "login": user["login"], "password": user["password"]})
+        if "Authorization" in response.headers:
+            raise RuntimeError("trusted device survived recovery")
+        # Письмо с кодом входа не нужно, но не должно остаться
+        # для следующих сценариев.
+        await self.code_for(user["email"])
+
+    async def close(self) -> None:
+        for device in self.devices:
+            await device.aclose()
+
+
+async def measure(step, users: list, concurrency: int) -> dict:
+    """Прогон сценария по всем users с заданной конкурентностью."""
+    queue = asyncio.Queue()
+    for user in users:
+        queue.put_nowait(user)
+    latencies, errors = [], 0
+
+    async def worker():
+        nonlocal errors
+        while not queue.empty():
+            user = queue.get_nowait()
+            started = time.perf_counter()
+            try:
+                await step(user)
+            except Exception:
+                errors += 1
+                continue
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    if not latencies:
+        return {"rps": 0.0, "errors": errors}
+    return {
+        "rps": round(len(latencies) / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 0.50), 2),
+        "p95_ms": round(percentile(latencies, 0.95), 2),
+        "p99_ms": round(percentile(latencies, 0.99), 2),
+        "errors": errors,
+    }
+
+
+async def drain_outbox(stop: asyncio.Event) -> None:
+    """Воркер очереди писем в процессе бенчмарка."""
+    from backend.email_worker import EmailWorker
+    from redis_tools.outbox import outbox
+
+    await outbox.ensure_group()
+    worker = EmailWorker(outbox, "bench", batch=64, max_attempts=3)
+    while not stop.is_set():
+        # Чтение без блокировки: блокирующий XREADGROUP fakeredis
+        # теряет записи, которые уже есть в потоке.
+        fresh = await outbox.read("bench", 64, None)
+        await asyncio.gather(*(worker.deliver(entry, 1) for entry in fresh))
+        if not fresh:
+            await asyncio.sleep(0.002)
+
+
+async def run(iterations: int, levels: list, use_fakeredis: bool,
+              outbox: bool = False) -> dict:
+    import httpx
+
+    from benchmarks.smtp_sink import start_sink
+    from database.FDataBase import create_tables, engine
+    from main import app
+    from redis_tools.redis_tools import TimedRedis, session_store
+
+    if use_fakeredis:
+        from fakeredis import aioredis as fake_aioredis
+        pool = fake_aioredis.FakeRedis().connection_pool
+        await session_store.connect(TimedRedis(connection_pool=pool))
+
+    sink = start_sink(port=SMTP_PORT)
+    await create_tables()
+    results = {flow: {} for flow in FLOWS}
+    stop = asyncio.Event()
+    try:
+        async with app.router.lifespan_context(app):
+            if outbox:
+                drain = asyncio.create_task(drain_outbox(stop))
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport,
+                                         base_url="http://bench") as client:
+                scenario = Scenario(client, sink.handler, transport)
+                for level in levels:
+                    users = [{"login": f"Bench{level}x{i:06d}",
+                              "email": f"bench{level}x{i}@example.com",
+                              "password": "Bench_pass1"}
+                             for i in range(iterations)]
+                    for flow in FLOWS:
+                        results[flow][str(level)] = await measure(
+                            getattr(scenario, flow), users, level)
+                await scenario.close()
+            stop.set()
+            if outbox:
+                await drain
+    finally:
+        sink.stop()
+        await engine.dispose()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--iterations", type=int, default=200,
+                        help="пользователей на уровень конкурентности")
+    parser.add_argument("--concurrency", type=int, nargs="+",
+                        default=[1, 10, 50])
+    parser.add_argument("--redis-url",
+                        help="локальный Redis вместо fakeredis")
+    parser.add_argument("--database-url",
+                        help="URL базы вместо временного SQLite файла")
+    parser.add_argument("--email-delivery", choices=["inline", "outbox"],
+                        default="inline")
+    parser.add_argument("--output", help="файл для JSON результата")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="auth-bench-")
+    database_url = (args.database_url
+                    or f"sqlite+aiosqlite:///{workdir}/bench.db")
+    configure(database_url, args.redis_url or "redis://localhost:6379/15",
+              args.email_delivery)
+    flows = asyncio.run(run(args.iterations, args.concurrency,
+                            use_fakeredis=args.redis_url is None,
+                            outbox=args.email_delivery == "outbox"))
+    result = {
+        "meta": {
+            "created": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "iterations": args.iterations,
+            "redis": args.redis_url or "fakeredis",
+            "database": database_url.split("://")[0],
+            "email_delivery": args.email_delivery,
+        },
+        "flows": flows,
+    }
+    text = json.dumps(result, indent=2, ensure_ascii=False)
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as file:
+            file.write(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
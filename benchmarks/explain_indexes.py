@@ -0,0 +1,72 @@
+"""
+Проверка плана запроса select_by_identifier на миллионе пользователей.
+
+В одной транзакции наполняет таблицу "user" (по умолчанию 1 000 000
+строк через generate_series), выполняет ANALYZE и EXPLAIN ANALYZE
+для поиска по логину, по почте в другом регистре и для проверки
+регистрации (логин или почта), после чего откатывает транзакцию.
+Завершается с ошибкой, если в плане есть Seq Scan по "user".
+
+Требует применённой миграции 5dd47a7a8041:
+
+    alembic upgrade head
+    python -m benchmarks.explain_indexes --rows 1000000
+"""
+
+import argparse
+import asyncio
+import sys
+
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql
+
+from database.FDataBase import engine, identifier_query
+
+
+SEED = text("""
+    INSERT INTO "user" (name, password, email, role_id)
+    SELECT 'Bench' || g, 'x', 'Bench' || g || '@example.com', 1
+    FROM generate_series(1, :rows) AS g
+""")
+
+
+def explain(statement) -> str:
+    sql = statement.compile(dialect=postgresql.dialect(),
+                            compile_kwargs={"literal_binds": True})
+    return f"EXPLAIN (ANALYZE, COSTS OFF) {sql}"
+
+
+async def main(rows: int) -> int:
+    probe = rows // 2
+    cases = {
+        "login": identifier_query(f"Bench{probe}"),
+        "email_case_insensitive": identifier_query(
+            f"BENCH{probe}@EXAMPLE.COM"),
+        "registration_check": identifier_query(
+            f"Bench{probe}", f"new{probe}@example.com"),
+    }
+    failed = False
+    async with engine.connect() as conn:
+        transaction = await conn.begin()
+        try:
+            await conn.execute(SEED, {"rows": rows})
+            await conn.execute(text('ANALYZE "user"'))
+            for name, statement in cases.items():
+                plan = "\n".join(
+                    row[0] for row in await conn.execute(
+                        text(explain(statement))))
+                seq_scan = "Seq Scan" in plan
+                failed = failed or seq_scan
+                print(f"== {name}: {'SEQ SCAN' if seq_scan else 'index'}")
+                print(plan)
+        finally:
+            await transaction.rollback()
+    await engine.dispose()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main(args.rows)))
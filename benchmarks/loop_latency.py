@@ -0,0 +1,119 @@
+"""
+Задержка event loop при конкурентной нагрузке на /authorization/verification.
+
+Сравнивает два варианта работы с Redis внутри обработчика:
+
+    before: синхронный redis.Redis (как было в api/api.py);
+    after:  общий асинхронный SessionStore из redis_tools.
+
+Обработчик воспроизводится по обращениям к Redis (exists, get,
+setex, delete), параллельно фоновая задача измеряет, насколько
+позже запланированного просыпается event loop.
+
+Запуск (нужен локальный Redis):
+
+    python -m benchmarks.loop_latency --requests 5000 --concurrency 100
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+import uuid
+from datetime import timedelta
+
+import redis
+
+from config import REDIS_URL
+from redis_tools.redis_tools import SessionStore
+
+
+TICK = 0.001
+
+
+async def monitor_lag(samples: list, stop: asyncio.Event) -> None:
+    """Замер отставания event loop от запланированного пробуждения."""
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(TICK)
+        samples.append(time.perf_counter() - started - TICK)
+
+
+async def verification_sync(client: redis.Redis, code: str) -> None:
+    if not client.exists(code):
+        return
+    client.get(code)
+    client.setex(f"token:{code}", timedelta(hours=12), "login")
+    client.delete(code)
+
+
+async def verification_async(store: SessionStore, code: str) -> None:
+    if not await store.exists(code):
+        return
+    await store.get(code)
+    await store.setex(f"token:{code}", timedelta(hours=12), "login")
+    await store.delete(code)
+
+
+async def run(handler, client, seed, requests: int,
+              concurrency: int) -> dict:
+    codes = [f"bench:{uuid.uuid4().hex}" for _ in range(requests)]
+    await seed(codes)
+    queue = asyncio.Queue()
+    for code in codes:
+        queue.put_nowait(code)
+
+    async def worker():
+        while not queue.empty():
+            await handler(client, queue.get_nowait())
+
+    samples, stop = [], asyncio.Event()
+    monitor = asyncio.create_task(monitor_lag(samples, stop))
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await monitor
+    samples.sort()
+    return {
+        "rps": round(requests / elapsed, 1),
+        "lag_p50_ms": round(statistics.median(samples) * 1000, 3),
+        "lag_p99_ms": round(samples[int(len(samples) * 0.99)] * 1000, 3),
+        "lag_max_ms": round(samples[-1] * 1000, 3),
+        "lag_samples": len(samples),
+    }
+
+
+async def main(requests: int, concurrency: int) -> None:
+    sync_client = redis.Redis.from_url(REDIS_URL)
+
+    async def seed_sync(codes):
+        sync_client.mset({code: "{}" for code in codes})
+
+    store = SessionStore(REDIS_URL, max_connections=concurrency,
+                         pool_timeout=5, socket_timeout=2)
+    await store.connect()
+
+    async def seed_async(codes):
+        await store.client.mset({code: "{}" for code in codes})
+
+    try:
+        result = {
+            "before": await run(verification_sync, sync_client, seed_sync,
+                                requests, concurrency),
+            "after": await run(verification_async, store, seed_async,
+                               requests, concurrency),
+        }
+    finally:
+        await store.close()
+        sync_client.close()
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.concurrency))
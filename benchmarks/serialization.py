@@ -0,0 +1,62 @@
+"""
+Стоимость сериализации на запрос: json + JSONResponse против orjson.
+
+Сравнивает для типичного обработчика:
+
+    redis_payload: запись и чтение данных сессии
+        (json.dumps/json.loads + decode против redis_tools.codec);
+    response: тело ответа
+        (JSONResponse, ORJSONResponse и заранее сериализованное тело
+        из api.responses).
+
+Запуск:
+
+    python -m benchmarks.serialization --number 100000
+"""
+
+import argparse
+import json
+import timeit
+
+from fastapi.responses import JSONResponse, ORJSONResponse
+
+from api import responses
+from redis_tools import codec
+
+
+PAYLOAD = {"email": "user@example.com", "login": "UserLogin1",
+           "password": "Password1"}
+MESSAGE = "Введённый код не верный!"
+
+
+def stdlib_payload():
+    raw = json.dumps(PAYLOAD).encode("utf-8")
+    return json.loads(raw.decode("utf-8"))
+
+
+def orjson_payload():
+    return codec.loads(codec.dumps(PAYLOAD))
+
+
+CASES = {
+    "redis_payload/json": stdlib_payload,
+    "redis_payload/orjson": orjson_payload,
+    "response/JSONResponse": lambda: JSONResponse(
+        content={"message": MESSAGE}, status_code=400),
+    "response/ORJSONResponse": lambda: ORJSONResponse(
+        content={"message": MESSAGE}, status_code=400),
+    "response/prepared": lambda: responses.respond(responses.BAD_CODE, 400),
+}
+
+
+def main(number: int) -> None:
+    for name, case in CASES.items():
+        seconds = min(timeit.repeat(case, number=number, repeat=5))
+        print(f"{name:28} {seconds / number * 1e6:8.2f} мкс/вызов")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--number", type=int, default=100000)
+    args = parser.parse_args()
+    main(args.number)
@@ -0,0 +1,63 @@
+"""
+Локальный SMTP сервер-заглушка на aiosmtpd.
+
+Принимает любые письма (и любой LOGIN без TLS), считает их
+и хранит последние полученные, ничего никуда не отправляя.
+
+Запуск отдельно:
+
+    python -m benchmarks.smtp_sink --port 8025
+
+Для приложения: WORK_HOSTNAME=127.0.0.1 WOKR_PORT=8025 SMTP_USE_TLS=false
+"""
+
+import argparse
+import time
+from collections import deque
+
+from aiosmtpd.controller import Controller
+from aiosmtpd.smtp import AuthResult
+
+
+class SinkHandler:
+    """Обработчик, складывающий письма в память."""
+
+    def __init__(self, keep: int = 1000) -> None:
+        self.received = 0
+        self.messages = deque(maxlen=keep)
+        self.last_by_recipient = {}
+
+    async def handle_DATA(self, server, session, envelope):
+        self.received += 1
+        self.messages.append((envelope.rcpt_tos, envelope.content))
+        for rcpt in envelope.rcpt_tos:
+            self.last_by_recipient[rcpt] = envelope.content
+        return "250 OK"
+
+
+def accept_any(server, session, envelope, mechanism, auth_data):
+    return AuthResult(success=True)
+
+
+def start_sink(host: str = "127.0.0.1", port: int = 8025) -> Controller:
+    """Запуск заглушки в отдельном потоке, возвращает Controller."""
+    controller = Controller(SinkHandler(), hostname=host, port=port,
+                            authenticator=accept_any,
+                            auth_require_tls=False)
+    controller.start()
+    return controller
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8025)
+    args = parser.parse_args()
+    sink = start_sink(args.host, args.port)
+    print(f"SMTP sink слушает {args.host}:{args.port}")
+    try:
+        while True:
+            time.sleep(5)
+            print(f"получено писем: {sink.handler.received}")
+    except KeyboardInterrupt:
+        sink.stop()
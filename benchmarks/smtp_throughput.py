@@ -0,0 +1,77 @@
+"""
+Пропускная способность отправки писем: пул против соединения на письмо.
+
+Поднимает локальную заглушку (benchmarks.smtp_sink) и отправляет
+одинаковые письма двумя способами:
+
+    per_message: новое соединение и LOGIN на каждое письмо (как было);
+    pool:        backend.smtp_pool.SMTPPool с постоянными соединениями.
+
+Запуск:
+
+    python -m benchmarks.smtp_throughput --messages 2000 --concurrency 20
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+import aiosmtplib
+
+from backend.smtp_pool import SMTPPool
+from benchmarks.smtp_sink import start_sink
+
+
+MESSAGE = ("Subject: bench\r\n\r\n"
+           "Введите этот код в поле на сайте: 0000\r\n").encode("utf-8")
+
+
+async def run(send, messages: int, concurrency: int) -> dict:
+    slots = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with slots:
+            await send(f"user{i}@example.com")
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(messages)))
+    elapsed = time.perf_counter() - started
+    return {"messages_per_s": round(messages / elapsed, 1),
+            "elapsed_s": round(elapsed, 3)}
+
+
+async def main(host: str, port: int, messages: int,
+               concurrency: int) -> None:
+    async def per_message(rcpt):
+        conn = aiosmtplib.SMTP(hostname=host, port=port, use_tls=False)
+        await conn.connect()
+        await conn.login("bench", "bench")
+        await conn.sendmail("bench@example.com", rcpt, MESSAGE)
+        await conn.quit()
+
+    pool = SMTPPool(host, port, username="bench", password="bench",
+                    size=concurrency, use_tls=False, timeout=5)
+
+    async def pooled(rcpt):
+        await pool.send("bench@example.com", rcpt, MESSAGE)
+
+    result = {"per_message": await run(per_message, messages, concurrency),
+              "pool": await run(pooled, messages, concurrency)}
+    result["pool_stats"] = pool.stats()
+    await pool.close()
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--port", type=int, default=8025)
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    args = parser.parse_args()
+    sink = start_sink(port=args.port)
+    try:
+        asyncio.run(main("127.0.0.1", args.port, args.messages,
+                         args.concurrency))
+    finally:
+        sink.stop()
@@ -9,8 +9,93 @@ load_dotenv()
 SECRET_KEY = os.environ.get("SECRET_KEY")
 ALGORITHM = os.environ.get("ALGORITHM")
 GENERATION_STRING_LENGTH = os.environ.get("GENERATION_STRING_LENGTH")
-REDIS_URL = os.environ.get("REDIS_URL")
+REDIS_URL = os.environ.get("REDIS_URL", "redis://localhost:6379/0")
+REDIS_MAX_CONNECTIONS = int(os.environ.get("REDIS_MAX_CONNECTIONS", 50))
+REDIS_POOL_TIMEOUT = float(os.environ.get("REDIS_POOL_TIMEOUT", 5))
+REDIS_SOCKET_TIMEOUT = float(os.environ.get("REDIS_SOCKET_TIMEOUT", 2))
+# Топология Redis: single (REDIS_URL), sentinel или cluster. Пароль
+# и номер базы в режимах sentinel и cluster берутся из REDIS_URL.
+REDIS_MODE = os.environ.get("REDIS_MODE", "single")
+# Sentinel: адреса host:port через запятую и имя отслеживаемого мастера.
+REDIS_SENTINELS = [node.strip() for node in
+                   os.environ.get("REDIS_SENTINELS", "").split(",")
+                   if node.strip()]
+REDIS_SENTINEL_MASTER = os.environ.get("REDIS_SENTINEL_MASTER", "mymaster")
+# Cluster: стартовые узлы host:port через запятую (по умолчанию
+# хост из REDIS_URL), остальные узлы клиент узнаёт сам.
+REDIS_CLUSTER_NODES = [node.strip() for node in
+                       os.environ.get("REDIS_CLUSTER_NODES", "").split(",")
+                       if node.strip()]
+
+# Ограничение частоты запросов к входу, регистрации и восстановлению:
+# бюджеты на IP, на логин/почту и на маршрут за окно в секундах.
+RATE_LIMIT_ENABLED = (
+    os.environ.get("RATE_LIMIT_ENABLED", "true").lower() == "true")
+RATE_LIMIT_WINDOW = float(os.environ.get("RATE_LIMIT_WINDOW", 60))
+RATE_LIMIT_IP = int(os.environ.get("RATE_LIMIT_IP", 20))
+RATE_LIMIT_TARGET = int(os.environ.get("RATE_LIMIT_TARGET", 5))
+RATE_LIMIT_ROUTE = int(os.environ.get("RATE_LIMIT_ROUTE", 1000))
+# Брать IP клиента из X-Forwarded-For (только за доверенным прокси).
+RATE_LIMIT_TRUST_PROXY = (
+    os.environ.get("RATE_LIMIT_TRUST_PROXY", "false").lower() == "true")
+
+# Время жизни одноразовых кодов и состояний, в секундах.
+CODE_TTL_REGISTRATION = int(os.environ.get("CODE_TTL_REGISTRATION", 600))
+CODE_TTL_AUTHORIZATION = int(os.environ.get("CODE_TTL_AUTHORIZATION", 300))
+CODE_TTL_RECOVERY = int(os.environ.get("CODE_TTL_RECOVERY", 600))
+CODE_TTL_RESET = int(os.environ.get("CODE_TTL_RESET", 360))
+
+# Кеш проверенных токенов в памяти воркера.
+TOKEN_CACHE_SIZE = int(os.environ.get("TOKEN_CACHE_SIZE", 10000))
+TOKEN_CACHE_TTL = float(os.environ.get("TOKEN_CACHE_TTL", 60))
+TOKEN_CACHE_CHANNEL = os.environ.get("TOKEN_CACHE_CHANNEL",
+                                     "auth:token-revoked")
+
+# Проверка токенов: "redis" - по ключу токена в Redis,
+# "stateless" - локально по подписи и фильтру отозванных jti.
+TOKEN_VERIFICATION_MODE = os.environ.get("TOKEN_VERIFICATION_MODE", "redis")
+REVOCATION_STREAM = os.environ.get("REVOCATION_STREAM", "auth:revocations")
+REVOCATION_STREAM_MAXLEN = int(
+    os.environ.get("REVOCATION_STREAM_MAXLEN", 100000))
+REVOCATION_FILTER_CAPACITY = int(
+    os.environ.get("REVOCATION_FILTER_CAPACITY", 100000))
+REVOCATION_FILTER_ERROR_RATE = float(
+    os.environ.get("REVOCATION_FILTER_ERROR_RATE", 0.001))
+REVOCATION_REBUILD_INTERVAL = float(
+    os.environ.get("REVOCATION_REBUILD_INTERVAL", 600))
+# memorize_user: refresh токен (cookie refresh_token) и доверенное
+# устройство (cookie trusted_device, вход без кода с почты). Время
+# жизни в днях продлевается при каждом обмене refresh токена.
+REFRESH_TOKEN_TTL_DAYS = int(os.environ.get("REFRESH_TOKEN_TTL_DAYS", 30))
+TRUSTED_DEVICE_TTL_DAYS = int(os.environ.get("TRUSTED_DEVICE_TTL_DAYS", 30))
+# Cookie только по HTTPS (false - для локальной разработки по HTTP).
+COOKIE_SECURE = os.environ.get("COOKIE_SECURE", "true").lower() == "true"
+# /registration/availability: фильтр Блума логинов и почт (по два
+# элемента на пользователя) в каждом воркере, пересборка по таблице
+# раз в AVAILABILITY_REBUILD_INTERVAL секунд, новые пользователи
+# приходят через канал AVAILABILITY_CHANNEL.
+AVAILABILITY_FILTER_CAPACITY = int(
+    os.environ.get("AVAILABILITY_FILTER_CAPACITY", 2000000))
+AVAILABILITY_FILTER_ERROR_RATE = float(
+    os.environ.get("AVAILABILITY_FILTER_ERROR_RATE", 0.01))
+AVAILABILITY_REBUILD_INTERVAL = float(
+    os.environ.get("AVAILABILITY_REBUILD_INTERVAL", 3600))
+AVAILABILITY_CHANNEL = os.environ.get("AVAILABILITY_CHANNEL",
+                                      "auth:user-added")
+# Проверок доступности с одного IP и всего за окно RATE_LIMIT_WINDOW.
+AVAILABILITY_RATE_LIMIT_IP = int(
+    os.environ.get("AVAILABILITY_RATE_LIMIT_IP", 60))
+AVAILABILITY_RATE_LIMIT_ROUTE = int(
+    os.environ.get("AVAILABILITY_RATE_LIMIT_ROUTE", 20000))
 SENTRY_DNS = os.environ.get("SENTRY_DNS")
+# Трассировка: базовая доля запросов; медленные (дольше TRACES_SLOW_MS)
+# и ошибочные маршруты трассируются целиком TRACES_BOOST_SECONDS.
+TRACES_SAMPLE_RATE = float(os.environ.get("TRACES_SAMPLE_RATE", 0.05))
+TRACES_SLOW_MS = float(os.environ.get("TRACES_SLOW_MS", 500))
+TRACES_BOOST_SECONDS = float(os.environ.get("TRACES_BOOST_SECONDS", 60))
+# Интервал отправки агрегированных сообщений в Sentry, в секундах.
+SENTRY_AGGREGATE_INTERVAL = float(
+    os.environ.get("SENTRY_AGGREGATE_INTERVAL", 60))
 
 ALGORITHM = os.environ.get("ALGORITHM")
 ACCESS_TOKEN_EXPIRE_MINUTES = os.environ.get("ACCESS_TOKEN_EXPIRE_MINUTES")
@@ -22,11 +107,123 @@ PG_HOST = os.environ.get("PG_HOST")
 PG_PORT = os.environ.get("PG_PORT")
 PG_DB = os.environ.get("PG_DB")
 TEST_PG_DB = os.environ.get("TEST_PG_DB")
+# Полный URL базы, если нужна не Postgres из PG_* (например, SQLite
+# в бенчмарках: sqlite+aiosqlite:///bench.db).
+DATABASE_URL = os.environ.get(
+    "DATABASE_URL",
+    f"postgresql+asyncpg://{PG_USER}:{PG_PASS}@{PG_HOST}:{PG_PORT}/{PG_DB}")
+
+# Пул соединений SQLAlchemy на процесс: максимум соединений
+# с Postgres = (DB_POOL_SIZE + DB_MAX_OVERFLOW) * число воркеров.
+DB_ECHO = os.environ.get("DB_ECHO", "false").lower() == "true"
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", 1800))
+DB_POOL_PRE_PING = os.environ.get("DB_POOL_PRE_PING", "true").lower() == "true"
+DB_STATEMENT_CACHE_SIZE = int(os.environ.get("DB_STATEMENT_CACHE_SIZE", 100))
+# Режим PgBouncer (pool_mode=transaction): без кеша подготовленных запросов.
+DB_PGBOUNCER = os.environ.get("DB_PGBOUNCER", "false").lower() == "true"
+# Отложенная пакетная запись is_verified.
+DB_WRITE_BEHIND = os.environ.get("DB_WRITE_BEHIND", "false").lower() == "true"
+DB_WRITE_BEHIND_INTERVAL_MS = int(
+    os.environ.get("DB_WRITE_BEHIND_INTERVAL_MS", 200))
+DB_WRITE_BEHIND_MAX_ITEMS = int(
+    os.environ.get("DB_WRITE_BEHIND_MAX_ITEMS", 500))
+# Реплики для чтения пользователей (URL через запятую, пусто - всё
+# читается с основной базы): round_robin или least_connections.
+DB_REPLICA_URLS = [url.strip() for url in
+                   os.environ.get("DB_REPLICA_URLS", "").split(",")
+                   if url.strip()]
+DB_REPLICA_STRATEGY = os.environ.get("DB_REPLICA_STRATEGY", "round_robin")
+# Сколько секунд после записи пользователь читается с основной базы.
+DB_READ_YOUR_WRITES_SECONDS = float(
+    os.environ.get("DB_READ_YOUR_WRITES_SECONDS", 5))
+# Таймаут чтения с реплики; упавшая реплика исключается на
+# DB_REPLICA_RETRY_SECONDS секунд.
+DB_REPLICA_TIMEOUT = float(os.environ.get("DB_REPLICA_TIMEOUT", 1))
+DB_REPLICA_RETRY_SECONDS = float(
+    os.environ.get("DB_REPLICA_RETRY_SECONDS", 30))
 
 WOKR_EMAIL = os.environ.get("WOKR_EMAIL")
 WOKR_EMAIL_PASS = os.environ.get("WOKR_EMAIL_PASS")
 WORK_HOSTNAME = os.environ.get("WORK_HOSTNAME")
 WOKR_PORT = os.environ.get("WOKR_PORT")
+SMTP_POOL_SIZE = int(os.environ.get("SMTP_POOL_SIZE", 4))
+SMTP_USE_TLS = os.environ.get("SMTP_USE_TLS", "true").lower() == "true"
+SMTP_TIMEOUT = float(os.environ.get("SMTP_TIMEOUT", 2))
+# SMTP соединений, открываемых при старте воркера.
+SMTP_PREWARM = int(os.environ.get("SMTP_PREWARM", 0))
+
+# Доставка писем: outbox - письмо ставится в поток Redis и запрос
+# отвечает сразу, отправляет отдельный процесс (python -m
+# backend.email_worker); inline - отправка по SMTP внутри запроса.
+EMAIL_DELIVERY = os.environ.get("EMAIL_DELIVERY", "outbox")
+# Поток очереди; <поток>:dead - недоставленные, <поток>:attempts -
+# счётчики повторов. Хеш-тег держит их на одном узле Redis Cluster.
+EMAIL_OUTBOX_STREAM = os.environ.get("EMAIL_OUTBOX_STREAM", "{outbox}:email")
+EMAIL_OUTBOX_GROUP = os.environ.get("EMAIL_OUTBOX_GROUP", "email-workers")
+# Повтор через EMAIL_OUTBOX_BACKOFF секунд с удвоением на каждой
+# попытке (не больше EMAIL_OUTBOX_BACKOFF_MAX), после
+# EMAIL_OUTBOX_MAX_ATTEMPTS попыток письмо уходит в поток dead.
+# Первая пауза больше времени отправки: письмо упавшего воркера
+# забирается через неё же.
+EMAIL_OUTBOX_BACKOFF = float(os.environ.get("EMAIL_OUTBOX_BACKOFF", 10))
+EMAIL_OUTBOX_BACKOFF_MAX = float(
+    os.environ.get("EMAIL_OUTBOX_BACKOFF_MAX", 600))
+EMAIL_OUTBOX_MAX_ATTEMPTS = int(
+    os.environ.get("EMAIL_OUTBOX_MAX_ATTEMPTS", 6))
+EMAIL_OUTBOX_DEAD_MAXLEN = int(
+    os.environ.get("EMAIL_OUTBOX_DEAD_MAXLEN", 10000))
+# Воркер отправки: писем за одно чтение и порт его метрик Prometheus.
+EMAIL_WORKER_BATCH = int(os.environ.get("EMAIL_WORKER_BATCH", 16))
+EMAIL_WORKER_METRICS_PORT = int(
+    os.environ.get("EMAIL_WORKER_METRICS_PORT", 9101))
+
+# Прогрев при старте: соединений с базой и Redis на воркер.
+DB_WARMUP_CONNECTIONS = int(os.environ.get("DB_WARMUP_CONNECTIONS", 2))
+REDIS_WARMUP_CONNECTIONS = int(os.environ.get("REDIS_WARMUP_CONNECTIONS", 2))
+# /health/ready: таймаут проверки зависимости и время жизни результата.
+HEALTH_TIMEOUT = float(os.environ.get("HEALTH_TIMEOUT", 1))
+HEALTH_CACHE_SECONDS = float(os.environ.get("HEALTH_CACHE_SECONDS", 1))
+
+TEMPLATES_DIR = os.environ.get("TEMPLATES_DIR", "template_message")
+TEMPLATES_LOCALE = os.environ.get("TEMPLATES_LOCALE", "ru")
+TEMPLATES_AUTO_RELOAD = (
+    os.environ.get("TEMPLATES_AUTO_RELOAD", "false").lower() == "true")
+
+# Production запуск (serve.py): число воркеров по умолчанию - по CPU,
+# перезапуск воркера после SERVE_MAX_REQUESTS (+ случайный разброс).
+WEB_CONCURRENCY = int(os.environ.get("WEB_CONCURRENCY", os.cpu_count() or 1))
+SERVE_BIND = os.environ.get("SERVE_BIND", "0.0.0.0:8000")
+SERVE_MAX_REQUESTS = int(os.environ.get("SERVE_MAX_REQUESTS", 10000))
+SERVE_MAX_REQUESTS_JITTER = int(
+    os.environ.get("SERVE_MAX_REQUESTS_JITTER", 1000))
+SERVE_TIMEOUT = int(os.environ.get("SERVE_TIMEOUT", 60))
+SERVE_GRACEFUL_TIMEOUT = int(os.environ.get("SERVE_GRACEFUL_TIMEOUT", 30))
+SERVE_KEEPALIVE = int(os.environ.get("SERVE_KEEPALIVE", 5))
+
+HASH_WORKERS = int(os.environ.get("HASH_WORKERS", os.cpu_count() or 1))
+HASH_MAX_QUEUE = int(os.environ.get("HASH_MAX_QUEUE", 64))
+HASH_TARGET_MS = float(os.environ.get("HASH_TARGET_MS", 100))
+
+# Метрики Prometheus на /metrics. При нескольких воркерах нужен общий
+# пустой каталог PROMETHEUS_MULTIPROC_DIR: значения всех процессов
+# складываются при выдаче.
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "true").lower() == "true"
+PROMETHEUS_MULTIPROC_DIR = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+
+# Необязательные middleware через запятую: cors, session. Ни один
+# маршрут не читает request.session, поэтому session по умолчанию выключен.
+MIDDLEWARE = [name.strip() for name in
+              os.environ.get("MIDDLEWARE", "cors").split(",") if name.strip()]
+CORS_ALLOW_ORIGINS = os.environ.get("CORS_ALLOW_ORIGINS", "*").split(",")
+# Время кеширования ответа на preflight запрос браузером, в секундах.
+CORS_MAX_AGE = int(os.environ.get("CORS_MAX_AGE", 7200))
+# Диагностика: время каждого слоя middleware в заголовке Server-Timing
+# и в метрике middleware_duration_seconds.
+MIDDLEWARE_TIMING = (
+    os.environ.get("MIDDLEWARE_TIMING", "false").lower() == "true")
 
 SECRET_KEY_REGISTRATION = os.environ.get("SECRET_KEY_REGISTRATION")
 SECRET_KEY_AUTHORIZATION = os.environ.get("SECRET_KEY_AUTHORIZATION")
@@ -1,17 +1,37 @@
 """Database module based on SQLAlchemy."""
 
+import asyncio
 import re
-from typing import List
-
-from config import PG_USER, PG_PASS, PG_HOST, PG_PORT, PG_DB
-
-from sqlalchemy import String, select, Text, Boolean
+import time
+import uuid
+from itertools import chain
+from typing import Dict, Iterable, List, Optional
+
+from config import (DATABASE_URL, DB_ECHO, DB_MAX_OVERFLOW, DB_PGBOUNCER,
+                    DB_POOL_PRE_PING, DB_POOL_RECYCLE, DB_POOL_SIZE,
+                    DB_POOL_TIMEOUT, DB_READ_YOUR_WRITES_SECONDS,
+                    DB_REPLICA_RETRY_SECONDS, DB_REPLICA_STRATEGY,
+                    DB_REPLICA_TIMEOUT, DB_REPLICA_URLS,
+                    DB_STATEMENT_CACHE_SIZE, DB_WRITE_BEHIND_INTERVAL_MS,
+                    DB_WRITE_BEHIND_MAX_ITEMS)
+from metrics.metrics import (DB_LATENCY, DB_POOL_ACQUIRE,
+                             DB_POOL_CHECKED_OUT, DB_POOL_CONNECTIONS,
+                             DB_POOL_OVERFLOW, DB_POOL_TIMEOUTS, DB_READS,
+                             Children, timed)
+
+from sqlalchemy import (String, select, Text, Boolean, Index, Select,
+                        func, or_, exc, text, update)
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
 from sqlalchemy.ext.asyncio import (
     create_async_engine, AsyncSession)
 from sqlalchemy.orm import sessionmaker
 
 
+EMAIL_REGEX = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
+
+
 async def is_valid_email(email) -> bool:
     """
     Проверяет, является ли строка допустимым email адресом.
@@ -24,21 +44,238 @@ async def is_valid_email(email) -> bool:
 
         bool: True, если строка соответствует формату email, иначе False.
     """
-    email_regex = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-    if re.match(email_regex, email):
+    if re.match(EMAIL_REGEX, email):
         return True
     else:
         return False
 
 
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """
+    Пул соединений, считающий время получения соединения.
+
+    Время включает ожидание свободного соединения и открытие нового,
+    если пул ещё не заполнен. Оно же, число выданных и открытых
+    соединений, overflow сверх pool_size и таймауты ожидания
+    отдаются в метрики db_pool_*.
+    """
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            DB_POOL_TIMEOUTS.inc()
+            raise
+        finally:
+            DB_POOL_ACQUIRE.observe(time.perf_counter() - started)
+            self._export()
+
+    def _do_return_conn(self, record) -> None:
+        super()._do_return_conn(record)
+        self._export()
+
+    def _export(self) -> None:
+        checked_out = self.checkedout()
+        DB_POOL_CHECKED_OUT.set(checked_out)
+        DB_POOL_CONNECTIONS.set(checked_out + self.checkedin())
+        # До заполнения пула overflow() отрицателен.
+        DB_POOL_OVERFLOW.set(max(self.overflow(), 0))
+
+
+def _connect_args(url: str = DATABASE_URL) -> dict:
+    """Параметры asyncpg с учётом режима PgBouncer."""
+    if not url.startswith("postgresql+asyncpg"):
+        return {}
+    if DB_PGBOUNCER:
+        # В transaction-режиме PgBouncer соединение с сервером меняется
+        # между транзакциями, подготовленные запросы не переживают этого.
+        return {
+            "statement_cache_size": 0,
+            "prepared_statement_cache_size": 0,
+            "prepared_statement_name_func":
+                lambda: f"__asyncpg_{uuid.uuid4()}__",
+        }
+    return {
+        "statement_cache_size": DB_STATEMENT_CACHE_SIZE,
+        "prepared_statement_cache_size": DB_STATEMENT_CACHE_SIZE,
+    }
+
+
 engine = create_async_engine(
-    f"postgresql+asyncpg://{PG_USER}:{PG_PASS}@{PG_HOST}:{PG_PORT}/{PG_DB}",
-    echo=True)
+    DATABASE_URL,
+    echo=DB_ECHO,
+    poolclass=InstrumentedPool,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    pool_pre_ping=DB_POOL_PRE_PING,
+    connect_args=_connect_args())
 
 async_session = sessionmaker(
     engine, class_=AsyncSession, expire_on_commit=False
 )
 
+# Ошибки, после которых реплика временно исключается из ротации.
+REPLICA_ERRORS = (exc.DBAPIError, OSError, asyncio.TimeoutError)
+# Число закреплений, после которого из словаря удаляются истёкшие.
+PINS_PRUNE_SIZE = 10000
+
+
+async def _first(bind, query: Select) -> Optional["User"]:
+    async with AsyncSession(bind) as session:
+        result = await session.execute(query)
+        return result.scalars().first()
+
+
+class Replica:
+    """Реплика для чтения: свой пул соединений и состояние."""
+
+    def __init__(self, url: str, timeout: float) -> None:
+        self.name = make_url(url).render_as_string(hide_password=True)
+        self.timeout = timeout
+        connect_args = _connect_args(url)
+        if url.startswith("postgresql+asyncpg"):
+            connect_args["timeout"] = timeout
+        self.engine = create_async_engine(
+            url,
+            echo=DB_ECHO,
+            poolclass=AsyncAdaptedQueuePool,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+            pool_pre_ping=DB_POOL_PRE_PING,
+            connect_args=connect_args)
+        self.in_flight = 0
+        self.down_until = 0.0
+
+    @property
+    def healthy(self) -> bool:
+        return self.down_until <= time.monotonic()
+
+    def fail(self, error: BaseException, retry_seconds: float) -> None:
+        if self.healthy:
+            print(f"Replica {self.name} disabled for {retry_seconds:g} s: "
+                  f"{type(error).__name__}: {error}")
+        self.down_until = time.monotonic() + retry_seconds
+
+    async def first(self, query: Select) -> Optional["User"]:
+        """
+        Запрос на реплике.
+
+        Таймаут действует на подключение и сам запрос, но не на
+        ожидание свободного соединения пула: очередь под нагрузкой
+        не признак неисправности.
+        """
+        self.in_flight += 1
+        try:
+            async with AsyncSession(self.engine) as session:
+                await session.connection()
+                result = await asyncio.wait_for(session.execute(query),
+                                                self.timeout)
+                return result.scalars().first()
+        finally:
+            self.in_flight -= 1
+
+    async def ping(self) -> None:
+        """SELECT 1; удачная проверка возвращает реплику в ротацию."""
+        async with self.engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+        self.down_until = 0.0
+
+
+class ReplicaRouter:
+    """
+    Маршрутизация чтения пользователей по репликам.
+
+    Чтение идёт на исправную реплику по стратегии round_robin
+    или least_connections (меньше всего запросов в работе). Реплика,
+    не подключившаяся или не ответившая за timeout или вернувшая
+    ошибку базы, исключается на retry_seconds (или до удачной
+    проверки /health/ready), запрос повторяется на следующей,
+    а если исправных нет - на основной базе.
+
+    После записи логин и почта пользователя закрепляются за основной
+    базой на pin_seconds (read-your-writes), пока реплики догоняют.
+    Закрепление хранится в памяти процесса: чтение в другом воркере
+    сразу после записи может вернуть данные реплики с задержкой
+    репликации.
+    """
+
+    STRATEGIES = ("round_robin", "least_connections")
+
+    def __init__(self, urls: Iterable[str], strategy: str,
+                 pin_seconds: float, timeout: float,
+                 retry_seconds: float) -> None:
+        if strategy not in self.STRATEGIES:
+            raise ValueError(f"Unknown replica strategy: {strategy}")
+        self.replicas = [Replica(url, timeout) for url in urls]
+        self.strategy = strategy
+        self.pin_seconds = pin_seconds
+        self.retry_seconds = retry_seconds
+        self._next = 0
+        self._pins: Dict[str, float] = {}
+        self._reads = Children(DB_READS)
+
+    def pin(self, *identifiers: Optional[str]) -> None:
+        """Чтение identifiers с основной базы следующие pin_seconds."""
+        if not self.replicas or not self.pin_seconds:
+            return
+        now = time.monotonic()
+        if len(self._pins) >= PINS_PRUNE_SIZE:
+            self._pins = {key: until for key, until in self._pins.items()
+                          if until > now}
+        for identifier in identifiers:
+            if identifier:
+                self._pins[identifier.lower()] = now + self.pin_seconds
+
+    def pinned(self, identifiers: Iterable[Optional[str]]) -> bool:
+        now = time.monotonic()
+        return any(self._pins.get(identifier.lower(), 0.0) > now
+                   for identifier in identifiers if identifier)
+
+    def candidates(self) -> List[Replica]:
+        """Исправные реплики в порядке попыток."""
+        healthy = [replica for replica in self.replicas if replica.healthy]
+        if not healthy:
+            return healthy
+        self._next = (self._next + 1) % len(healthy)
+        ordered = healthy[self._next:] + healthy[:self._next]
+        if self.strategy == "least_connections":
+            # Сортировка устойчивая: при равенстве - по кругу.
+            ordered.sort(key=lambda replica: replica.in_flight)
+        return ordered
+
+    async def first(self, query: Select,
+                    *identifiers: Optional[str]) -> Optional["User"]:
+        """Первый пользователь по запросу с реплики или основной базы."""
+        if self.replicas:
+            if self.pinned(identifiers):
+                self._reads["pinned"].inc()
+                return await _first(engine, query)
+            for replica in self.candidates():
+                try:
+                    user = await replica.first(query)
+                except REPLICA_ERRORS as ex:
+                    replica.fail(ex, self.retry_seconds)
+                    continue
+                self._reads["replica"].inc()
+                return user
+        self._reads["primary"].inc()
+        return await _first(engine, query)
+
+    async def close(self) -> None:
+        for replica in self.replicas:
+            await replica.engine.dispose()
+
+
+replicas = ReplicaRouter(DB_REPLICA_URLS, DB_REPLICA_STRATEGY,
+                         pin_seconds=DB_READ_YOUR_WRITES_SECONDS,
+                         timeout=DB_REPLICA_TIMEOUT,
+                         retry_seconds=DB_REPLICA_RETRY_SECONDS)
+
 
 class Base(DeclarativeBase):
     pass
@@ -59,6 +296,11 @@ class User(Base):
         return f"User(id={self.id!r}, name={self.name!r})"
 
 
+# Индексы совпадают с миграцией 5dd47a7a8041.
+Index("ix_user_name", User.name, unique=True)
+Index("ix_user_email_lower", func.lower(User.email), unique=True)
+
+
 async def create_tables() -> None:
     """Функция создания таблиц."""
     async with engine.begin() as conn:
@@ -71,6 +313,7 @@ async def delete_tables() -> None:
         await conn.run_sync(Base.metadata.drop_all)
 
 
+@timed(DB_LATENCY, "select_by_user")
 async def select_by_user(login) -> List[User]:
     """
     Получение данных из таблцы по логину.
@@ -79,12 +322,11 @@ async def select_by_user(login) -> List[User]:
 
         login: логин пользователя.
     """
-    async with AsyncSession(engine) as session:
-        result = await session.execute(select(User).where(User.name == login))
-        user = result.scalars().first()
-        return user
+    return await replicas.first(select(User).where(User.name == login),
+                                login)
 
 
+@timed(DB_LATENCY, "select_by_email")
 async def select_by_email(email) -> List[User]:
     """
     Получение данных из таблцы по почте.
@@ -93,12 +335,47 @@ async def select_by_email(email) -> List[User]:
 
         email: почта пользователя.
     """
-    async with AsyncSession(engine) as session:
-        result = await session.execute(select(User).where(User.email == email))
-        user = result.scalars().first()
-        return user
+    return await replicas.first(
+        select(User).where(func.lower(User.email) == email.lower()), email)
+
 
+def identifier_query(identifier: str,
+                     email: Optional[str] = None) -> Select:
+    """
+    Запрос пользователя по логину или почте.
 
+    args:
+
+        identifier: логин или почта пользователя.
+        email: почта, если отличается от identifier (регистрация).
+    """
+    email = (email or identifier).lower()
+    by_name = User.name == identifier
+    by_email = func.lower(User.email) == email
+    # Оба условия покрыты индексами: BitmapOr по ix_user_name и
+    # ix_user_email_lower. При совпадении с двумя строками приоритет
+    # у того поля, которое похоже на введённое значение.
+    preferred = by_email if "@" in identifier else by_name
+    return (select(User).where(or_(by_name, by_email))
+            .order_by(preferred.desc()).limit(1))
+
+
+@timed(DB_LATENCY, "select_by_identifier")
+async def select_by_identifier(identifier: str,
+                               email: Optional[str] = None) -> User:
+    """
+    Получение пользователя по логину или почте за один запрос.
+
+    args:
+
+        identifier: логин или почта пользователя.
+        email: почта, если нужно искать одновременно логин и почту.
+    """
+    return await replicas.first(identifier_query(identifier, email),
+                                identifier, email)
+
+
+@timed(DB_LATENCY, "add_user")
 async def add_user(email, login, password) -> None:
     """
     Добавление пользователя в таблицу.
@@ -114,27 +391,130 @@ async def add_user(email, login, password) -> None:
             result = User(email=email, name=login, password=password)
             session.add(result)
             await session.commit()
+    replicas.pin(login, email)
+
+
+def _login_clause(login: str):
+    """Условие WHERE по логину или, если это почта, по lower(email)."""
+    if re.match(EMAIL_REGEX, login):
+        return func.lower(User.email) == login.lower()
+    return User.name == login
+
 
+def _pin_updated(rows) -> None:
+    """Закрепление за основной базой пользователей из RETURNING."""
+    replicas.pin(*chain.from_iterable(rows))
 
-async def update_password(email, password) -> None:
+
+@timed(DB_LATENCY, "update_password")
+async def update_password(login, password) -> None:
     """
-    Изменение пароля пользователя по указанной почте.
+    Изменение пароля пользователя по указанной почте или логину.
 
     args:
 
-        email: почта пользователя.
+        login: почта или логин пользователя.
         password: пароль пользователя.
     """
-    async with AsyncSession(engine) as session:
-        async with session.begin():
-            user = await session.execute(
-                select(User).where(User.email == email))
-            result = user.scalars().first()
-            if result:
-                result.password = password
-                await session.commit()
-            else:
-                return {"message": f"User with login {email} not found."}
+    async with engine.begin() as conn:
+        result = await conn.execute(
+            update(User).where(_login_clause(login))
+            .values(password=password)
+            .returning(User.name, User.email))
+        rows = result.all()
+    if not rows:
+        return {"message": f"User with login {login} not found."}
+    _pin_updated(rows)
+
+
+class VerifiedWriteBehind:
+    """
+    Отложенная пакетная запись is_verified.
+
+    Изменения копятся в памяти процесса, для одного пользователя
+    остаётся только последнее значение. Накопленное записывается
+    одним UPDATE на каждое значение флага раз в interval_ms
+    или сразу при max_items ожидающих записях, а также при остановке.
+    """
+
+    def __init__(self, interval_ms: int, max_items: int) -> None:
+        self.interval = interval_ms / 1000
+        self.max_items = max_items
+        self._pending: Dict[str, bool] = {}
+        self._wakeup = asyncio.Event()
+        self._stopping = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._stopping.clear()
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        """Остановка фоновой задачи и запись оставшихся изменений."""
+        if self._task is not None:
+            # Без cancel(): отмена посреди flush() потеряла бы пакет,
+            # уже снятый с _pending. Задача дописывает текущий пакет
+            # и выходит из цикла.
+            self._stopping.set()
+            self._wakeup.set()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    def put(self, login: str, is_verified: bool) -> None:
+        self._pending[login] = is_verified
+        if len(self._pending) >= self.max_items:
+            self._wakeup.set()
+
+    async def _run(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self) -> None:
+        """Запись накопленных изменений пакетом."""
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, {}
+        groups: Dict[bool, List[str]] = {}
+        for login, value in batch.items():
+            groups.setdefault(value, []).append(login)
+        try:
+            await self._write(groups)
+        except Exception as ex:
+            print(f"Write-behind flush error: {ex}")
+            # Возвращаем в очередь, не затирая более свежие значения.
+            self._pending = {**batch, **self._pending}
+
+    @staticmethod
+    @timed(DB_LATENCY, "flush_verified")
+    async def _write(groups: Dict[bool, List[str]]) -> None:
+        async with engine.begin() as conn:
+            for value, logins in groups.items():
+                emails = [login.lower() for login in logins
+                          if re.match(EMAIL_REGEX, login)]
+                names = [login for login in logins
+                         if not re.match(EMAIL_REGEX, login)]
+                result = await conn.execute(
+                    update(User)
+                    .where(or_(User.name.in_(names),
+                               func.lower(User.email).in_(emails)))
+                    .values(is_verified=value)
+                    .returning(User.name, User.email))
+                _pin_updated(result.all())
+
+
+verified_writer = VerifiedWriteBehind(DB_WRITE_BEHIND_INTERVAL_MS,
+                                      max_items=DB_WRITE_BEHIND_MAX_ITEMS)
 
 
 async def update_is_active(login: str, is_verified: bool):
@@ -145,18 +525,26 @@ async def update_is_active(login: str, is_verified: bool):
 
         user: логин/почта юзера
         bool: актуальное состояние пользователя.
+
+    Notes:
+
+        Если запущена отложенная запись (DB_WRITE_BEHIND), изменение
+        ставится в очередь verified_writer и запишется пакетом.
     """
-    async with AsyncSession(engine) as session:
-        async with session.begin():
-            if await is_valid_email(login):
-                user = await session.execute(
-                    select(User).where(User.email == login))
-            else:
-                user = await session.execute(
-                    select(User).where(User.name == login))
-            result = user.scalars().first()
-            if result:
-                result.is_verified = is_verified
-                await session.commit()
-            else:
-                return {"message": f"User with login {user} not found."}
+    if verified_writer.running:
+        verified_writer.put(login, is_verified)
+        return
+    return await _update_is_active(login, is_verified)
+
+
+@timed(DB_LATENCY, "update_is_active")
+async def _update_is_active(login: str, is_verified: bool):
+    async with engine.begin() as conn:
+        result = await conn.execute(
+            update(User).where(_login_clause(login))
+            .values(is_verified=is_verified)
+            .returning(User.name, User.email))
+        rows = result.all()
+    if not rows:
+        return {"message": f"User with login {login} not found."}
+    _pin_updated(rows)
@@ -0,0 +1,286 @@
+"""
+Потоковый импорт и экспорт пользователей через PostgreSQL COPY.
+
+Импорт из CSV или JSONL (поля login или name, email, password,
+необязательные role_id и is_verified). Пароль - готовый хеш werkzeug
+(scrypt:... или pbkdf2:...), строки с другим паролем, некорректной
+почтой или логином отклоняются. Файл читается порциями по
+--chunk-size строк, каждая порция - одна транзакция: COPY во
+временную таблицу и перенос в "user" одним запросом.
+
+Совпадения по логину или почте (без учёта регистра):
+
+    skip   - существующий пользователь остаётся как есть;
+    upsert - пользователь с тем же логином обновляется, если новая
+             почта не занята другим пользователем.
+
+Экспорт пишет таблицу в CSV (COPY TO) или JSONL (серверный курсор),
+не держа её в памяти.
+
+    python -m database.bulk import users.csv --policy upsert
+    python -m database.bulk import users.jsonl --rejects rejects.jsonl
+    python -m database.bulk export users.csv
+    python -m database.bulk export - --format jsonl > users.jsonl
+"""
+
+import argparse
+import asyncio
+import csv
+import re
+import sys
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from itertools import islice
+from typing import IO, Iterable, Iterator, List, Optional, Tuple
+
+import orjson
+
+from database.FDataBase import EMAIL_REGEX, User, engine
+
+
+COLUMNS = ("line", "name", "email", "password", "role_id", "is_verified")
+EXPORT_COLUMNS = ("name", "email", "password", "role_id", "is_verified")
+NAME_LENGTH = User.__table__.c.name.type.length
+WERKZEUG_HASH = re.compile(r"^(scrypt|pbkdf2):[^$]+\$[^$]+\$[0-9a-f]+$")
+TRUE_VALUES = {"1", "true", "t", "yes", "y"}
+
+CREATE_STAGE = """
+CREATE TEMP TABLE user_import (
+    line bigint, name text, email text, password text,
+    role_id integer, is_verified boolean
+) ON COMMIT DROP
+"""
+# Внутри порции побеждает последняя строка с тем же логином или почтой.
+UPSERT = """
+WITH by_name AS (
+    SELECT DISTINCT ON (name) * FROM user_import ORDER BY name, line DESC
+), src AS (
+    SELECT DISTINCT ON (lower(email)) * FROM by_name
+    ORDER BY lower(email), line DESC
+)
+UPDATE "user" u
+SET email = s.email, password = s.password,
+    role_id = s.role_id, is_verified = s.is_verified
+FROM src s
+WHERE u.name = s.name
+  AND NOT EXISTS (SELECT 1 FROM "user" o
+                  WHERE lower(o.email) = lower(s.email) AND o.id <> u.id)
+"""
+# При upsert строки вставляются с конца: последняя из дублей остаётся.
+INSERT = """
+INSERT INTO "user" (name, email, password, role_id, is_verified)
+SELECT name, email, password, role_id, is_verified
+FROM user_import ORDER BY line {order}
+ON CONFLICT DO NOTHING
+"""
+
+
+@dataclass
+class Progress:
+    """Счётчики импорта."""
+
+    read: int = 0
+    inserted: int = 0
+    updated: int = 0
+    skipped: int = 0
+    rejected: int = 0
+    started: float = 0.0
+
+    def report(self, final: bool = False) -> None:
+        elapsed = time.perf_counter() - self.started
+        print(f"{'done' if final else 'progress'}: read {self.read}, "
+              f"inserted {self.inserted}, updated {self.updated}, "
+              f"skipped {self.skipped}, rejected {self.rejected}, "
+              f"{self.read / elapsed if elapsed else 0:.0f} rows/s",
+              file=sys.stderr)
+
+
+def read_rows(file: IO[str], fmt: str) -> Iterator[dict]:
+    """Строки файла как словари, без чтения файла целиком."""
+    if fmt == "csv":
+        yield from csv.DictReader(file)
+        return
+    for line in file:
+        if line.strip():
+            yield orjson.loads(line)
+
+
+def to_record(line: int, row: dict) -> Tuple[Optional[tuple], str]:
+    """Запись для COPY или None и причина отклонения."""
+    name = str(row.get("name") or row.get("login") or "").strip()
+    email = str(row.get("email") or "").strip()
+    password = str(row.get("password") or "")
+    if not name or len(name) > NAME_LENGTH:
+        return None, "bad name"
+    if not re.match(EMAIL_REGEX, email):
+        return None, "bad email"
+    if not WERKZEUG_HASH.match(password):
+        return None, "password is not a werkzeug hash"
+    try:
+        role_id = int(row.get("role_id") or 1)
+    except ValueError:
+        return None, "bad role_id"
+    verified = row.get("is_verified")
+    if not isinstance(verified, bool):
+        verified = str(verified or "").strip().lower() in TRUE_VALUES
+    return (line, name, email, password, role_id, verified), ""
+
+
+def affected(status: str) -> int:
+    """Число строк из статуса команды asyncpg ("INSERT 0 10")."""
+    return int(status.rsplit(" ", 1)[-1])
+
+
+@asynccontextmanager
+async def driver_connection():
+    """Соединение asyncpg из пула FDataBase.engine."""
+    if engine.dialect.driver != "asyncpg":
+        raise SystemExit("COPY работает только с PostgreSQL "
+                         "(DATABASE_URL postgresql+asyncpg://...)")
+    async with engine.connect() as conn:
+        raw = await conn.get_raw_connection()
+        yield raw.driver_connection
+
+
+async def load_chunk(pg, records: List[tuple], policy: str,
+                     progress: Progress) -> None:
+    async with pg.transaction():
+        await pg.execute(CREATE_STAGE)
+        await pg.copy_records_to_table("user_import", records=records,
+                                       columns=COLUMNS)
+        updated = 0
+        if policy == "upsert":
+            updated = affected(await pg.execute(UPSERT))
+        inserted = affected(await pg.execute(INSERT.format(
+            order="DESC" if policy == "upsert" else "ASC")))
+    progress.updated += updated
+    progress.inserted += inserted
+    progress.skipped += len(records) - updated - inserted
+
+
+async def import_users(rows: Iterable[dict], policy: str, chunk_size: int,
+                       rejects: Optional[IO[str]] = None) -> Progress:
+    """
+    Импорт пользователей порциями по chunk_size строк.
+
+    Args:
+
+        rows: Строки входного файла.
+        policy: skip или upsert для совпадающих пользователей.
+        chunk_size: Строк в одной транзакции.
+        rejects: Файл для отклонённых строк (JSONL с причиной).
+    """
+    progress = Progress(started=time.perf_counter())
+    numbered = enumerate(rows, start=1)
+    async with driver_connection() as pg:
+        while True:
+            chunk = list(islice(numbered, chunk_size))
+            if not chunk:
+                break
+            records = []
+            for line, row in chunk:
+                record, reason = to_record(line, row)
+                if record is None:
+                    progress.rejected += 1
+                    if rejects is not None:
+                        rejects.write(orjson.dumps(
+                            {"line": line, "reason": reason,
+                             "row": row}).decode() + "\n")
+                else:
+                    records.append(record)
+            if records:
+                await load_chunk(pg, records, policy, progress)
+            progress.read += len(chunk)
+            progress.report()
+    progress.report(final=True)
+    return progress
+
+
+class _Sink:
+    """Приёмник COPY TO: байты сразу пишутся в файл."""
+
+    def __init__(self, output: IO[bytes]) -> None:
+        self.output = output
+        self.size = 0
+
+    async def __call__(self, data: bytes) -> None:
+        self.output.write(data)
+        self.size += len(data)
+
+
+async def export_users(output: IO[bytes], fmt: str,
+                       batch: int = 10000) -> int:
+    """
+    Выгрузка таблицы пользователей в CSV или JSONL.
+
+    Returns:
+
+        int: Число выгруженных строк.
+    """
+    query = f'SELECT {", ".join(EXPORT_COLUMNS)} FROM "user" ORDER BY id'
+    async with driver_connection() as pg:
+        if fmt == "csv":
+            status = await pg.copy_from_query(
+                query, output=_Sink(output), format="csv", header=True)
+            count = affected(status)
+        else:
+            count = 0
+            async with pg.transaction():
+                async for record in pg.cursor(query, prefetch=batch):
+                    output.write(orjson.dumps(dict(record)) + b"\n")
+                    count += 1
+                    if count % batch == 0:
+                        print(f"progress: exported {count}",
+                              file=sys.stderr)
+    print(f"done: exported {count}", file=sys.stderr)
+    return count
+
+
+def detect_format(path: str, fmt: Optional[str]) -> str:
+    if fmt:
+        return fmt
+    return "jsonl" if path.endswith((".jsonl", ".ndjson")) else "csv"
+
+
+async def run(args: argparse.Namespace) -> None:
+    fmt = detect_format(args.path, args.format)
+    if args.command == "import":
+        rejects = (open(args.rejects, "w", encoding="utf-8")
+                   if args.rejects else None)
+        source = (sys.stdin if args.path == "-"
+                  else open(args.path, encoding="utf-8", newline=""))
+        try:
+            await import_users(read_rows(source, fmt), args.policy,
+                               args.chunk_size, rejects)
+        finally:
+            source.close()
+            if rejects is not None:
+                rejects.close()
+    else:
+        output = (sys.stdout.buffer if args.path == "-"
+                  else open(args.path, "wb"))
+        try:
+            await export_users(output, fmt)
+        finally:
+            output.flush()
+            if output is not sys.stdout.buffer:
+                output.close()
+    await engine.dispose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("command", choices=["import", "export"])
+    parser.add_argument("path", help="файл или - для stdin/stdout")
+    parser.add_argument("--format", choices=["csv", "jsonl"],
+                        help="по умолчанию - по расширению файла")
+    parser.add_argument("--policy", choices=["skip", "upsert"],
+                        default="skip")
+    parser.add_argument("--chunk-size", type=int, default=10000)
+    parser.add_argument("--rejects", help="JSONL для отклонённых строк")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 import jwt
+import uuid
 from datetime import datetime, timezone, timedelta
 from functools import wraps
 from fastapi import HTTPException, Request
@@ -18,10 +19,12 @@ def create_jwt_token(login: str, token_lifetime_hours: int,
         str: Сгенерированный JWT токен.
     """
     time_token = token_lifetime_hours
-    # Словарь для приведения в токен (логин+время жизни токена)
+    # Словарь для приведения в токен (логин+время жизни токена+
+    # уникальный идентификатор для отзыва)
     payload = {
         "login": login,
-        "exp": datetime.now(timezone.utc) + timedelta(hours=time_token)
+        "exp": datetime.now(timezone.utc) + timedelta(hours=time_token),
+        "jti": uuid.uuid4().hex,
     }
     return jwt.encode(payload, secret_key,
                       algorithm="HS256")  # <- Метод шитфрования
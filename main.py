@@ -1,38 +1,114 @@
-import asyncio
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from typing import List
+
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
-from sentry_sdk.integrations.asgi import SentryAsgiMiddleware
 
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
+from starlette.middleware import Middleware
 from starlette.middleware.sessions import SessionMiddleware
 
-from api.api import app_auth, app_reg, app_logout
-from config import SECRET_KEY
-from database.FDataBase import create_tables, delete_tables
-from redis_tools.redis_tools import lifespan
+from api.api import (app_auth, app_reg, app_logout, app_metrics,
+                     app_sessions)
+from api.health import app_health, warm_up
+from backend.availability import known_users
+from backend.hasher import hasher
+from backend.smtp_pool import smtp_pool
+from backend.templates import templates
+from config import (CORS_ALLOW_ORIGINS, CORS_MAX_AGE, DB_WRITE_BEHIND,
+                    METRICS_ENABLED, MIDDLEWARE, MIDDLEWARE_TIMING,
+                    SECRET_KEY, TOKEN_VERIFICATION_MODE)
+from database.FDataBase import delete_tables, replicas, verified_writer
+from metrics.metrics import LayerTimer, MetricsMiddleware
+from metrics.tracing import init_sentry, sampler, sentry_messages
+from redis_tools.redis_tools import session_store
+from redis_tools.revocation import revocations
+from redis_tools.token_cache import token_cache
+
+
+@asynccontextmanager
+async def lifespan(application: FastAPI) -> AsyncIterator[None]:
+    """
+    Открытие и закрытие общих пулов Redis, SMTP и хеширования.
+
+    Воркер начинает принимать запросы только после прогрева
+    (api.health.warm_up): соединения с базой, Redis и SMTP уже открыты.
+    """
+    init_sentry()
+    templates.load()
+    await session_store.connect()
+    await hasher.start()
+    if DB_WRITE_BEHIND:
+        verified_writer.start()
+    token_cache.start(session_store.client)
+    if TOKEN_VERIFICATION_MODE == "stateless":
+        await revocations.start(session_store.client)
+    known_users.start()
+    sentry_messages.start()
+    await warm_up(application)
+    try:
+        yield
+    finally:
+        await sentry_messages.close()
+        await known_users.close()
+        await revocations.close()
+        await token_cache.close()
+        await verified_writer.close()
+        await replicas.close()
+        await hasher.close()
+        await smtp_pool.close()
+        await session_store.close()
+
 
+def middleware() -> List[Middleware]:
+    """
+    Слои middleware, первый в списке - внешний.
 
-app = FastAPI(lifespan=lifespan)
+    metrics (METRICS_ENABLED) - внешний, его время включает все
+    остальные слои; cors и session - по списку MIDDLEWARE. При
+    MIDDLEWARE_TIMING перед каждым слоем и перед приложением ставится
+    LayerTimer, время слоёв приходит в заголовке Server-Timing.
+    """
+    layers = []
+    if METRICS_ENABLED:
+        layers.append(("metrics", Middleware(MetricsMiddleware,
+                                             observer=sampler.record)))
+    if "cors" in MIDDLEWARE:
+        layers.append(("cors", Middleware(
+            CORSMiddleware,
+            allow_origins=CORS_ALLOW_ORIGINS,
+            allow_credentials=True,
+            allow_methods=["*"],
+            allow_headers=["*"],
+            max_age=CORS_MAX_AGE,
+        )))
+    if "session" in MIDDLEWARE:
+        layers.append(("session", Middleware(SessionMiddleware,
+                                             secret_key=SECRET_KEY,
+                                             max_age=360)))
+    if not MIDDLEWARE_TIMING:
+        return [layer for _, layer in layers]
+    stack = []
+    for name, layer in layers:
+        stack += [Middleware(LayerTimer, name=name, report=not stack), layer]
+    stack.append(Middleware(LayerTimer, name="app", report=not stack))
+    return stack
+
+
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse,
+              middleware=middleware())
 
 app.include_router(app_reg)
 app.include_router(app_auth)
 app.include_router(app_logout)
-app.add_middleware(SessionMiddleware, secret_key=SECRET_KEY,
-                   max_age=360)
-app.add_middleware(SentryAsgiMiddleware)
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-
-async def main():
-    await create_tables()
+app.include_router(app_sessions)
+app.include_router(app_health)
+if METRICS_ENABLED:
+    app.include_router(app_metrics)
 
 if __name__ == "__main__":
-    asyncio.run(main())
-
+    # Только для разработки: один процесс с перезагрузкой. Production
+    # запуск и создание таблиц - serve.py.
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
@@ -0,0 +1,265 @@
+"""
+Метрики Prometheus приложения.
+
+Гистограммы времени запросов по маршрутам и кодам ответа, времени
+команд Redis, запросов к базе, отправки писем, задержки доставки
+из очереди писем и хеширования паролей, а также показатели пула
+соединений базы, чтения с реплик, попадания в кеш токенов, глубина
+очереди писем, обмены refresh токенов, входы с доверенных устройств,
+проверки доступности логина и почты и число запросов в работе.
+
+При нескольких воркерах (uvicorn --workers, gunicorn) значения
+пишутся в файлы каталога PROMETHEUS_MULTIPROC_DIR и складываются
+по всем процессам при выдаче /metrics.
+"""
+
+import functools
+import time
+from typing import Callable, Optional, Tuple
+
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY,
+                               CollectorRegistry, Counter, Gauge, Histogram,
+                               generate_latest, multiprocess,
+                               start_http_server)
+
+from config import PROMETHEUS_MULTIPROC_DIR
+
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "Время обработки HTTP запроса",
+    ["method", "route", "status"])
+REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight", "HTTP запросы в работе",
+    multiprocess_mode="livesum")
+
+REDIS_LATENCY = Histogram(
+    "redis_command_duration_seconds", "Время команды Redis",
+    ["command"],
+    buckets=(.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1))
+DB_LATENCY = Histogram(
+    "db_query_duration_seconds", "Время запроса к базе",
+    ["query"],
+    buckets=(.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5))
+DB_READS = Counter(
+    "db_reads_total", "Чтения пользователей: replica, primary или pinned "
+    "(основная база после записи)",
+    ["target"])
+DB_POOL_ACQUIRE = Histogram(
+    "db_pool_acquire_seconds", "Время получения соединения из пула",
+    buckets=(.0001, .0005, .001, .005, .01, .05, .1, .5, 1, 5, 30))
+DB_POOL_CHECKED_OUT = Gauge(
+    "db_pool_checked_out", "Выданные соединения пула базы",
+    multiprocess_mode="livesum")
+DB_POOL_CONNECTIONS = Gauge(
+    "db_pool_connections", "Открытые соединения пула базы",
+    multiprocess_mode="livesum")
+DB_POOL_OVERFLOW = Gauge(
+    "db_pool_overflow",
+    "Соединения пула базы сверх DB_POOL_SIZE (до DB_MAX_OVERFLOW)",
+    multiprocess_mode="livesum")
+DB_POOL_TIMEOUTS = Counter(
+    "db_pool_timeouts_total",
+    "Запросы, не дождавшиеся соединения пула за DB_POOL_TIMEOUT")
+EMAIL_LATENCY = Histogram(
+    "email_send_duration_seconds", "Время отправки письма",
+    ["result"],
+    buckets=(.05, .1, .25, .5, 1, 2.5, 5, 10, 30))
+EMAIL_DELIVERY_LAG = Histogram(
+    "email_delivery_lag_seconds",
+    "Время от постановки письма в очередь до отправки",
+    buckets=(.1, .25, .5, 1, 2.5, 5, 10, 30, 60, 300, 900))
+EMAIL_OUTBOX_RESULTS = Counter(
+    "email_outbox_deliveries_total",
+    "Попытки доставки из очереди писем: sent, retry или dead",
+    ["result"])
+EMAIL_OUTBOX_DEPTH = Gauge(
+    "email_outbox_depth",
+    "Очередь писем: queued, pending (прочитаны, не отправлены) или dead",
+    ["queue"], multiprocess_mode="max")
+EMAIL_OUTBOX_OLDEST_AGE = Gauge(
+    "email_outbox_oldest_age_seconds",
+    "Возраст самого старого письма в очереди",
+    multiprocess_mode="max")
+MIDDLEWARE_LATENCY = Histogram(
+    "middleware_duration_seconds",
+    "Время слоя middleware до отправки заголовков ответа (MIDDLEWARE_TIMING)",
+    ["layer"],
+    buckets=(.00001, .00005, .0001, .00025, .0005, .001, .005, .01, .05))
+HASH_LATENCY = Histogram(
+    "password_hash_duration_seconds",
+    "Время хеширования и проверки пароля с ожиданием в очереди",
+    ["operation"],
+    buckets=(.01, .025, .05, .1, .25, .5, 1, 2.5, 5))
+
+TOKEN_CACHE_LOOKUPS = Counter(
+    "token_cache_lookups_total",
+    "Обращения к кешу проверенных токенов: hit или miss",
+    ["result"])
+REFRESH_EXCHANGES = Counter(
+    "refresh_token_exchanges_total",
+    "Обмен refresh токенов: rotated, invalid или reused",
+    ["result"])
+AVAILABILITY_CHECKS = Counter(
+    "availability_checks_total",
+    "Проверки /registration/availability: ответ фильтра (filter) "
+    "или запрос к базе (database)",
+    ["field", "source"])
+TRUSTED_LOGINS = Counter(
+    "trusted_device_logins_total",
+    "Входы с доверенного устройства без кода с почты")
+
+
+class Children(dict):
+    """
+    Дочерние метрики по значениям меток.
+
+    labels() каждый раз проверяет метки и берёт блокировку, здесь
+    после первого обращения остаётся только поиск в словаре.
+    Ключ - значение метки или кортеж значений.
+    """
+
+    def __init__(self, metric) -> None:
+        super().__init__()
+        self.metric = metric
+
+    def __missing__(self, key):
+        values = key if isinstance(key, tuple) else (key,)
+        child = self[key] = self.metric.labels(*map(str, values))
+        return child
+
+
+def timed(histogram: Histogram, *labels: str):
+    """
+    Декоратор асинхронной функции, замеряющий время её выполнения.
+
+    Args:
+
+        histogram: Гистограмма для замеров.
+        labels: Значения меток гистограммы.
+    """
+    child = histogram.labels(*labels)
+
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                child.observe(time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware с замером времени HTTP запросов.
+
+    Метка route - шаблон пути маршрута FastAPI, запросы мимо
+    маршрутов попадают в "unmatched". observer(route, status, seconds)
+    вызывается для каждого запроса к известному маршруту.
+    """
+
+    def __init__(self, app,
+                 observer: Optional[Callable[[str, int, float],
+                                             None]] = None) -> None:
+        self.app = app
+        self.observer = observer
+        self.children = Children(REQUEST_LATENCY)
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status_code = 500
+
+        async def send_wrapper(message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            REQUESTS_IN_FLIGHT.dec()
+            elapsed = time.perf_counter() - started
+            route = scope.get("route")
+            path = route.path if route is not None else "unmatched"
+            self.children[scope["method"], path, status_code].observe(
+                elapsed)
+            if self.observer is not None and route is not None:
+                self.observer(path, status_code, elapsed)
+
+
+class LayerTimer:
+    """
+    Диагностический замер слоёв middleware (MIDDLEWARE_TIMING).
+
+    Ставится перед каждым слоем и перед приложением. Каждый замер -
+    время от входа в слой до прохождения через него заголовков
+    ответа; разность соседних замеров - время, добавленное слоем.
+    Внешний замер (report=True) пишет результат в заголовок
+    Server-Timing и в метрику middleware_duration_seconds.
+    """
+
+    def __init__(self, app, name: str, report: bool = False) -> None:
+        self.app = app
+        self.name = name
+        self.report = report
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        # Замеры от внутреннего слоя к внешнему.
+        timings = scope.setdefault("layer_timings", [])
+        started = time.perf_counter()
+
+        async def send_wrapper(message) -> None:
+            if message["type"] == "http.response.start":
+                timings.append((self.name, time.perf_counter() - started))
+                if self.report:
+                    message["headers"] = [*message.get("headers", ()),
+                                          (b"server-timing",
+                                           self.server_timing(timings))]
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+    @staticmethod
+    def server_timing(timings: list) -> bytes:
+        layers, inner = [], 0.0
+        for name, elapsed in timings:
+            own = elapsed - inner
+            inner = elapsed
+            MIDDLEWARE_LATENCY.labels(name).observe(own)
+            layers.append(f"{name};dur={own * 1000:.3f}")
+        return ", ".join(reversed(layers)).encode("latin-1")
+
+
+def collector_registry() -> CollectorRegistry:
+    """Реестр метрик процесса или всех воркеров (multiprocess)."""
+    if PROMETHEUS_MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+
+def render() -> Tuple[bytes, str]:
+    """Текст метрик для /metrics и его Content-Type."""
+    return generate_latest(collector_registry()), CONTENT_TYPE_LATEST
+
+
+def serve(port: int) -> None:
+    """HTTP сервер метрик в фоновом потоке для процессов без API."""
+    start_http_server(port, registry=collector_registry())
+
+
+def mark_process_dead(pid: int) -> None:
+    """Удаление live-показателей завершившегося воркера."""
+    if PROMETHEUS_MULTIPROC_DIR:
+        multiprocess.mark_process_dead(pid)
@@ -0,0 +1,182 @@
+"""
+Трассировка Sentry: адаптивная выборка, спаны и агрегирование
+повторяющихся сообщений.
+"""
+
+import asyncio
+import functools
+import time
+from collections import Counter
+from typing import Dict, Iterable, Optional
+
+import sentry_sdk
+from sentry_sdk.integrations.fastapi import FastApiIntegration
+from sentry_sdk.integrations.redis import RedisIntegration
+from sentry_sdk.integrations.sqlalchemy import SqlalchemyIntegration
+from sentry_sdk.integrations.starlette import StarletteIntegration
+
+from config import (SENTRY_AGGREGATE_INTERVAL, SENTRY_DNS,
+                    TRACES_BOOST_SECONDS, TRACES_SAMPLE_RATE, TRACES_SLOW_MS)
+
+
+class AdaptiveSampler:
+    """
+    traces_sampler для Sentry.
+
+    Запросы трассируются с базовой долей rate. Маршрут, на котором
+    случилась ошибка (событие Sentry или ответ 5xx) или запрос
+    дольше slow_ms, следующие boost секунд трассируется целиком.
+    Решение принимается в начале запроса, поэтому полностью
+    попадают повторы медленных и ошибочных запросов, сами ошибки
+    отправляются в Sentry всегда. Решение родительской трассы
+    (заголовок sentry-trace) сохраняется, пути из ignore
+    не трассируются.
+
+    Маршрут определяется по пути запроса: маршруты с параметрами
+    в пути ускорения не получают.
+    """
+
+    def __init__(self, rate: float, slow_ms: float, boost: float,
+                 ignore: Iterable[str] = ("/metrics", "/health/live",
+                                          "/health/ready")) -> None:
+        self.rate = rate
+        self.slow = slow_ms / 1000
+        self.boost = boost
+        self.ignore = frozenset(ignore)
+        self._boosted: Dict[str, float] = {}
+
+    def __call__(self, context: dict) -> float:
+        parent = context.get("parent_sampled")
+        if parent is not None:
+            return float(parent)
+        scope = context.get("asgi_scope")
+        path = (scope["path"] if scope
+                else context["transaction_context"].get("name"))
+        if path in self.ignore:
+            return 0.0
+        until = self._boosted.get(path)
+        if until is not None:
+            if until > time.monotonic():
+                return 1.0
+            del self._boosted[path]
+        return self.rate
+
+    def boost_route(self, route: str) -> None:
+        self._boosted[route] = time.monotonic() + self.boost
+
+    def record(self, route: str, status: int, seconds: float) -> None:
+        """Учёт завершённого запроса (вызывает MetricsMiddleware)."""
+        if status >= 500 or seconds >= self.slow:
+            self.boost_route(route)
+
+    def before_send(self, event: dict, hint: dict) -> dict:
+        """before_send для Sentry: ошибка ускоряет свой маршрут."""
+        route = event.get("transaction")
+        if route and event.get("level", "error") in ("error", "fatal"):
+            self.boost_route(route)
+        return event
+
+
+def traced(op: str, description: Optional[str] = None):
+    """
+    Декоратор асинхронной функции, создающий спан Sentry.
+
+    Вне трассируемого запроса функция вызывается без спана.
+
+    Args:
+
+        op: Тип операции спана (например, smtp.send).
+        description: Описание спана, по умолчанию имя функции.
+    """
+    def decorator(func):
+        name = description or func.__qualname__
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            if sentry_sdk.get_current_span() is None:
+                return await func(*args, **kwargs)
+            with sentry_sdk.start_span(op=op, description=name):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class MessageAggregator:
+    """
+    Агрегирование одинаковых сообщений Sentry в процессе.
+
+    capture() только считает сообщение, раз в interval секунд
+    и при остановке в Sentry уходит одно событие на каждый текст
+    с числом повторов в extra "count". Различных текстов
+    за интервал хранится не больше max_keys.
+    """
+
+    def __init__(self, interval: float, max_keys: int = 1000) -> None:
+        self.interval = interval
+        self.max_keys = max_keys
+        self._counts: Counter = Counter()
+        self._task: Optional[asyncio.Task] = None
+
+    def capture(self, message: str) -> None:
+        if message in self._counts or len(self._counts) < self.max_keys:
+            self._counts[message] += 1
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        """Остановка фоновой задачи и отправка накопленного."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        self.flush()
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._counts:
+            return
+        batch, self._counts = self._counts, Counter()
+        for message, count in batch.items():
+            with sentry_sdk.new_scope() as scope:
+                scope.set_extra("count", count)
+                scope.set_extra("interval_seconds", self.interval)
+                scope.fingerprint = ["aggregated", message]
+                sentry_sdk.capture_message(message)
+
+
+sampler = AdaptiveSampler(TRACES_SAMPLE_RATE, slow_ms=TRACES_SLOW_MS,
+                          boost=TRACES_BOOST_SECONDS)
+sentry_messages = MessageAggregator(SENTRY_AGGREGATE_INTERVAL)
+
+
+def init_sentry() -> None:
+    """
+    Подключение Sentry.
+
+    Вызывается в lifespan, то есть в каждом воркере после fork,
+    а не при импорте: фоновый поток отправки не создаётся в мастере
+    gunicorn и импорт приложения не зависит от сети. Без SENTRY_DNS
+    ничего не делает.
+    """
+    if not SENTRY_DNS:
+        return
+    sentry_sdk.init(
+        dsn=SENTRY_DNS,
+        integrations=[
+            StarletteIntegration(),
+            FastApiIntegration(),
+            RedisIntegration(),
+            SqlalchemyIntegration(),
+        ],
+        # Только перечисленные интеграции: автоматическая
+        # AsyncPGIntegration дублировала бы спаны SqlalchemyIntegration.
+        auto_enabling_integrations=False,
+        traces_sampler=sampler,
+        before_send=sampler.before_send,
+    )
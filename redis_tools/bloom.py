@@ -0,0 +1,45 @@
+"""Фильтр Блума в памяти процесса."""
+
+import hashlib
+import math
+
+
+class BloomFilter:
+    """
+    Компактное множество без ложноотрицательных ответов.
+
+    `item in bloom` == False означает, что элемент точно не добавлялся;
+    True - что добавлялся с вероятностью ошибки около error_rate,
+    пока добавлено не больше capacity элементов.
+    """
+
+    def __init__(self, capacity: int, error_rate: float) -> None:
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = max(8, int(-capacity * math.log(error_rate)
+                               / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item: str):
+        # Двойное хеширование: k позиций из двух 64-битных значений.
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.hashes):
+            yield (first + i * second) % self.size
+
+    def add(self, item: str) -> None:
+        for position in self._positions(item):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        return all(self._bits[position >> 3] & (1 << (position & 7))
+                   for position in self._positions(item))
+
+    @property
+    def saturated(self) -> bool:
+        """Добавлено больше расчётного числа элементов."""
+        return self.count > self.capacity
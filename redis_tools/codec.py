@@ -0,0 +1,15 @@
+"""Сериализация данных сессий в Redis через orjson."""
+
+from typing import Any
+
+import orjson
+
+
+def dumps(value: Any) -> bytes:
+    """Объект в JSON байты для записи в Redis."""
+    return orjson.dumps(value)
+
+
+def loads(data: bytes) -> Any:
+    """JSON байты из Redis в объект, без промежуточной строки."""
+    return orjson.loads(data)
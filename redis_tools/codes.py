@@ -0,0 +1,154 @@
+"""
+Одноразовые коды подтверждения в Redis.
+
+Запуск очистки старых ключей без TTL (по умолчанию только отчёт):
+
+    python -m redis_tools.codes --sweep [--delete]
+"""
+
+import argparse
+import asyncio
+from typing import Optional, Union
+
+from redis.exceptions import ResponseError
+
+from config import (CODE_TTL_AUTHORIZATION, CODE_TTL_RECOVERY,
+                    CODE_TTL_REGISTRATION, CODE_TTL_RESET)
+from redis_tools.redis_tools import SessionStore, session_store
+
+
+# Пространства ключей потоков и время жизни их записей в секундах.
+FLOWS = {
+    "reg": CODE_TTL_REGISTRATION,
+    "auth": CODE_TTL_AUTHORIZATION,
+    "recover": CODE_TTL_RECOVERY,
+    "reset": CODE_TTL_RESET,
+}
+
+# Префиксы ключей, которыми управляет приложение. Всё остальное
+# строковое и без TTL считается осиротевшим наследием.
+MANAGED_PREFIXES = (b"otc:", b"revoked:", b"session:", b"fastapi-cache")
+
+# GETDEL появился в Redis 6.2, для старых серверов - тот же результат
+# одним вызовом скрипта.
+GETDEL_SCRIPT = """
+local value = redis.call('GET', KEYS[1])
+if value then redis.call('DEL', KEYS[1]) end
+return value
+"""
+
+
+class OneTimeCodeStore:
+    """
+    Хранилище одноразовых кодов с обязательным TTL.
+
+    У каждого потока (регистрация, вход, восстановление пароля) своё
+    пространство ключей otc:<поток>:<код> и своё время жизни.
+    Код читается и удаляется одной атомарной операцией, поэтому
+    воспользоваться им можно ровно один раз.
+    """
+
+    def __init__(self, store: SessionStore, flows: dict) -> None:
+        self.store = store
+        self.flows = flows
+        self._getdel_supported = True
+        self._getdel_script = None
+
+    @staticmethod
+    def key(flow: str, code: str) -> str:
+        return f"otc:{flow}:{code}"
+
+    async def issue(self, flow: str, code: str,
+                    payload: Union[str, bytes]) -> None:
+        """Сохранение данных под кодом на время жизни потока."""
+        await self.store.client.set(self.key(flow, code), payload,
+                                    ex=self.flows[flow])
+
+    async def consume(self, flow: str, code: str) -> Optional[bytes]:
+        """Получение данных по коду с одновременным удалением кода."""
+        if flow not in self.flows:
+            raise KeyError(flow)
+        key = self.key(flow, code)
+        client = self.store.client
+        if self._getdel_supported:
+            try:
+                return await client.getdel(key)
+            except ResponseError:
+                self._getdel_supported = False
+        if self._getdel_script is None:
+            self._getdel_script = client.register_script(GETDEL_SCRIPT)
+        return await self._getdel_script(keys=[key])
+
+    async def sweep(self, delete: bool = False, batch: int = 500,
+                    pause: float = 0.01) -> dict:
+        """
+        Поиск и удаление осиротевших ключей старого формата.
+
+        Args:
+
+            delete (bool): Удалять найденные ключи (иначе только отчёт).
+            batch (int): Размер пачки SCAN и удаления.
+            pause (float): Пауза между пачками, чтобы не занимать Redis.
+
+        Returns:
+
+            dict: Число просмотренных и найденных ключей, примеры ключей.
+        """
+        client = self.store.client
+        report = {"scanned": 0, "orphaned": 0, "deleted": 0, "sample": []}
+        keys = []
+        # scan_iter в Redis Cluster обходит все мастера.
+        async for key in client.scan_iter(count=batch):
+            if not key.startswith(MANAGED_PREFIXES):
+                keys.append(key)
+            if len(keys) >= batch:
+                await self._sweep_batch(client, keys, delete, report)
+                keys = []
+                await asyncio.sleep(pause)
+        await self._sweep_batch(client, keys, delete, report)
+        return report
+
+    @staticmethod
+    async def _sweep_batch(client, keys: list, delete: bool,
+                           report: dict) -> None:
+        report["scanned"] += len(keys)
+        if not keys:
+            return
+        async with client.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.type(key)
+                pipe.ttl(key)
+            info = await pipe.execute()
+        orphans = [key for key, kind, ttl
+                   in zip(keys, info[::2], info[1::2])
+                   if kind == b"string" and ttl == -1]
+        report["orphaned"] += len(orphans)
+        room = 20 - len(report["sample"])
+        report["sample"] += [key.decode(errors="replace")
+                             for key in orphans[:room]]
+        if delete and orphans:
+            report["deleted"] += await client.unlink(*orphans)
+
+
+codes = OneTimeCodeStore(session_store, FLOWS)
+
+
+async def main(delete: bool) -> None:
+    await session_store.connect()
+    try:
+        print(await codes.sweep(delete=delete))
+    finally:
+        await session_store.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Одноразовые коды")
+    parser.add_argument("--sweep", action="store_true",
+                        help="найти строковые ключи без TTL")
+    parser.add_argument("--delete", action="store_true",
+                        help="удалить найденные ключи")
+    args = parser.parse_args()
+    if args.sweep:
+        asyncio.run(main(args.delete))
+    else:
+        parser.print_help()
@@ -0,0 +1,186 @@
+"""Очередь исходящих писем на Redis Streams."""
+
+import time
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+from redis.exceptions import ResponseError
+
+from config import (EMAIL_OUTBOX_BACKOFF, EMAIL_OUTBOX_BACKOFF_MAX,
+                    EMAIL_OUTBOX_DEAD_MAXLEN, EMAIL_OUTBOX_GROUP,
+                    EMAIL_OUTBOX_STREAM)
+from redis_tools.redis_tools import SessionStore, session_store
+
+
+# Запись потока: id и поля (to, message).
+Entry = Tuple[bytes, Dict[bytes, bytes]]
+
+
+def entry_age(entry_id: bytes) -> float:
+    """Секунды с добавления записи (время из её id)."""
+    return time.time() - int(entry_id.split(b"-", 1)[0]) / 1000
+
+
+def _next_id(entry_id: bytes) -> str:
+    """Следующий возможный id потока (начало следующей страницы)."""
+    ms, seq = entry_id.decode().split("-")
+    return f"{ms}-{int(seq) + 1}"
+
+
+class EmailOutbox:
+    """
+    Поток готовых писем и группа потребителей-отправителей.
+
+    Запросы добавляют письмо в поток stream и сразу отвечают,
+    отправляет его процесс backend.email_worker. Запись остаётся
+    в потоке до успешной отправки: прочитанные, но не подтверждённые
+    записи (упавший воркер, ошибка SMTP) забирает другой потребитель
+    после паузы backoff * 2^(попытка - 1), но не больше backoff_max.
+    Число повторов записи хранится в хеше <stream>:attempts, письма
+    без шансов на доставку переносятся в поток <stream>:dead.
+
+    Все ключи очереди под одним хеш-тегом (по умолчанию {outbox}),
+    поэтому перенос выполняется одной транзакцией и в Redis Cluster.
+    """
+
+    def __init__(self, store: SessionStore, stream: str, group: str,
+                 backoff: float, backoff_max: float,
+                 dead_maxlen: int) -> None:
+        self.store = store
+        self.stream = stream
+        self.group = group
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.dead_maxlen = dead_maxlen
+        self.attempts_key = f"{stream}:attempts"
+        self.dead_stream = f"{stream}:dead"
+
+    async def enqueue(self, email: str, message: bytes) -> str:
+        """Письмо в очередь, возвращает id записи."""
+        entry_id = await self.store.client.xadd(
+            self.stream, {"to": email, "message": message})
+        return entry_id.decode()
+
+    async def ensure_group(self) -> None:
+        """Группа потребителей с чтением потока с начала."""
+        try:
+            await self.store.client.xgroup_create(
+                self.stream, self.group, id="0", mkstream=True)
+        except ResponseError as ex:
+            if "BUSYGROUP" not in str(ex):
+                raise
+
+    async def read(self, consumer: str, count: int,
+                   block_ms: int) -> List[Entry]:
+        """Новые записи для consumer, ожидание до block_ms."""
+        response = await self.store.client.xreadgroup(
+            self.group, consumer, {self.stream: ">"}, count=count,
+            block=block_ms)
+        return response[0][1] if response else []
+
+    def delay(self, failures: int) -> float:
+        """Пауза перед повтором после failures неудачных попыток."""
+        return min(self.backoff * 2 ** max(failures - 1, 0),
+                   self.backoff_max)
+
+    async def claim_due(self, consumer: str,
+                        count: int) -> List[Tuple[Entry, int]]:
+        """
+        Записи других попыток, пауза которых истекла.
+
+        Список ожидающих записей просматривается страницами от начала,
+        пока не набрано count записей или список не кончился: записи,
+        чья пауза ещё идёт (например, после сбоя SMTP), не закрывают
+        собой более поздние. XCLAIM с min_idle_time передаёт запись
+        только одному потребителю: у остальных её время простоя уже
+        сброшено.
+
+        Returns:
+
+            list: (запись, номер попытки) забранных записей.
+        """
+        client = self.store.client
+        page = max(count, 100)
+        start = "-"
+        claimed = []
+        while len(claimed) < count:
+            pending = await client.xpending_range(
+                self.stream, self.group, start, "+", page,
+                idle=int(self.backoff * 1000))
+            if not pending:
+                break
+            ids = [item["message_id"] for item in pending]
+            retries = await client.hmget(self.attempts_key, ids)
+            by_delay = defaultdict(list)
+            for item, retried in zip(pending, retries):
+                # Неудачных попыток на одну больше, чем повторов.
+                delay = self.delay(int(retried or 0) + 1) * 1000
+                # Не все реализации XPENDING отдают время простоя,
+                # тогда решает XCLAIM.
+                if item.get("time_since_delivered", delay) >= delay:
+                    by_delay[delay].append(item["message_id"])
+            for delay, entry_ids in by_delay.items():
+                claimed += await client.xclaim(
+                    self.stream, self.group, consumer,
+                    min_idle_time=int(delay),
+                    message_ids=entry_ids[:count - len(claimed)])
+                if len(claimed) >= count:
+                    break
+            if len(pending) < page:
+                break
+            start = _next_id(ids[-1])
+        if not claimed:
+            return []
+        async with client.pipeline(transaction=False) as pipe:
+            for entry_id, _ in claimed:
+                pipe.hincrby(self.attempts_key, entry_id, 1)
+            retries = await pipe.execute()
+        return [(entry, retry + 1) for entry, retry in zip(claimed, retries)]
+
+    async def ack(self, entry_id: bytes) -> None:
+        """Письмо отправлено: запись удаляется из очереди."""
+        async with self.store.client.pipeline(transaction=True) as pipe:
+            pipe.xack(self.stream, self.group, entry_id)
+            pipe.xdel(self.stream, entry_id)
+            pipe.hdel(self.attempts_key, entry_id)
+            await pipe.execute()
+
+    async def bury(self, entry: Entry, attempts: int, error: str) -> None:
+        """Перенос письма в поток недоставленных."""
+        entry_id, fields = entry
+        async with self.store.client.pipeline(transaction=True) as pipe:
+            pipe.xadd(self.dead_stream,
+                      {**fields, "id": entry_id, "attempts": attempts,
+                       "error": error[:1000]},
+                      maxlen=self.dead_maxlen, approximate=True)
+            pipe.xack(self.stream, self.group, entry_id)
+            pipe.xdel(self.stream, entry_id)
+            pipe.hdel(self.attempts_key, entry_id)
+            await pipe.execute()
+
+    async def depth(self) -> Dict[str, float]:
+        """
+        Состояние очереди.
+
+        Returns:
+
+            dict: queued - записей в потоке (новые и ждущие повтора),
+            pending - прочитанных и не подтверждённых, dead -
+            недоставленных, oldest_age - возраст самой старой записи
+            в секундах.
+        """
+        async with self.store.client.pipeline(transaction=False) as pipe:
+            pipe.xlen(self.stream)
+            pipe.xpending(self.stream, self.group)
+            pipe.xlen(self.dead_stream)
+            pipe.xrange(self.stream, count=1)
+            queued, pending, dead, oldest = await pipe.execute()
+        return {"queued": queued, "pending": pending["pending"],
+                "dead": dead,
+                "oldest_age": entry_age(oldest[0][0]) if oldest else 0.0}
+
+
+outbox = EmailOutbox(session_store, EMAIL_OUTBOX_STREAM, EMAIL_OUTBOX_GROUP,
+                     backoff=EMAIL_OUTBOX_BACKOFF,
+                     backoff_max=EMAIL_OUTBOX_BACKOFF_MAX,
+                     dead_maxlen=EMAIL_OUTBOX_DEAD_MAXLEN)
@@ -0,0 +1,159 @@
+"""Ограничение частоты запросов скользящим окном в Redis."""
+
+import math
+import time
+import uuid
+from typing import Sequence, Tuple
+
+from fastapi import HTTPException, Request, status
+
+from config import (RATE_LIMIT_ENABLED, RATE_LIMIT_IP, RATE_LIMIT_ROUTE,
+                    RATE_LIMIT_TARGET, RATE_LIMIT_TRUST_PROXY,
+                    RATE_LIMIT_WINDOW)
+from redis_tools.redis_tools import SessionStore, session_store
+
+
+# Скользящее окно по журналу запросов (ZSET со временем запроса).
+# Все бюджеты проверяются и списываются атомарно: запрос либо
+# учитывается во всех окнах, либо ни в одном.
+# KEYS: ключи бюджетов; ARGV: now_ms, member, затем limit, window_ms
+# для каждого ключа. Возвращает 0 или сколько мс ждать.
+SLIDING_WINDOW_SCRIPT = """
+local now = tonumber(ARGV[1])
+local retry = 0
+for i, key in ipairs(KEYS) do
+    local limit = tonumber(ARGV[1 + i * 2])
+    local window = tonumber(ARGV[2 + i * 2])
+    redis.call('ZREMRANGEBYSCORE', key, '-inf', now - window)
+    if redis.call('ZCARD', key) >= limit then
+        local oldest = redis.call('ZRANGE', key, 0, 0, 'WITHSCORES')
+        local wait = tonumber(oldest[2]) + window - now
+        if wait > retry then retry = wait end
+    end
+end
+if retry > 0 then return retry end
+for i, key in ipairs(KEYS) do
+    redis.call('ZADD', key, now, ARGV[2])
+    redis.call('PEXPIRE', key, tonumber(ARGV[2 + i * 2]))
+end
+return 0
+"""
+
+
+class LocalPrefilter:
+    """
+    Счётчик запросов с одного IP внутри процесса.
+
+    Окно фиксированное. Клиент, сделавший только на этом воркере
+    больше limit попыток за окно, заведомо флудит: такой запрос
+    отклоняется без обращения к Redis.
+    """
+
+    def __init__(self, limit: int, window: float,
+                 max_keys: int = 100000) -> None:
+        self.limit = limit
+        self.window = window
+        self.max_keys = max_keys
+        self._counters = {}
+
+    def hit(self, key: str) -> float:
+        """Учёт запроса. Возвращает 0 или сколько секунд ждать."""
+        now = time.monotonic()
+        started, count = self._counters.get(key, (now, 0))
+        if now - started >= self.window:
+            started, count = now, 0
+        if count >= self.limit:
+            return started + self.window - now
+        if len(self._counters) >= self.max_keys:
+            self._counters.clear()
+        self._counters[key] = (started, count + 1)
+        return 0.0
+
+
+class RateLimiter:
+    """
+    Зависимость FastAPI с отдельными бюджетами на IP клиента,
+    на цель запроса (логин/почта из тела) и на маршрут целиком.
+
+    При превышении любого бюджета отвечает 429 с Retry-After.
+    """
+
+    def __init__(self, route: str, target_fields: Sequence[str] = (),
+                 store: SessionStore = session_store,
+                 window: float = RATE_LIMIT_WINDOW,
+                 ip_limit: int = RATE_LIMIT_IP,
+                 target_limit: int = RATE_LIMIT_TARGET,
+                 route_limit: int = RATE_LIMIT_ROUTE) -> None:
+        self.route = route
+        self.target_fields = target_fields
+        self.store = store
+        self.window_ms = int(window * 1000)
+        self.ip_limit = ip_limit
+        self.target_limit = target_limit
+        self.route_limit = route_limit
+        self.prefilter = LocalPrefilter(ip_limit, window)
+        self._script = None
+
+    @staticmethod
+    def client_ip(request: Request) -> str:
+        if RATE_LIMIT_TRUST_PROXY:
+            forwarded = request.headers.get("x-forwarded-for")
+            if forwarded:
+                return forwarded.split(",")[0].strip()
+        return request.client.host if request.client else "unknown"
+
+    async def _targets(self, request: Request) -> Sequence[str]:
+        if not self.target_fields:
+            return ()
+        try:
+            # Тело уже разобрано FastAPI, json() берётся из кеша запроса.
+            body = await request.json()
+        except ValueError:
+            return ()
+        if not isinstance(body, dict):
+            return ()
+        return [str(body[field]).strip().lower()
+                for field in self.target_fields if body.get(field)]
+
+    def _budgets(self, ip: str,
+                 targets: Sequence[str]) -> Sequence[Tuple[str, int]]:
+        # Хеш-тег маршрута: в Redis Cluster все ключи скрипта должны
+        # быть в одном слоте. Бюджет маршрута всё равно общий ключ.
+        prefix = f"rl:{{{self.route}}}"
+        budgets = [(f"{prefix}:ip:{ip}", self.ip_limit),
+                   (f"{prefix}:all", self.route_limit)]
+        budgets += [(f"{prefix}:target:{target}", self.target_limit)
+                    for target in targets]
+        return budgets
+
+    @staticmethod
+    def _reject(retry_after: float) -> HTTPException:
+        return HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Слишком много запросов, попробуйте позже",
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))})
+
+    async def check(self, ip: str, targets: Sequence[str]) -> float:
+        """Списание запроса со всех бюджетов, 0 или секунды ожидания."""
+        wait = self.prefilter.hit(ip)
+        if wait:
+            return wait
+        if self._script is None:
+            self._script = self.store.client.register_script(
+                SLIDING_WINDOW_SCRIPT)
+        budgets = self._budgets(ip, targets)
+        now_ms = int(time.time() * 1000)
+        args = [now_ms, f"{now_ms}-{uuid.uuid4().hex[:8]}"]
+        for _, limit in budgets:
+            args += [limit, self.window_ms]
+        wait_ms = await self._script(keys=[key for key, _ in budgets],
+                                     args=args)
+        return int(wait_ms) / 1000
+
+    async def __call__(self, request: Request) -> None:
+        if not RATE_LIMIT_ENABLED:
+            return
+        wait = await self.check(self.client_ip(request),
+                                await self._targets(request))
+        if wait:
+            raise self._reject(wait)
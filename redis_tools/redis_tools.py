@@ -1,27 +1,387 @@
-from collections.abc import AsyncIterator
-from contextlib import asynccontextmanager
+import random
+import time
+from datetime import timedelta
+from typing import Iterable, List, Optional, Tuple, Union
 
-from fastapi import FastAPI
+from redis import asyncio as aioredis
+from redis.asyncio.cluster import ClusterNode, ClusterPipeline, RedisCluster
+from redis.asyncio.connection import HiredisParser, PythonParser, parse_url
+from redis.asyncio.sentinel import Sentinel, SentinelConnectionPool
+from redis.utils import HIREDIS_AVAILABLE
 
-from fastapi_cache import FastAPICache
-from fastapi_cache.backends.redis import RedisBackend
-from fastapi_cache.decorator import cache
+from config import (REDIS_CLUSTER_NODES, REDIS_MAX_CONNECTIONS, REDIS_MODE,
+                    REDIS_POOL_TIMEOUT, REDIS_SENTINEL_MASTER,
+                    REDIS_SENTINELS, REDIS_SOCKET_TIMEOUT, REDIS_URL)
+from metrics.metrics import REDIS_LATENCY, Children
+from redis_tools.token_cache import token_key
 
-from redis import asyncio as aioredis
 
-from config import REDIS_URL
+_redis_latency = Children(REDIS_LATENCY)
+
+
+class TimedPipeline(aioredis.client.Pipeline):
+    """Конвейер Redis, замеряющий время выполнения целиком."""
+
+    async def execute(self, raise_on_error: bool = True):
+        started = time.perf_counter()
+        try:
+            return await super().execute(raise_on_error)
+        finally:
+            _redis_latency["PIPELINE"].observe(
+                time.perf_counter() - started)
+
+
+class TimedRedis(aioredis.Redis):
+    """Клиент Redis с замером времени каждой команды по её имени."""
+
+    async def execute_command(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        finally:
+            _redis_latency[args[0]].observe(time.perf_counter() - started)
+
+    def pipeline(self, transaction: bool = True,
+                 shard_hint: Optional[str] = None) -> TimedPipeline:
+        return TimedPipeline(self.connection_pool, self.response_callbacks,
+                             transaction, shard_hint)
+
+
+class TimedClusterPipeline(ClusterPipeline):
+    """Конвейер Redis Cluster: команды группируются по узлам."""
+
+    async def execute(self, raise_on_error: bool = True,
+                      allow_redirections: bool = True):
+        started = time.perf_counter()
+        try:
+            return await super().execute(raise_on_error, allow_redirections)
+        finally:
+            _redis_latency["PIPELINE"].observe(
+                time.perf_counter() - started)
+
+
+class TimedRedisCluster(RedisCluster):
+    """Клиент Redis Cluster с замером времени команд."""
+
+    async def execute_command(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await super().execute_command(*args, **kwargs)
+        finally:
+            _redis_latency[args[0]].observe(time.perf_counter() - started)
+
+    def pipeline(self, transaction: Optional[bool] = None,
+                 shard_hint: Optional[str] = None) -> TimedClusterPipeline:
+        return TimedClusterPipeline(self)
+
+    async def publish(self, channel: str, message: Union[str, bytes]) -> int:
+        """PUBLISH, в асинхронном клиенте кластера его нет."""
+        return await self.execute_command("PUBLISH", channel, message,
+                                          target_nodes=self.RANDOM)
+
+    def pubsub(self, **kwargs) -> aioredis.client.PubSub:
+        """
+        Подписка через случайный мастер кластера.
+
+        PUBLISH в кластере рассылается всем узлам, поэтому подписки
+        на одном узле достаточно. Соединение подписки закрывается
+        вместе с ней.
+        """
+        node = random.choice(self.get_primaries())
+        connection_kwargs = {key: value for key, value
+                             in node.connection_kwargs.items()
+                             if key != "parser_class"}
+        return aioredis.client.PubSub(
+            aioredis.ConnectionPool(**connection_kwargs), **kwargs)
+
+
+class SentinelBlockingPool(SentinelConnectionPool,
+                           aioredis.BlockingConnectionPool):
+    """
+    Пул соединений с мастером из Sentinel.
+
+    Как и в режиме single, при исчерпании пула запрос ждёт свободное
+    соединение timeout секунд, а не получает ошибку сразу.
+    """
+
+
+def user_tag(login: str) -> str:
+    """
+    Хеш-тег пользователя для имён ключей.
+
+    Redis Cluster выбирает слот только по части имени в {}, поэтому
+    ключи одного пользователя лежат на одном узле и доступны
+    многоключевым командам, транзакциям и скриптам.
+    """
+    return "{" + login + "}"
+
+
+def _address(node: str) -> Tuple[str, int]:
+    host, _, port = node.rpartition(":")
+    return host, int(port)
+
+
+class SessionStore:
+    """
+    Общее асинхронное хранилище сессий на Redis.
+
+    Один экземпляр на процесс: пул соединений ограничен
+    REDIS_MAX_CONNECTIONS, при исчерпании пула запрос ждёт свободное
+    соединение не дольше REDIS_POOL_TIMEOUT секунд. Ответы Redis
+    разбираются через hiredis, если он установлен. Время команд
+    пишется в метрику redis_command_duration_seconds.
+    Пул открывается и закрывается в lifespan приложения.
+
+    mode выбирает топологию:
+
+        single   - один сервер по url;
+        sentinel - мастер service_name, адрес которого сообщают
+                   sentinels; после failover клиент переподключается
+                   к новому мастеру;
+        cluster  - Redis Cluster: команды идут на узел слота ключа,
+                   конвейеры разбиваются по узлам, пул соединений
+                   (max_connections) у каждого узла свой. Конвейеры
+                   выполняются без MULTI: асинхронный клиент кластера
+                   транзакций не поддерживает.
+    """
+
+    MODES = ("single", "sentinel", "cluster")
+
+    def __init__(self, url: str, max_connections: int,
+                 pool_timeout: float, socket_timeout: float,
+                 mode: str = "single", sentinels: Iterable[str] = (),
+                 service_name: str = "mymaster",
+                 cluster_nodes: Iterable[str] = ()) -> None:
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown Redis mode: {mode}")
+        self.url = url
+        self.max_connections = max_connections
+        self.pool_timeout = pool_timeout
+        self.socket_timeout = socket_timeout
+        self.mode = mode
+        self.sentinels = [_address(node) for node in sentinels]
+        self.service_name = service_name
+        self.cluster_nodes = [_address(node) for node in cluster_nodes]
+        self._pool: Optional[aioredis.BlockingConnectionPool] = None
+        self._client: Optional[aioredis.Redis] = None
+        self._sentinel: Optional[Sentinel] = None
+
+    async def connect(self, client: Optional[aioredis.Redis] = None) -> None:
+        """
+        Создание пула соединений и клиента.
+
+        Args:
+
+            client: Готовый клиент вместо пула по url
+            (например, fakeredis в бенчмарках).
+        """
+        if self._client is not None:
+            return
+        if client is not None:
+            self._client = client
+            return
+        if self.mode == "cluster":
+            self._client = self._connect_cluster()
+            return
+        if self.mode == "sentinel":
+            self._client = self._connect_sentinel()
+            return
+        self._pool = aioredis.BlockingConnectionPool.from_url(
+            self.url,
+            max_connections=self.max_connections,
+            timeout=self.pool_timeout,
+            socket_timeout=self.socket_timeout,
+            parser_class=(HiredisParser if HIREDIS_AVAILABLE
+                          else PythonParser),
+        )
+        self._client = TimedRedis(connection_pool=self._pool)
+
+    def _credentials(self, *keys: str) -> dict:
+        """Значения keys из url (пользователь, пароль, база)."""
+        options = parse_url(self.url)
+        return {key: options[key] for key in keys
+                if options.get(key) is not None}
+
+    def _connect_cluster(self) -> TimedRedisCluster:
+        options = parse_url(self.url)
+        nodes = self.cluster_nodes or [
+            (options.get("host", "localhost"), options.get("port", 6379))]
+        # В кластере есть только база 0.
+        return TimedRedisCluster(
+            startup_nodes=[ClusterNode(host, port) for host, port in nodes],
+            max_connections=self.max_connections,
+            socket_timeout=self.socket_timeout,
+            **self._credentials("username", "password"))
+
+    def _connect_sentinel(self) -> TimedRedis:
+        self._sentinel = Sentinel(
+            self.sentinels, socket_timeout=self.socket_timeout,
+            sentinel_kwargs={"socket_timeout": self.socket_timeout})
+        client = self._sentinel.master_for(
+            self.service_name,
+            redis_class=TimedRedis,
+            connection_pool_class=SentinelBlockingPool,
+            max_connections=self.max_connections,
+            timeout=self.pool_timeout,
+            parser_class=(HiredisParser if HIREDIS_AVAILABLE
+                          else PythonParser),
+            **self._credentials("username", "password", "db"))
+        self._pool = client.connection_pool
+        return client
+
+    async def close(self) -> None:
+        """Закрытие клиента и всех соединений пула."""
+        if self._client is not None:
+            await self._client.close()
+        if self._pool is not None:
+            await self._pool.disconnect()
+        if self._sentinel is not None:
+            for sentinel in self._sentinel.sentinels:
+                await sentinel.close()
+        self._client = None
+        self._pool = None
+        self._sentinel = None
+
+    @property
+    def client(self) -> aioredis.Redis:
+        """Клиент Redis, работающий поверх общего пула."""
+        if self._client is None:
+            raise RuntimeError("SessionStore не подключён, "
+                               "вызовите connect() в lifespan")
+        return self._client
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self.client.get(key)
+
+    async def set(self, key: str, value: Union[str, bytes]) -> None:
+        await self.client.set(key, value)
+
+    async def setex(self, key: str, ttl: Union[int, timedelta],
+                    value: Union[str, bytes]) -> None:
+        await self.client.setex(key, ttl, value)
+
+    async def exists(self, key: str) -> bool:
+        return bool(await self.client.exists(key))
+
+    async def delete(self, *keys: str) -> int:
+        return await self.client.delete(*keys)
+
+    @staticmethod
+    def session_key(login: str, session_id: str) -> str:
+        """Ключ сессии: хеш-тег пользователя и id сессии."""
+        return f"session:{user_tag(login)}:{session_id}"
+
+    @staticmethod
+    def index_key(login: str) -> str:
+        """ZSET id сессий пользователя с моментом истечения в score."""
+        return f"sessions:{user_tag(login)}"
+
+    async def open_session(self, login: str, token: str, jti: str,
+                           expires_at: int) -> None:
+        """
+        Сессия до expires_at (unix time) и её запись в индексе.
+
+        id сессии - sha256 токена (token_key), в ключе сессии хранится
+        jti. Ключ и индекс пишутся одной транзакцией, истёкшие записи
+        индекса удаляются тут же. Индекс живёт до истечения последней
+        сессии: время жизни у всех токенов одинаковое.
+        """
+        session_id = token_key(token)
+        index = self.index_key(login)
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.set(self.session_key(login, session_id), jti,
+                     exat=expires_at)
+            pipe.zremrangebyscore(index, "-inf", int(time.time()))
+            pipe.zadd(index, {session_id: expires_at})
+            pipe.expireat(index, expires_at)
+            await pipe.execute()
+
+    async def has_session(self, login: str, token: str) -> bool:
+        return await self.exists(self.session_key(login, token_key(token)))
+
+    async def close_session(self, login: str, token: str) -> bool:
+        """Удаление сессии и её записи в индексе, True если она была."""
+        session_id = token_key(token)
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.delete(self.session_key(login, session_id))
+            pipe.zrem(self.index_key(login), session_id)
+            deleted, _ = await pipe.execute()
+        return bool(deleted)
+
+    async def list_sessions(self, login: str, cursor: Optional[str] = None,
+                            limit: int = 20
+                            ) -> Tuple[List[Tuple[str, int]], Optional[str]]:
+        """
+        Страница активных сессий в порядке истечения.
+
+        Args:
+
+            login: Пользователь.
+            cursor: next_cursor предыдущей страницы ("<score>:<id>").
+            limit: Сессий на странице.
+
+        Returns:
+
+            tuple: [(id, expires_at), ...] и курсор следующей страницы
+            или None. Если сессия из курсора уже удалена, следующая
+            страница продолжается по её времени истечения.
+        """
+        index = self.index_key(login)
+        after, _, after_id = (cursor or "").partition(":")
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.zremrangebyscore(index, "-inf", int(time.time()))
+            pipe.zrank(index, after_id)
+            _, rank = await pipe.execute()
+        if not after_id:
+            rank = -1
+        if rank is not None:
+            page = await self.client.zrange(index, rank + 1, rank + limit + 1,
+                                            withscores=True)
+        else:
+            page = await self.client.zrangebyscore(
+                index, f"({int(after or 0)}", "+inf", start=0,
+                num=limit + 1, withscores=True)
+        sessions = [(session_id.decode(), int(score))
+                    for session_id, score in page]
+        if len(sessions) <= limit:
+            return sessions, None
+        sessions = sessions[:limit]
+        return sessions, f"{sessions[-1][1]}:{sessions[-1][0]}"
 
+    async def revoke_all(self, login: str) -> List[Tuple[str, str, int]]:
+        """
+        Удаление всех сессий пользователя.
 
-redis_client = aioredis.from_url(REDIS_URL)
+        Индекс читается одним запросом, ключи сессий и их записи
+        в индексе удаляются одной транзакцией (все ключи в слоте
+        пользователя). Сессия, открытая между этими вызовами, остаётся.
 
+        Returns:
 
-@cache()
-async def get_cache():
-    return 1
+            list: (id, jti, expires_at) удалённых сессий.
+        """
+        index = self.index_key(login)
+        entries = await self.client.zrange(index, 0, -1, withscores=True)
+        if not entries:
+            return []
+        ids = [session_id.decode() for session_id, _ in entries]
+        async with self.client.pipeline(transaction=True) as pipe:
+            for session_id in ids:
+                pipe.get(self.session_key(login, session_id))
+            pipe.delete(*(self.session_key(login, session_id)
+                          for session_id in ids))
+            pipe.zrem(index, *ids)
+            results = await pipe.execute()
+        return [(session_id, jti.decode(), int(score))
+                for session_id, jti, (_, score)
+                in zip(ids, results, entries) if jti is not None]
 
 
-@asynccontextmanager
-async def lifespan(_: FastAPI) -> AsyncIterator[None]:
-    redis = aioredis.from_url(REDIS_URL)
-    FastAPICache.init(RedisBackend(redis), prefix="fastapi-cache")
-    yield
+session_store = SessionStore(REDIS_URL,
+                             max_connections=REDIS_MAX_CONNECTIONS,
+                             pool_timeout=REDIS_POOL_TIMEOUT,
+                             socket_timeout=REDIS_SOCKET_TIMEOUT,
+                             mode=REDIS_MODE,
+                             sentinels=REDIS_SENTINELS,
+                             service_name=REDIS_SENTINEL_MASTER,
+                             cluster_nodes=REDIS_CLUSTER_NODES)
@@ -0,0 +1,147 @@
+"""
+Долгоживущие допуски запомненного пользователя (memorize_user):
+refresh токены и доверенные устройства.
+"""
+
+import hashlib
+import re
+import secrets
+from typing import Optional, Tuple
+
+from config import REFRESH_TOKEN_TTL_DAYS, TRUSTED_DEVICE_TTL_DAYS
+from redis_tools.redis_tools import SessionStore, session_store, user_tag
+
+
+GRANT_ID = re.compile(r"^[0-9a-f]{32}$")
+
+
+class GrantReused(Exception):
+    """Предъявлен уже заменённый секрет допуска."""
+
+    def __init__(self, login: str) -> None:
+        super().__init__(login)
+        self.login = login
+
+
+def _field(secret: str) -> str:
+    return "s:" + hashlib.sha256(secret.encode()).hexdigest()
+
+
+class GrantStore:
+    """
+    Допуски вида "<id>.<секрет>" со скользящим временем жизни ttl.
+
+    Допуск - хеш <prefix>:{<id>} с полем login и полем s:<sha256
+    секрета>, сам секрет в Redis не хранится. Проверка и смена
+    секрета - команды над одним ключом, без скриптов и транзакций,
+    поэтому работают и в Redis Cluster. id допусков пользователя
+    собраны в множестве <prefix>s:{<пользователь>} для отзыва
+    на всех устройствах.
+
+    rotate() заменяет секрет новым (refresh токены): старый секрет
+    удаляется HDEL, и повторное предъявление уже заменённого
+    секрета означает, что токен украден, - допуск удаляется целиком.
+    """
+
+    def __init__(self, store: SessionStore, prefix: str, ttl: int) -> None:
+        self.store = store
+        self.prefix = prefix
+        self.ttl = ttl
+
+    def key(self, grant_id: str) -> str:
+        return f"{self.prefix}:{{{grant_id}}}"
+
+    def index_key(self, login: str) -> str:
+        return f"{self.prefix}s:{user_tag(login)}"
+
+    @staticmethod
+    def parse(token: str) -> Tuple[Optional[str], str]:
+        """id и секрет допуска, id равен None у чужой строки."""
+        grant_id, _, secret = token.partition(".")
+        if not secret or not GRANT_ID.match(grant_id):
+            return None, ""
+        return grant_id, secret
+
+    async def issue(self, login: str) -> str:
+        """Новый допуск пользователя login."""
+        grant_id, secret = secrets.token_hex(16), secrets.token_urlsafe(32)
+        key, index = self.key(grant_id), self.index_key(login)
+        async with self.store.client.pipeline(transaction=False) as pipe:
+            pipe.hset(key, mapping={"login": login, _field(secret): 1})
+            pipe.expire(key, self.ttl)
+            pipe.sadd(index, grant_id)
+            pipe.expire(index, self.ttl)
+            await pipe.execute()
+        return f"{grant_id}.{secret}"
+
+    async def check(self, token: str) -> Optional[str]:
+        """Пользователь действующего допуска или None."""
+        grant_id, secret = self.parse(token)
+        if grant_id is None:
+            return None
+        login, valid = await self.store.client.hmget(
+            self.key(grant_id), "login", _field(secret))
+        return login.decode() if login and valid else None
+
+    async def rotate(self, token: str) -> Optional[Tuple[str, str]]:
+        """
+        Замена секрета допуска новым.
+
+        Returns:
+
+            tuple: Пользователь и новый токен допуска или None, если
+            допуск не найден или истёк.
+
+        Raises:
+
+            GrantReused: Секрет уже был заменён, допуск удалён.
+        """
+        grant_id, secret = self.parse(token)
+        if grant_id is None:
+            return None
+        key = self.key(grant_id)
+        async with self.store.client.pipeline(transaction=True) as pipe:
+            pipe.hdel(key, _field(secret))
+            pipe.hget(key, "login")
+            removed, login = await pipe.execute()
+        if login is None:
+            return None
+        login = login.decode()
+        if not removed:
+            await self.store.client.delete(key)
+            raise GrantReused(login)
+        secret = secrets.token_urlsafe(32)
+        # Если допуск удалили между командами, ключ без login
+        # не пройдёт проверку и истечёт через ttl.
+        async with self.store.client.pipeline(transaction=False) as pipe:
+            pipe.hset(key, _field(secret), 1)
+            pipe.expire(key, self.ttl)
+            pipe.expire(self.index_key(login), self.ttl)
+            await pipe.execute()
+        return login, f"{grant_id}.{secret}"
+
+    async def revoke(self, token: str) -> bool:
+        """Удаление одного допуска, True если он был."""
+        grant_id, _ = self.parse(token)
+        if grant_id is None:
+            return False
+        return bool(await self.store.client.delete(self.key(grant_id)))
+
+    async def revoke_user(self, login: str) -> int:
+        """Удаление всех допусков пользователя, возвращает их число."""
+        index = self.index_key(login)
+        grant_ids = await self.store.client.smembers(index)
+        if not grant_ids:
+            return 0
+        async with self.store.client.pipeline(transaction=False) as pipe:
+            for grant_id in grant_ids:
+                pipe.delete(self.key(grant_id.decode()))
+            pipe.delete(index)
+            results = await pipe.execute()
+        return sum(results[:-1])
+
+
+refresh_tokens = GrantStore(session_store, "refresh",
+                            REFRESH_TOKEN_TTL_DAYS * 86400)
+trusted_devices = GrantStore(session_store, "device",
+                             TRUSTED_DEVICE_TTL_DAYS * 86400)
@@ -0,0 +1,133 @@
+"""Список отозванных токенов для проверки без обращения к Redis."""
+
+import asyncio
+import time
+from typing import Iterable, Optional, Tuple
+
+from redis import asyncio as aioredis
+
+from config import (REVOCATION_FILTER_CAPACITY, REVOCATION_FILTER_ERROR_RATE,
+                    REVOCATION_REBUILD_INTERVAL, REVOCATION_STREAM,
+                    REVOCATION_STREAM_MAXLEN)
+from redis_tools.bloom import BloomFilter
+
+
+class RevocationList:
+    """
+    Реплика отозванных jti в фильтре Блума.
+
+    Отзыв записывается в Redis дважды: точный ключ revoked:<jti>
+    с истечением в момент exp токена и запись в поток stream, из
+    которого каждый процесс пополняет свой фильтр. Проверка токена
+    идёт по фильтру в памяти, точный запрос в Redis нужен только при
+    попадании в фильтр. Фильтр периодически пересобирается из потока,
+    чтобы в нём не оставались jti уже истёкших токенов.
+
+    maxlen потока должен превышать число отзывов за время жизни
+    токена, иначе обрезанные записи выпадут из фильтра при пересборке.
+    """
+
+    def __init__(self, stream: str, maxlen: int, capacity: int,
+                 error_rate: float, rebuild_interval: float) -> None:
+        self.stream = stream
+        self.maxlen = maxlen
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.rebuild_interval = rebuild_interval
+        self.filter = BloomFilter(capacity, error_rate)
+        self.exact_checks = 0
+        self._last_id = "0-0"
+        self._task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def _key(jti: str) -> str:
+        return f"revoked:{jti}"
+
+    async def revoke(self, client: aioredis.Redis, jti: str,
+                     exp: int) -> None:
+        """Отзыв токена до момента его истечения exp (unix time)."""
+        await self.revoke_many(client, [(jti, exp)])
+
+    async def revoke_many(self, client: aioredis.Redis,
+                          tokens: Iterable[Tuple[str, int]]) -> None:
+        """Отзыв нескольких токенов (jti, exp) одним конвейером."""
+        now = time.time()
+        tokens = [(jti, int(exp)) for jti, exp in tokens if exp > now]
+        if not tokens:
+            return
+        async with client.pipeline(transaction=False) as pipe:
+            for jti, exp in tokens:
+                pipe.set(self._key(jti), 1, exat=exp)
+                pipe.xadd(self.stream, {"jti": jti, "exp": exp},
+                          maxlen=self.maxlen, approximate=True)
+            await pipe.execute()
+        for jti, _ in tokens:
+            self.filter.add(jti)
+
+    async def is_revoked(self, client: aioredis.Redis, jti: str) -> bool:
+        if jti not in self.filter:
+            return False
+        self.exact_checks += 1
+        return bool(await client.exists(self._key(jti)))
+
+    def _apply(self, bloom: BloomFilter, entries) -> None:
+        now = time.time()
+        for entry_id, fields in entries:
+            self._last_id = entry_id
+            if int(fields[b"exp"]) > now:
+                bloom.add(fields[b"jti"].decode())
+
+    async def rebuild(self, client: aioredis.Redis) -> None:
+        """Полная пересборка фильтра по содержимому потока."""
+        bloom = BloomFilter(self.capacity, self.error_rate)
+        start = "-"
+        while True:
+            entries = await client.xrange(self.stream, min=start,
+                                          count=1000)
+            self._apply(bloom, entries)
+            if len(entries) < 1000:
+                break
+            start = "(" + entries[-1][0].decode()
+        self.filter = bloom
+
+    async def _follow(self, client: aioredis.Redis) -> None:
+        rebuilt_at = time.monotonic()
+        while True:
+            try:
+                if (time.monotonic() - rebuilt_at > self.rebuild_interval
+                        or self.filter.saturated):
+                    await self.rebuild(client)
+                    rebuilt_at = time.monotonic()
+                response = await client.xread({self.stream: self._last_id},
+                                              count=1000, block=1000)
+                for _, entries in response:
+                    self._apply(self.filter, entries)
+            except asyncio.CancelledError:
+                raise
+            except Exception as ex:
+                print(f"Revocation stream error: {ex}")
+                await asyncio.sleep(1)
+
+    async def start(self, client: aioredis.Redis) -> None:
+        """Начальная загрузка фильтра и чтение новых отзывов."""
+        if self._task is None:
+            await self.rebuild(client)
+            self._task = asyncio.create_task(self._follow(client))
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self) -> dict:
+        return {"filter_items": self.filter.count,
+                "filter_bits": self.filter.size,
+                "exact_checks": self.exact_checks}
+
+
+revocations = RevocationList(REVOCATION_STREAM,
+                             maxlen=REVOCATION_STREAM_MAXLEN,
+                             capacity=REVOCATION_FILTER_CAPACITY,
+                             error_rate=REVOCATION_FILTER_ERROR_RATE,
+                             rebuild_interval=REVOCATION_REBUILD_INTERVAL)
@@ -0,0 +1,109 @@
+"""Кеш проверенных токенов в памяти воркера."""
+
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from typing import List, Optional
+
+from redis import asyncio as aioredis
+
+from config import TOKEN_CACHE_CHANNEL, TOKEN_CACHE_SIZE, TOKEN_CACHE_TTL
+from metrics.metrics import TOKEN_CACHE_LOOKUPS, Children
+
+
+_lookups = Children(TOKEN_CACHE_LOOKUPS)
+
+
+def token_key(token: str) -> str:
+    """Ключ кеша: sha256 токена, сам токен в памяти не хранится."""
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+class TokenCache:
+    """
+    Ограниченный LRU кеш декодированных claims токенов.
+
+    Запись живёт до более раннего из exp токена и ttl секунд.
+    Отзыв токена (logout) публикуется в канал Redis, и все воркеры
+    удаляют запись из своих кешей. При потере подписки кеш
+    очищается целиком, чтобы не пропустить отзывы. Попадания
+    и промахи считает метрика token_cache_lookups_total.
+    """
+
+    def __init__(self, max_size: int, ttl: float, channel: str) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self.channel = channel
+        self._entries: OrderedDict = OrderedDict()
+        self._task: Optional[asyncio.Task] = None
+
+    def get(self, token: str) -> Optional[dict]:
+        key = token_key(token)
+        entry = self._entries.get(key)
+        if entry is None or entry[1] <= time.time():
+            if entry is not None:
+                del self._entries[key]
+            _lookups["miss"].inc()
+            return None
+        self._entries.move_to_end(key)
+        _lookups["hit"].inc()
+        return entry[0]
+
+    def put(self, token: str, claims: dict) -> None:
+        expires_at = time.time() + self.ttl
+        if "exp" in claims:
+            expires_at = min(expires_at, float(claims["exp"]))
+        self._entries[token_key(token)] = (claims, expires_at)
+        self._entries.move_to_end(token_key(token))
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def evict(self, key: str) -> None:
+        self._entries.pop(key, None)
+
+    async def revoke(self, client: aioredis.Redis, token: str) -> None:
+        """Удаление токена из кешей всех воркеров."""
+        await self.revoke_keys(client, [token_key(token)])
+
+    async def revoke_keys(self, client: aioredis.Redis,
+                          keys: List[str]) -> None:
+        """Удаление записей по ключам token_key одним сообщением."""
+        for key in keys:
+            self.evict(key)
+        await client.publish(self.channel, ",".join(keys))
+
+    async def _listen(self, client: aioredis.Redis) -> None:
+        while True:
+            pubsub = client.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(self.channel)
+                while True:
+                    message = await pubsub.get_message(timeout=1.0)
+                    if message is not None:
+                        for key in message["data"].decode().split(","):
+                            self.evict(key)
+            except asyncio.CancelledError:
+                raise
+            except Exception as ex:
+                print(f"Token cache subscription error: {ex}")
+                self._entries.clear()
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.close()
+
+    def start(self, client: aioredis.Redis) -> None:
+        """Запуск подписки на отзывы токенов."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._listen(client))
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        self._entries.clear()
+
+
+token_cache = TokenCache(TOKEN_CACHE_SIZE, ttl=TOKEN_CACHE_TTL,
+                         channel=TOKEN_CACHE_CHANNEL)
@@ -0,0 +1,137 @@
+"""
+Production запуск сервиса.
+
+    python serve.py                  # gunicorn с воркерами uvicorn
+    python serve.py --workers 4
+    python serve.py create-tables    # создание таблиц, отдельно от запуска
+
+Воркеров по умолчанию столько, сколько CPU (WEB_CONCURRENCY),
+event loop - uvloop, разбор HTTP - httptools, если они установлены.
+Приложение импортируется один раз в мастер-процессе (preload),
+воркеры получают его через fork и делят память copy-on-write.
+Воркер плавно перезапускается после SERVE_MAX_REQUESTS запросов
+со случайным разбросом SERVE_MAX_REQUESTS_JITTER, текущие запросы
+дорабатываются в пределах SERVE_GRACEFUL_TIMEOUT секунд.
+
+Для разработки с перезагрузкой по изменению файлов: python main.py.
+"""
+
+import argparse
+import asyncio
+import glob
+import os
+import shutil
+import tempfile
+
+from dotenv import load_dotenv
+from gunicorn.app.base import BaseApplication
+from uvicorn.workers import UvicornWorker
+
+
+class Worker(UvicornWorker):
+    """Воркер uvicorn: uvloop и httptools при наличии, lifespan обязателен."""
+
+    CONFIG_KWARGS = {"loop": "auto", "http": "auto", "lifespan": "on"}
+
+
+class Server(BaseApplication):
+    """gunicorn с настройками из словаря вместо файла конфигурации."""
+
+    def __init__(self, options: dict) -> None:
+        self.options = options
+        super().__init__()
+
+    def load_config(self) -> None:
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        from main import app
+        return app
+
+
+def prepare_environment() -> bool:
+    """
+    Окружение, зависящее от числа воркеров, до импорта config.
+
+    Пул хеширования паролей создаётся в каждом воркере, поэтому CPU
+    делятся между ними (если HASH_WORKERS не задан). Для сбора метрик
+    со всех воркеров нужен каталог PROMETHEUS_MULTIPROC_DIR: если он
+    не задан, создаётся временный.
+
+    Returns:
+
+        bool: True, если каталог метрик создан здесь и его нужно
+        удалить при остановке.
+    """
+    load_dotenv()
+    cpus = os.cpu_count() or 1
+    workers = int(os.environ.get("WEB_CONCURRENCY") or cpus)
+    os.environ["WEB_CONCURRENCY"] = str(workers)
+    os.environ.setdefault("HASH_WORKERS", str(max(1, cpus // workers)))
+    metrics_dir = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if metrics_dir:
+        # Файлы прошлого запуска исказили бы счётчики.
+        for path in glob.glob(os.path.join(metrics_dir, "*.db")):
+            os.remove(path)
+        return False
+    if workers > 1:
+        os.environ["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp(
+            prefix="auth-metrics-")
+        return True
+    return False
+
+
+def serve() -> None:
+    temporary_metrics_dir = prepare_environment()
+
+    from config import (SERVE_BIND, SERVE_GRACEFUL_TIMEOUT, SERVE_KEEPALIVE,
+                        SERVE_MAX_REQUESTS, SERVE_MAX_REQUESTS_JITTER,
+                        SERVE_TIMEOUT, WEB_CONCURRENCY)
+    from metrics.metrics import mark_process_dead
+
+    def child_exit(server, worker) -> None:
+        mark_process_dead(worker.pid)
+
+    def on_exit(server) -> None:
+        if temporary_metrics_dir:
+            shutil.rmtree(os.environ["PROMETHEUS_MULTIPROC_DIR"],
+                          ignore_errors=True)
+
+    Server({
+        "bind": SERVE_BIND,
+        "workers": WEB_CONCURRENCY,
+        "worker_class": "serve.Worker",
+        "preload_app": True,
+        "max_requests": SERVE_MAX_REQUESTS,
+        "max_requests_jitter": SERVE_MAX_REQUESTS_JITTER,
+        "timeout": SERVE_TIMEOUT,
+        "graceful_timeout": SERVE_GRACEFUL_TIMEOUT,
+        "keepalive": SERVE_KEEPALIVE,
+        "child_exit": child_exit,
+        "on_exit": on_exit,
+    }).run()
+
+
+def create_tables() -> None:
+    from database.FDataBase import create_tables as create
+    asyncio.run(create())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("command", nargs="?", default="serve",
+                        choices=["serve", "create-tables"])
+    parser.add_argument("--workers", type=int,
+                        help="число воркеров вместо WEB_CONCURRENCY")
+    args = parser.parse_args()
+    if args.command == "create-tables":
+        create_tables()
+        return
+    if args.workers:
+        os.environ["WEB_CONCURRENCY"] = str(args.workers)
+    serve()
+
+
+if __name__ == "__main__":
+    main()